@@ -0,0 +1,37 @@
+import pytest
+
+from benchmarks.workloads import scaled_application
+from spark_logs.anomaly_detection.dataset_extractor import JobGroupedExtractor
+from spark_logs.anomaly_detection.features import (
+    StageRunTimeFeature,
+    StageShuffleReadFeature,
+)
+from spark_logs.types import ApplicationMetrics
+
+
+@pytest.fixture(
+    scope="module",
+    params=[(50, 200), (200, 200), (50, 2000)],
+    ids=lambda p: f"{p[0]}jobs-x{p[1]}",
+)
+def jobs(request):
+    num_jobs, tasks_per_stage = request.param
+    app = ApplicationMetrics.create_from_dict(
+        scaled_application(
+            jobs=num_jobs, stages_per_job=4, tasks_per_stage=tasks_per_stage, num_task_groups=3
+        )
+    )
+    return list(app.jobs_stages.values())
+
+
+def extract(jobs):
+    # Extractor caches groups, so every round needs a new one
+    extractor = JobGroupedExtractor(
+        jobs, features=[StageRunTimeFeature(), StageShuffleReadFeature()]
+    )
+    return extractor.extract()
+
+
+def test_extract(measure, jobs):
+    result = measure(extract, jobs)
+    assert sum(len(group) for group in result.values()) == len(jobs)
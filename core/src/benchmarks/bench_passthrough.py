@@ -0,0 +1,48 @@
+"""Completed job from Spark REST responses to stored bytes, parsed or passed through"""
+import json
+
+import orjson
+import pytest
+
+from benchmarks.harness.workload import SyntheticWorkload
+from spark_logs.loaders.parsers import StageExtendedParser, StagePassthroughParser
+from spark_logs.types import Job, JobStages, RawJobStages
+
+
+@pytest.fixture(
+    scope="module",
+    params=[(4, 200), (4, 2000), (10, 5000)],
+    ids=lambda p: f"{p[0]}x{p[1]}",
+)
+def responses(request):
+    stages_per_job, tasks_per_stage = request.param
+    workload = SyntheticWorkload(
+        stages_per_job=stages_per_job, tasks_per_stage=tasks_per_stage
+    )
+    workload.advance(60)
+    app_id = workload.app_ids[0]
+    job = Job.create_from_dict(workload.job(app_id, 0))
+    stages = [orjson.dumps(workload.stage(app_id, stage_id)) for stage_id in job.stageIds]
+    return job, stages
+
+
+def parsed(job, stages):
+    parser = StageExtendedParser()
+    # aiohttp decodes responses with the stdlib json
+    stage_tasks = [parser.execute(json.loads(body)) for body in stages]
+    return JobStages(job=job, stages={s.stage.stageId: s for s in stage_tasks}).dump()
+
+
+def passthrough(job, stages):
+    parser = StagePassthroughParser()
+    raw = [parser.execute(body) for body in stages]
+    return RawJobStages(job, {s.stage.stageId: s for s in raw}).dump()
+
+
+def test_job_parsed(measure, responses):
+    measure(parsed, *responses)
+
+
+def test_job_passthrough(measure, responses):
+    payload = measure(passthrough, *responses)
+    assert payload == parsed(*responses)
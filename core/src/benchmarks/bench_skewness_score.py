@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from benchmarks.workloads import scaled_stage, load_sample
+from spark_logs.hybrid_metrics.skewness_score import SkewDetectStrategy
+from spark_logs.types import StageTasks, JobStages, Task, Job
+
+
+def make_stage(stage_id, num_tasks, rnd):
+    tasks = {
+        str(task_id): Task(
+            taskId=task_id,
+            index=task_id,
+            attempt=0,
+            executorId=str(task_id % 50),
+            host="host.com",
+            status="SUCCESS",
+            duration=int(rnd.lognormvariate(7, 0.5)),
+            taskLocality="PROCESS_LOCAL",
+            speculative=False,
+        )
+        for task_id in range(num_tasks)
+    }
+    stage = {
+        "status": "COMPLETE",
+        "stageId": stage_id,
+        "attemptId": 0,
+        "numTasks": num_tasks,
+        "numActiveTasks": 0,
+        "numCompleteTasks": num_tasks,
+        "numFailedTasks": 0,
+        "numKilledTasks": 0,
+        "numCompletedIndices": num_tasks,
+        "executorRunTime": 0,
+        "executorCpuTime": 0,
+        "inputBytes": 0,
+        "inputRecords": 0,
+        "outputBytes": 0,
+        "outputRecords": 0,
+        "shuffleReadBytes": 0,
+        "shuffleReadRecords": 0,
+        "shuffleWriteBytes": 0,
+        "shuffleWriteRecords": 0,
+        "memoryBytesSpilled": 0,
+        "diskBytesSpilled": 0,
+        "name": f"stage {stage_id}",
+    }
+    return StageTasks(stage=stage, tasks=tasks)
+
+
+@pytest.fixture(
+    scope="module",
+    params=[(1, 10_000), (4, 10_000), (2, 50_000)],
+    ids=lambda p: f"{p[0]}x{p[1]}",
+)
+def job(request):
+    num_stages, tasks_per_stage = request.param
+    rnd = random.Random(42)
+    return JobStages(
+        job=Job(
+            jobId=1,
+            name="benchmark",
+            submissionTime="2021-05-05T09:55:01.071GMT",
+            completionTime="2021-05-05T09:56:32.601GMT",
+            stageIds=list(range(num_stages)),
+            status="SUCCEEDED",
+        ),
+        stages={
+            str(i): make_stage(i, tasks_per_stage, rnd) for i in range(num_stages)
+        },
+    )
+
+
+@pytest.mark.parametrize("score", sorted(SkewDetectStrategy.scores))
+def test_apply_job(benchmark, job, score):
+    strategy = SkewDetectStrategy(score=score)
+    result = benchmark(strategy.apply_job, job)
+    assert set(result.keys()) == set(job.stages.keys())
+
+
+@pytest.mark.parametrize("score", sorted(SkewDetectStrategy.scores))
+def test_skew_test_columns(benchmark, job, score):
+    strategy = SkewDetectStrategy(score=score)
+    values, lengths = strategy.get_stage_metric_columns(
+        list(job.stages.values()), "duration"
+    )
+    benchmark(strategy.skew_test, values, lengths)
+
+
+@pytest.mark.parametrize("num_tasks", [200, 10_000])
+def test_apply_sample_stage(measure, num_tasks):
+    stage = StageTasks.create_from_dict(
+        scaled_stage(load_sample(), 1, num_tasks, random.Random(42))
+    )
+    measure(SkewDetectStrategy().apply, stage)
@@ -0,0 +1,12 @@
+import pytest
+
+from benchmarks.workloads import graphite_series
+from spark_logs.time_series_tools import interpolate
+
+
+@pytest.mark.parametrize("gap_ratio", [0.05, 0.5])
+@pytest.mark.parametrize("points", [360, 8640])
+def test_interpolate(measure, points, gap_ratio):
+    series = graphite_series(points, gap_ratio)
+    result = measure(interpolate, series)
+    assert len(result) == points
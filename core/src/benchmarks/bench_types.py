@@ -0,0 +1,50 @@
+import random
+
+import orjson
+import pytest
+
+from benchmarks.workloads import scaled_application, scaled_job, load_sample
+from spark_logs.types import ApplicationMetrics, JobStages
+
+
+@pytest.fixture(
+    scope="module",
+    params=[(4, 200), (4, 2000), (10, 5000)],
+    ids=lambda p: f"{p[0]}x{p[1]}",
+)
+def job_dict(request):
+    stages_per_job, tasks_per_stage = request.param
+    return scaled_job(
+        load_sample(), 1, stages_per_job, tasks_per_stage, random.Random(42)
+    )
+
+
+@pytest.fixture(scope="module")
+def job_payload(job_dict):
+    return orjson.dumps(job_dict)
+
+
+@pytest.fixture(scope="module")
+def job_stages(job_dict):
+    return JobStages.create_from_dict(job_dict)
+
+
+def test_job_create_from_dict(measure, job_dict):
+    result = measure(JobStages.create_from_dict, job_dict)
+    assert len(result.stages) == len(job_dict["stages"])
+
+
+def test_job_from_json(measure, job_payload):
+    measure(JobStages.from_json, job_payload)
+
+
+def test_job_dump(measure, job_stages):
+    payload = measure(job_stages.dump)
+    assert JobStages.from_json(payload) == job_stages
+
+
+@pytest.mark.parametrize("jobs", [10, 50])
+def test_application_create_from_dict(measure, jobs):
+    app = scaled_application(jobs=jobs, stages_per_job=4, tasks_per_stage=200)
+    result = measure(ApplicationMetrics.create_from_dict, app)
+    assert len(result.jobs_stages) == jobs
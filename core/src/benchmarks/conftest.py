@@ -0,0 +1,24 @@
+import tracemalloc
+
+import pytest
+
+
+@pytest.fixture
+def measure(benchmark):
+    """Benchmarks a call and stores its peak allocations in extra_info.
+
+    Peak is measured by a separate traced call, so tracemalloc overhead does
+    not affect timings.
+    """
+
+    def run(func, *args, **kwargs):
+        tracemalloc.start()
+        try:
+            func(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_alloc_bytes"] = peak
+        return benchmark(func, *args, **kwargs)
+
+    return run
@@ -0,0 +1,237 @@
+"""Offline end-to-end benchmark of the loader and processors.
+
+    python -m benchmarks.harness --apps 4 --tasks-per-stage 2000 --output result.json
+
+Spark REST API is served by a local fixture server in a separate process,
+results go to a JSON document so runs can be compared over time.
+"""
+import asyncio
+import multiprocessing
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Dict, Any
+
+import aiohttp
+import aioredis
+import click
+import orjson
+
+from benchmarks.harness import fixture_server
+from benchmarks.harness.sinks import CountingRedis, CountingGraphite, RedisStats
+from benchmarks.harness.workload import SyntheticWorkload, RecordedWorkload
+from spark_logs.hybrid_metrics.engine import HybridMetricsEngine
+from spark_logs.hybrid_metrics.skewness_score import SkewDetectStrategy
+from spark_logs.loaders.application_loader import ApplicationLoader
+from spark_logs.loaders.clients import MetricsClient
+from spark_logs.tracing import EXPORTER
+
+
+def summary(samples: List[float]) -> Dict[str, Any]:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean": statistics.mean(samples),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+async def timed(coro) -> float:
+    started = time.perf_counter()
+    await coro
+    return time.perf_counter() - started
+
+
+async def wait_for_server(session: aiohttp.ClientSession, base_url, attempts=100):
+    for _ in range(attempts):
+        try:
+            async with session.get(f"{base_url}/_harness/stats") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientConnectionError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"Fixture server at {base_url} did not start")
+
+
+async def bench_loaders(session, base_url, workload, redis, graphite, options):
+    metrics_client = MetricsClient(
+        inactive_jobs_only=True,
+        config={"base_url": base_url, "fetch_interval": options["fetch_interval"]},
+    )
+    loaders = []
+    for app_id in workload.app_ids:
+        loader = ApplicationLoader(metrics_client, app_id, fetch_last_jobs=options["fetch_last_jobs"])
+        loader.redis = redis
+        loader.graphite = graphite
+        loader.stored_job_ids = await loader.load_stored_jobs()
+        await loader.store_configuration_info()
+        loaders.append(loader)
+
+    round_latency, app_round_latency = [], []
+    for _ in range(options["rounds"]):
+        await session.post(
+            f"{base_url}/_harness/advance", params={"seconds": options["round_interval"]}
+        )
+        started = time.perf_counter()
+        app_round_latency.extend(
+            await asyncio.gather(*[timed(loader.update_app_metrics()) for loader in loaders])
+        )
+        round_latency.append(time.perf_counter() - started)
+    slowest = EXPORTER.slowest(1, name="loader.round")
+    return {
+        "round_latency": summary(round_latency),
+        "app_round_latency": summary(app_round_latency),
+        "slowest_app_round": slowest[0].breakdown() if slowest else None,
+    }
+
+
+async def bench_processors(app_ids, redis, options):
+    # Imported here as it pulls keras in
+    from spark_logs.anomaly_detection.dataset_extractor import JobGroupedExtractor
+    from spark_logs.anomaly_detection.detectors import AutoencoderDetector
+    from spark_logs.anomaly_detection.processor import (
+        SequentialFeatureBypass,
+        SequentialDetector,
+    )
+
+    graphite = CountingGraphite()
+    iteration_time = {"feature_bypass": [], "anomaly_detection": []}
+    for app_id in app_ids:
+        bypass = SequentialFeatureBypass(app_id, JobGroupedExtractor, timeout=0)
+        detector = SequentialDetector(
+            app_id, JobGroupedExtractor, detector_cls=AutoencoderDetector
+        )
+        for processor in (bypass, detector):
+            processor._graphite_client = graphite
+            for _ in range(options["processor_iterations"]):
+                iteration_time[processor.processor_id].append(
+                    await timed(processor.process_iteration(redis))
+                )
+    return {
+        "iteration_time": {k: summary(v) for k, v in iteration_time.items()},
+        "graphite": graphite.report(),
+    }
+
+
+async def bench_hybrid_metrics(app_ids, redis, options):
+    graphite = CountingGraphite()
+    batch_time = []
+    for app_id in app_ids:
+        engine = HybridMetricsEngine(app_id, {"skewness_score": SkewDetectStrategy()})
+        for _ in range(options["processor_iterations"]):
+            batch_time.append(await timed(engine.apply_batch(redis, graphite)))
+    return {"batch_time": summary(batch_time), "graphite": graphite.report()}
+
+
+async def run_benchmark(workload: SyntheticWorkload, options) -> Dict[str, Any]:
+    base_url = f"http://localhost:{options['port']}"
+    server = multiprocessing.Process(
+        target=fixture_server.serve, args=(workload, options["port"]), daemon=True
+    )
+    server.start()
+    redis_pool = await aioredis.create_redis_pool(options["redis_url"])
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_for_server(session, base_url)
+            await redis_pool.flushdb()
+
+            loader_stats, loader_graphite = RedisStats(), CountingGraphite()
+            result = {
+                "loader": await bench_loaders(
+                    session,
+                    base_url,
+                    workload,
+                    CountingRedis(redis_pool, loader_stats),
+                    loader_graphite,
+                    options,
+                )
+            }
+            result["loader"]["redis"] = loader_stats.report()
+            result["loader"]["graphite"] = loader_graphite.report()
+
+            # Processors assign job groups which hybrid metrics rely on
+            if options["processors"]:
+                processor_stats = RedisStats()
+                result["processors"] = await bench_processors(
+                    workload.app_ids, CountingRedis(redis_pool, processor_stats), options
+                )
+                result["processors"]["redis"] = processor_stats.report()
+
+            hybrid_stats = RedisStats()
+            result["hybrid_metrics"] = await bench_hybrid_metrics(
+                workload.app_ids, CountingRedis(redis_pool, hybrid_stats), options
+            )
+            result["hybrid_metrics"]["redis"] = hybrid_stats.report()
+
+            async with session.get(f"{base_url}/_harness/stats") as resp:
+                result["fixture_server"] = await resp.json()
+        return result
+    finally:
+        redis_pool.close()
+        await redis_pool.wait_closed()
+        server.terminate()
+        server.join()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command()
+@click.option("--apps", default=2, show_default=True)
+@click.option("--jobs-per-minute", default=12, show_default=True)
+@click.option("--stages-per-job", default=4, show_default=True)
+@click.option("--tasks-per-stage", default=200, show_default=True)
+@click.option("--executors", default=20, show_default=True)
+@click.option("--recorded", type=click.Path(exists=True), help="Stored ApplicationMetrics JSON to replay")
+@click.option("--rounds", default=10, show_default=True)
+@click.option("--round-interval", default=10.0, show_default=True, help="Virtual seconds between rounds")
+@click.option("--fetch-last-jobs", default=2, show_default=True)
+@click.option("--fetch-interval", default=0.0, show_default=True, help="Fetcher delay between requests")
+@click.option("--processor-iterations", default=3, show_default=True)
+@click.option("--processors/--no-processors", default=True, help="Benchmark keras based anomaly processors")
+@click.option("--port", default=18088, show_default=True)
+@click.option(
+    "--redis-url",
+    default="redis://localhost:6379/15",
+    show_default=True,
+    help="Redis database for the run, it is FLUSHED first",
+)
+@click.option("--output", type=click.File("wb"), default="-")
+def main(recorded, output, **options):
+    workload_params = {
+        k: options[k]
+        for k in ("apps", "jobs_per_minute", "stages_per_job", "tasks_per_stage", "executors")
+    }
+    if recorded:
+        workload = RecordedWorkload(recorded, **workload_params)
+    else:
+        workload = SyntheticWorkload(**workload_params)
+
+    started = time.time()
+    result = asyncio.run(run_benchmark(workload, options))
+    report = {
+        "benchmark": "harness",
+        "started": started,
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "workload": workload.describe(),
+        "options": options,
+        "results": result,
+    }
+    output.write(orjson.dumps(report, option=orjson.OPT_INDENT_2) + b"\n")
+
+
+if __name__ == "__main__":
+    main()
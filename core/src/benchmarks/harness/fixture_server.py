@@ -0,0 +1,103 @@
+"""Local stand-in for the YARN proxy and Spark REST API"""
+from collections import defaultdict
+
+import aiohttp
+import orjson
+from aiohttp import web
+
+from benchmarks.harness.workload import SyntheticWorkload
+
+routes = web.RouteTableDef()
+
+API_PREFIX = "/proxy/{app_id}/api/v1/applications/{api_app_id}"
+
+
+def respond(request: web.Request, node, body: bytes, content_type="application/json"):
+    stats = request.app["STATS"]
+    stats["requests"][node] += 1
+    stats["bytes"][node] += len(body)
+    return web.Response(body=body, content_type=content_type)
+
+
+def workload_app_id(request: web.Request):
+    app_id = request.match_info["app_id"]
+    if app_id not in request.app["WORKLOAD"].app_ids:
+        raise web.HTTPNotFound()
+    return app_id
+
+
+@routes.get("/cluster")
+async def cluster(request: web.Request):
+    body = request.app["WORKLOAD"].cluster_page().encode()
+    return respond(request, "applications", body, content_type="text/html")
+
+
+@routes.get("/ws/v1/cluster/apps")
+async def yarn_apps(request: web.Request):
+    body = orjson.dumps(request.app["WORKLOAD"].yarn_apps(request.query))
+    return respond(request, "yarn_apps", body)
+
+
+@routes.get("/ws/v1/cluster/apps/{app_id}")
+async def yarn_app(request: web.Request):
+    body = orjson.dumps(request.app["WORKLOAD"].yarn_app(request.match_info["app_id"]))
+    return respond(request, "yarn_app", body)
+
+
+@routes.get(API_PREFIX + "/jobs")
+async def jobs(request: web.Request):
+    app_id = workload_app_id(request)
+    return respond(request, "jobs", orjson.dumps(request.app["WORKLOAD"].jobs(app_id)))
+
+
+@routes.get(API_PREFIX + "/executors")
+async def executors(request: web.Request):
+    app_id = workload_app_id(request)
+    body = orjson.dumps(request.app["WORKLOAD"].executors(app_id))
+    return respond(request, "executors", body)
+
+
+@routes.get(API_PREFIX + "/environment")
+async def environment(request: web.Request):
+    app_id = workload_app_id(request)
+    body = orjson.dumps(request.app["WORKLOAD"].environment(app_id))
+    return respond(request, "environment", body)
+
+
+@routes.get(API_PREFIX + "/stages/{stage_id}")
+async def stage(request: web.Request):
+    app_id = workload_app_id(request)
+    workload: SyntheticWorkload = request.app["WORKLOAD"]
+    stage_id = int(request.match_info["stage_id"])
+
+    # Generating thousands of tasks is slower than the loader under test
+    cache_key = (app_id, stage_id, workload.stage_status(stage_id))
+    body = request.app["STAGE_CACHE"].get(cache_key)
+    if body is None:
+        body = orjson.dumps(workload.stage(app_id, stage_id))
+        request.app["STAGE_CACHE"][cache_key] = body
+    return respond(request, "stage", body)
+
+
+@routes.post("/_harness/advance")
+async def advance(request: web.Request):
+    request.app["WORKLOAD"].advance(float(request.query["seconds"]))
+    return web.json_response({"completed_jobs": request.app["WORKLOAD"].completed_jobs})
+
+
+@routes.get("/_harness/stats")
+async def stats(request: web.Request):
+    return web.json_response(request.app["STATS"])
+
+
+def create_app(workload: SyntheticWorkload) -> web.Application:
+    app = web.Application()
+    app["WORKLOAD"] = workload
+    app["STAGE_CACHE"] = dict()
+    app["STATS"] = {"requests": defaultdict(int), "bytes": defaultdict(int)}
+    app.router.add_routes(routes)
+    return app
+
+
+def serve(workload: SyntheticWorkload, port):
+    aiohttp.web.run_app(create_app(workload), port=port, print=None)
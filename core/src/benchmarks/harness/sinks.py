@@ -0,0 +1,110 @@
+"""Counting wrappers around redis and graphite clients to measure write volume"""
+from collections import defaultdict
+from typing import Dict, Any
+
+
+def payload_size(args) -> int:
+    size = 0
+    for arg in args:
+        if isinstance(arg, (bytes, bytearray)):
+            size += len(arg)
+        elif isinstance(arg, str):
+            size += len(arg.encode())
+        elif isinstance(arg, dict):
+            size += payload_size(arg.keys()) + payload_size(arg.values())
+        elif isinstance(arg, (list, tuple)):
+            size += payload_size(arg)
+        else:
+            size += len(str(arg))
+    return size
+
+
+class RedisStats:
+    def __init__(self):
+        self.round_trips = 0
+        self.commands: Dict[str, int] = defaultdict(int)
+        self.bytes_sent = 0
+
+    def count(self, command, args, kwargs):
+        self.commands[command] += 1
+        self.bytes_sent += payload_size(args) + payload_size(kwargs.values())
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "round_trips": self.round_trips,
+            "commands": dict(self.commands),
+            "bytes_sent": self.bytes_sent,
+        }
+
+
+class CountingTransaction:
+    def __init__(self, transaction, stats: RedisStats):
+        self._transaction = transaction
+        self._stats = stats
+
+    def __getattr__(self, name):
+        command = getattr(self._transaction, name)
+        if name == "execute":
+            return self._execute
+        if not callable(command):
+            return command
+
+        def counted(*args, **kwargs):
+            self._stats.count(name, args, kwargs)
+            return command(*args, **kwargs)
+
+        return counted
+
+    async def _execute(self, *args, **kwargs):
+        self._stats.round_trips += 1
+        return await self._transaction.execute(*args, **kwargs)
+
+
+class CountingRedis:
+    """Proxy of an aioredis client that counts commands, bytes and round trips"""
+
+    transaction_factories = ("multi_exec", "pipeline")
+
+    def __init__(self, redis, stats: RedisStats = None):
+        self._redis = redis
+        self.stats = stats or RedisStats()
+
+    def __getattr__(self, name):
+        command = getattr(self._redis, name)
+        if not callable(command):
+            return command
+        if name in self.transaction_factories:
+            return lambda *a, **kw: CountingTransaction(command(*a, **kw), self.stats)
+
+        def counted(*args, **kwargs):
+            self.stats.count(name, args, kwargs)
+            self.stats.round_trips += 1
+            return command(*args, **kwargs)
+
+        return counted
+
+
+class CountingGraphite:
+    """Graphite client stand-in that only counts what would be sent"""
+
+    def __init__(self):
+        self.datapoints = 0
+        self.bytes_sent = 0
+        self.calls = 0
+
+    def send(self, metric, value, timestamp=None):
+        self.send_dict({metric: value}, timestamp)
+
+    def send_dict(self, data, timestamp=None):
+        self.calls += 1
+        self.datapoints += len(data)
+        self.bytes_sent += sum(
+            len(f"{metric} {value} {timestamp or 0}\n") for metric, value in data.items()
+        )
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "datapoints": self.datapoints,
+            "bytes_sent": self.bytes_sent,
+        }
@@ -0,0 +1,319 @@
+import random
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any
+
+import orjson
+
+
+def spark_time(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}GMT"
+
+
+class SyntheticWorkload:
+    """Spark REST payloads of a set of apps that complete jobs at a steady rate.
+
+    Time is virtual and moves only with `advance`, so two runs with the same
+    parameters see exactly the same jobs, stages and tasks.
+    """
+
+    def __init__(
+        self,
+        *,
+        apps=1,
+        jobs_per_minute=6,
+        stages_per_job=4,
+        tasks_per_stage=200,
+        executors=20,
+        retained_jobs=1000,
+        seed=42,
+    ):
+        self.app_ids = [f"application_1620000000000_{i:04d}" for i in range(apps)]
+        self.jobs_per_minute = jobs_per_minute
+        self.stages_per_job = stages_per_job
+        self.tasks_per_stage = tasks_per_stage
+        self.executors_count = executors
+        self.retained_jobs = retained_jobs
+        self.seed = seed
+        self.start = datetime(2021, 5, 5, tzinfo=timezone.utc)
+        self.elapsed = 0.0
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "kind": type(self).__name__,
+            "apps": len(self.app_ids),
+            "jobs_per_minute": self.jobs_per_minute,
+            "stages_per_job": self.stages_per_job,
+            "tasks_per_stage": self.tasks_per_stage,
+            "executors": self.executors_count,
+            "seed": self.seed,
+        }
+
+    def advance(self, seconds):
+        self.elapsed += seconds
+
+    @property
+    def completed_jobs(self) -> int:
+        return int(self.elapsed / 60 * self.jobs_per_minute)
+
+    def job_submission_time(self, job_id) -> datetime:
+        return self.start + timedelta(seconds=job_id * 60 / self.jobs_per_minute)
+
+    def job_stage_ids(self, job_id) -> List[int]:
+        return [job_id * self.stages_per_job + k for k in range(self.stages_per_job)]
+
+    def job(self, app_id, job_id) -> Dict[str, Any]:
+        running = job_id >= self.completed_jobs
+        submission_time = self.job_submission_time(job_id)
+        job = {
+            "jobId": job_id,
+            "name": f"job at {app_id}",
+            "submissionTime": spark_time(submission_time),
+            "stageIds": self.job_stage_ids(job_id),
+            "status": "RUNNING" if running else "SUCCEEDED",
+            "numTasks": self.stages_per_job * self.tasks_per_stage,
+        }
+        if not running:
+            duration = 60 / self.jobs_per_minute * 0.8
+            job["completionTime"] = spark_time(
+                submission_time + timedelta(seconds=duration)
+            )
+        return job
+
+    def jobs(self, app_id) -> List[Dict[str, Any]]:
+        """Retained jobs, newest first, the last one is still running"""
+        newest = self.completed_jobs
+        oldest = max(0, newest - self.retained_jobs + 1)
+        return [self.job(app_id, job_id) for job_id in range(newest, oldest - 1, -1)]
+
+    def stage_status(self, stage_id) -> str:
+        job_id = stage_id // self.stages_per_job
+        if job_id < self.completed_jobs:
+            return "COMPLETE"
+        if stage_id % self.stages_per_job == self.stages_per_job - 1:
+            return "ACTIVE"
+        return "COMPLETE"
+
+    def stage(self, app_id, stage_id) -> List[Dict[str, Any]]:
+        rnd = random.Random(f"{self.seed}:{app_id}:{stage_id}")
+        status = self.stage_status(stage_id)
+        launch_time = self.job_submission_time(stage_id // self.stages_per_job)
+        tasks = {}
+        for index in range(self.tasks_per_stage):
+            task_id = stage_id * self.tasks_per_stage + index
+            tasks[str(task_id)] = self.task(rnd, task_id, index, launch_time)
+        return [self.stage_attempt(stage_id, status, tasks)]
+
+    def stage_attempt(self, stage_id, status, tasks) -> Dict[str, Any]:
+        durations = [t["duration"] for t in tasks.values()]
+        return {
+            "status": status,
+            "stageId": stage_id,
+            "attemptId": 0,
+            "numTasks": len(tasks),
+            "numActiveTasks": 0,
+            "numCompleteTasks": len(tasks),
+            "numFailedTasks": 0,
+            "numKilledTasks": 0,
+            "numCompletedIndices": len(tasks),
+            "executorRunTime": sum(durations),
+            "executorCpuTime": sum(durations) * 900000,
+            "inputBytes": 1024 * len(tasks),
+            "inputRecords": 10 * len(tasks),
+            "outputBytes": 0,
+            "outputRecords": 0,
+            "shuffleReadBytes": 4096 * len(tasks),
+            "shuffleReadRecords": 40 * len(tasks),
+            "shuffleWriteBytes": 2048 * len(tasks),
+            "shuffleWriteRecords": 20 * len(tasks),
+            "memoryBytesSpilled": 0,
+            "diskBytesSpilled": 0,
+            "name": f"stage {stage_id}",
+            "schedulingPool": "default",
+            "rddIds": [stage_id],
+            "accumulatorUpdates": [],
+            "tasks": tasks,
+            "executorSummary": {},
+            "killedTasksSummary": {},
+        }
+
+    def task(self, rnd: random.Random, task_id, index, launch_time) -> Dict[str, Any]:
+        duration = int(rnd.lognormvariate(7, 0.5))
+        gc_time = int(duration * rnd.uniform(0, 0.1))
+        return {
+            "taskId": task_id,
+            "index": index,
+            "attempt": 0,
+            "launchTime": spark_time(launch_time),
+            "duration": duration,
+            "executorId": str(task_id % self.executors_count + 1),
+            "host": "host.com",
+            "status": "SUCCESS",
+            "taskLocality": rnd.choice(["PROCESS_LOCAL", "NODE_LOCAL", "ANY"]),
+            "speculative": False,
+            "accumulatorUpdates": [],
+            "taskMetrics": {
+                "executorDeserializeTime": rnd.randint(1, 20),
+                "executorDeserializeCpuTime": rnd.randint(10 ** 5, 10 ** 7),
+                "executorRunTime": duration,
+                "executorCpuTime": duration * 900000,
+                "resultSize": 2218,
+                "jvmGcTime": gc_time,
+                "resultSerializationTime": 0,
+                "memoryBytesSpilled": 0,
+                "diskBytesSpilled": 0,
+                "peakExecutionMemory": 0,
+                "inputMetrics": {"bytesRead": 1024, "recordsRead": 10},
+                "outputMetrics": {"bytesWritten": 0, "recordsWritten": 0},
+                "shuffleReadMetrics": {
+                    "remoteBlocksFetched": 10,
+                    "localBlocksFetched": 2,
+                    "fetchWaitTime": 0,
+                    "remoteBytesRead": 3500,
+                    "remoteBytesReadToDisk": 0,
+                    "localBytesRead": 596,
+                    "recordsRead": 40,
+                },
+                "shuffleWriteMetrics": {
+                    "bytesWritten": 2048,
+                    "writeTime": 72477,
+                    "recordsWritten": 20,
+                },
+            },
+        }
+
+    def executors(self, app_id) -> List[Dict[str, Any]]:
+        executor_ids = ["driver"] + [str(i + 1) for i in range(self.executors_count)]
+        tick = self.completed_jobs
+        return [
+            {
+                "id": executor_id,
+                "hostPort": f"host.com:{40000 + idx}",
+                "isActive": True,
+                "memoryUsed": (idx * 7919 + tick * 104729) % (1 << 30),
+                "diskUsed": 0,
+                "totalCores": 0 if executor_id == "driver" else 4,
+                "maxTasks": 0 if executor_id == "driver" else 4,
+                "maxMemory": 1 << 31,
+                "totalGCTime": tick * idx,
+                "totalShuffleRead": tick * idx * 4096,
+                "totalShuffleWrite": tick * idx * 2048,
+            }
+            for idx, executor_id in enumerate(executor_ids)
+        ]
+
+    def environment(self, app_id) -> Dict[str, Any]:
+        return {
+            "sparkProperties": [
+                ["spark.executor.memory", "4g"],
+                ["spark.driver.memory", "2g"],
+                ["spark.executor.memoryOverhead", "512m"],
+                ["spark.executor.cores", "4"],
+                ["spark.executor.instances", str(self.executors_count)],
+                ["spark.dynamicAllocation.enabled", "false"],
+            ]
+        }
+
+    def cluster_page(self) -> str:
+        """YARN /cluster page in the shape AppIdsFromHtml understands"""
+        headers = ["ID", "User", "Name", "StartTime", "State", "Progress", "Tracking UI"]
+        rows = [
+            [
+                f"<a href='/cluster/app/{app_id}'>{app_id}</a>",
+                "benchmark",
+                f"benchmark {app_id}",
+                str(int(self.start.timestamp() * 1000)),
+                "RUNNING",
+                "",
+                "",
+            ]
+            for app_id in self.app_ids
+        ]
+        return (
+            "<html><body><table id='apps'><thead><tr>"
+            + "".join(f"<th>{header}</th>" for header in headers)
+            + "</tr></thead><script>var appsTableData="
+            + orjson.dumps(rows).decode()
+            + "</script></table></body></html>"
+        )
+
+
+    def yarn_apps(self, query) -> Dict[str, Any]:
+        """ResourceManager `/ws/v1/cluster/apps`, all apps are running"""
+        started = int(self.start.timestamp() * 1000)
+        states = query.get("states", "RUNNING").split(",")
+        if "RUNNING" not in states or started < int(query.get("startedTimeBegin", 0)):
+            return {"apps": None}
+        apps = [
+            {
+                "id": app_id,
+                "user": "benchmark",
+                "name": f"benchmark {app_id}",
+                "queue": "default",
+                "state": "RUNNING",
+                "startedTime": started,
+            }
+            for app_id in self.app_ids
+        ]
+        return {"apps": {"app": apps}}
+
+    def yarn_app(self, app_id) -> Dict[str, Any]:
+        """ResourceManager `/ws/v1/cluster/apps/{app_id}`"""
+        return {"app": {"id": app_id, "state": "RUNNING"}}
+
+
+class RecordedWorkload(SyntheticWorkload):
+    """Replays jobs recorded in a stored ApplicationMetrics JSON.
+
+    Recorded jobs are used as templates in a loop and get new ids and
+    timestamps, so the rate and the number of apps are still configurable.
+    """
+
+    def __init__(self, path, **kwargs):
+        recorded = orjson.loads(open(path, "rb").read())
+        self.templates = [
+            job_stages
+            for _, job_stages in sorted(
+                recorded["jobs_stages"].items(), key=lambda kv: int(kv[0])
+            )
+            if job_stages["stages"]
+        ]
+        if not self.templates:
+            raise ValueError(f"No recorded jobs with stages in {path}")
+        self.recorded_executors = recorded["executor_metrics"]
+        self.path = path
+        kwargs["stages_per_job"] = max(len(t["stages"]) for t in self.templates)
+        kwargs["executors"] = len(self.recorded_executors)
+        super().__init__(**kwargs)
+
+    def describe(self) -> Dict[str, Any]:
+        return {**super().describe(), "recorded": self.path}
+
+    def template_stages(self, job_id) -> List[Dict[str, Any]]:
+        template = self.templates[job_id % len(self.templates)]
+        return list(template["stages"].values())
+
+    def job_stage_ids(self, job_id) -> List[int]:
+        return super().job_stage_ids(job_id)[: len(self.template_stages(job_id))]
+
+    def stage(self, app_id, stage_id) -> List[Dict[str, Any]]:
+        job_id, position = divmod(stage_id, self.stages_per_job)
+        recorded = self.template_stages(job_id)[position]
+        tasks = {
+            str(stage_id * 100000 + idx): {
+                **task,
+                "taskId": stage_id * 100000 + idx,
+                "duration": task.get("duration")
+                or task.get("taskMetrics", {}).get("executorRunTime", 0),
+            }
+            for idx, task in enumerate(recorded["tasks"].values())
+        }
+        attempt = {
+            **recorded["stage"],
+            "stageId": stage_id,
+            "status": self.stage_status(stage_id),
+            "tasks": tasks,
+        }
+        return [attempt]
+
+    def executors(self, app_id) -> List[Dict[str, Any]]:
+        return self.recorded_executors
@@ -0,0 +1,111 @@
+"""Workloads in the shape of sample_data/stored_application.json, scaled up"""
+import copy
+import random
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import orjson
+
+SAMPLE_APPLICATION = (
+    Path(__file__).resolve().parents[3] / "sample_data" / "stored_application.json"
+)
+
+
+def load_sample() -> Dict[str, Any]:
+    return orjson.loads(SAMPLE_APPLICATION.read_bytes())
+
+
+def sample_tasks(sample: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        task
+        for job_stages in sample["jobs_stages"].values()
+        for stage_tasks in job_stages["stages"].values()
+        for task in stage_tasks["tasks"].values()
+    ]
+
+
+def sample_stage(sample: Dict[str, Any]) -> Dict[str, Any]:
+    job_stages = next(iter(sample["jobs_stages"].values()))
+    return next(iter(job_stages["stages"].values()))["stage"]
+
+
+def scaled_stage(
+    sample, stage_id, num_tasks, rnd: random.Random, num_task_groups: int = 1
+) -> Dict[str, Any]:
+    """Stage with `num_tasks` tasks cloned from sample ones with jittered metrics.
+
+    `num_task_groups` varies numTasks between jobs, so jobs fall into
+    different groups of JobGroupedExtractor.
+    """
+    templates = sample_tasks(sample)
+    tasks = {}
+    for index in range(num_tasks):
+        task = copy.deepcopy(templates[index % len(templates)])
+        task_id = str(int(stage_id) * 100000 + index)
+        run_time = int(rnd.lognormvariate(7, 0.7))
+        task["taskId"] = task_id
+        task["index"] = index
+        task["duration"] = run_time
+        task["taskMetrics"]["executorRunTime"] = run_time
+        task["taskMetrics"]["jvmGcTime"] = int(run_time * rnd.uniform(0, 0.1))
+        tasks[task_id] = task
+    stage = dict(
+        sample_stage(sample),
+        stageId=str(stage_id),
+        numTasks=num_tasks + rnd.randrange(num_task_groups),
+        executorRunTime=sum(t["duration"] for t in tasks.values()),
+        shuffleReadBytes=rnd.randrange(1 << 20, 1 << 30),
+    )
+    return {"stage": stage, "tasks": tasks}
+
+
+def scaled_job(
+    sample, job_id, stages_per_job, tasks_per_stage, rnd: random.Random, **kwargs
+) -> Dict[str, Any]:
+    job = dict(next(iter(sample["jobs_stages"].values()))["job"])
+    stage_ids = [job_id * stages_per_job + k for k in range(stages_per_job)]
+    job.update(jobId=str(job_id), stageIds=stage_ids)
+    return {
+        "job": job,
+        "stages": {
+            str(stage_id): scaled_stage(sample, stage_id, tasks_per_stage, rnd, **kwargs)
+            for stage_id in stage_ids
+        },
+    }
+
+
+def scaled_application(
+    *,
+    jobs: int,
+    stages_per_job: int,
+    tasks_per_stage: int,
+    num_task_groups: int = 1,
+    seed: int = 42,
+    sample: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Raw ApplicationMetrics dict, as stored by the loader"""
+    sample = sample or load_sample()
+    rnd = random.Random(seed)
+    return {
+        "executor_metrics": sample["executor_metrics"],
+        "jobs_stages": {
+            str(job_id): scaled_job(
+                sample,
+                job_id,
+                stages_per_job,
+                tasks_per_stage,
+                rnd,
+                num_task_groups=num_task_groups,
+            )
+            for job_id in range(jobs)
+        },
+    }
+
+
+def graphite_series(points: int, gap_ratio: float, seed: int = 42) -> List[list]:
+    """Graphite render datapoints, a `gap_ratio` part of values are None"""
+    rnd = random.Random(seed)
+    return [
+        [None if rnd.random() < gap_ratio else rnd.uniform(0, 100), 1620000000 + 10 * i]
+        for i in range(points)
+    ]
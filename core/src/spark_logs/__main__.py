@@ -7,10 +7,11 @@ def main():
 
 
 @main.command()
-def loader():
+@click.option("--port", default=8001, help="Run more instances on other ports to share the load")
+def loader(port):
     from .loaders.api import app
 
-    app.start()
+    app.start(port=port)
 
 
 @main.command()
@@ -27,5 +28,25 @@ def anomaly_detection():
     app.start()
 
 
+@main.command()
+@click.option("--workers", default=1, help="Number of worker processes")
+def anomaly_worker(workers):
+    from .anomaly_detection import work_queue
+
+    work_queue.start(workers)
+
+
+@main.command()
+@click.argument("paths", nargs=-1, required=True)
+@click.option("--batch-jobs", default=100, help="Jobs written to Redis in one transaction")
+def event_log(paths, batch_jobs):
+    """Loads Spark event log files or rolling event log directories"""
+    import asyncio
+
+    from .loaders import event_log
+
+    asyncio.run(event_log.load_event_logs(paths, batch_jobs=batch_jobs))
+
+
 if __name__ == "__main__":
     main()
@@ -5,13 +5,11 @@ import aiohttp
 from aiohttp import http_exceptions
 from aiohttp import web
 
-from spark_logs import db
-from spark_logs.anomaly_detection.dataset_extractor import JobGroupedExtractor
-from spark_logs.anomaly_detection.detectors import AutoencoderDetector
-from spark_logs.anomaly_detection.processor import (
-    SequentialDetector,
-    SequentialJobsFitter,
-    SequentialFeatureBypass,
+from spark_logs import db, instrumentation, tracing, profiling
+from spark_logs.anomaly_detection.work_queue import (
+    METRIC_PROCESSORS,
+    WorkQueue,
+    WorkScheduler,
 )
 from spark_logs.task_tools import task_status
 
@@ -25,18 +23,15 @@ async def hello(request):
 
 @routes.get("/client/ls")
 async def ls_tasks(request: aiohttp.web.Request):
-    processors = request.app["APP_METRICS"]
+    app = request.app
+    scheduler: WorkScheduler = app["SCHEDULER"]
+    status = task_status(app["SCHEDULER_TASK"])
     app_processors = defaultdict(dict)
-    for app_id in processors:
-        metrics = processors[app_id]
-        for metric_name, metric_tasks in metrics.items():
-            tasks = dict(
-                zip(
-                    ["task_fit", "task_predict", "task_bypass"],
-                    map(lambda x: task_status(x), list(metric_tasks.values())[1:]),
-                )
-            )
-            app_processors[app_id][metric_name] = tasks
+    for app_id, metric_names in scheduler.registered().items():
+        for metric_name in metric_names:
+            app_processors[app_id][metric_name] = {
+                kind: status for kind in METRIC_PROCESSORS[metric_name]
+            }
     return web.json_response({"applications": app_processors})
 
 
@@ -45,36 +40,14 @@ async def client_for_app(request: aiohttp.web.Request):
     app = request.app
     try:
         app_id = request.query["app_id"]
-        metric_name = request.query.get("metric_name") or "iforest_processor"
-        detector_factory, fitter_factory, bypass_factory = app["METRIC_PROCESSORS"][
-            metric_name
-        ]
-        detector = detector_factory(
-            app_id, JobGroupedExtractor, detector_cls=AutoencoderDetector
-        )
-        fitter = fitter_factory(
-            app_id,
-            JobGroupedExtractor,
-            detector_cls=AutoencoderDetector,
-            timeout=120,
-            batch=1500,
-        )
-        bypass = bypass_factory(app_id, JobGroupedExtractor, timeout=10)
+        metric_name = request.query.get("metric_name") or "sequential_processor"
+        METRIC_PROCESSORS[metric_name]
     except KeyError as exc:
         raise http_exceptions.HttpBadRequest("No key " + str(exc))
-    redis = app["REDIS"]
-
-    task_f = asyncio.create_task(fitter.loop_process(redis))
-    task_p = asyncio.create_task(detector.loop_process(redis))
-    task_b = asyncio.create_task(bypass.loop_process(redis))
-
-    app["APP_METRICS"][app_id][metric_name] = {
-        "processors": (fitter, detector),
-        "task_f": task_f,
-        "task_p": task_p,
-        "task_b": task_b,
-    }
 
+    # Processing itself happens in anomaly-worker processes
+    app["SCHEDULER"].register(app_id, metric_name)
+    await app["SCHEDULER"].save(app_id)
     return aiohttp.web.json_response({"status": "created new processor"})
 
 
@@ -87,17 +60,13 @@ async def rm_metric_proc(request: aiohttp.web.Request):
     except KeyError as exc:
         raise http_exceptions.HttpBadRequest("No key " + str(exc))
 
-    data = app["APP_METRICS"].get(app_id, {}).get(metric_name)
-    if data is None:
+    scheduler: WorkScheduler = app["SCHEDULER"]
+    if metric_name not in scheduler.registered(app_id).get(app_id, []):
         return aiohttp.web.json_response({"error": "Processor not found"})
 
-    tasks = [x for x in data.values() if isinstance(x, asyncio.Task)]
-    for x in tasks:
-        x.cancel()
-    del app["APP_METRICS"][app_id][metric_name]
-    return aiohttp.web.json_response(
-        {"status": f"Deleted processor. Closed {len(tasks)} tasks"}
-    )
+    scheduler.unregister(app_id, metric_name)
+    await scheduler.save(app_id)
+    return aiohttp.web.json_response({"status": "Deleted processor"})
 
 
 @routes.post("/detector/rm")
@@ -108,40 +77,38 @@ async def rm_metrics_for_app(request: aiohttp.web.Request):
     except KeyError as exc:
         raise http_exceptions.HttpBadRequest("No key " + str(exc))
 
-    data = app["APP_METRICS"].get(app_id)
-    if data is None:
+    scheduler: WorkScheduler = app["SCHEDULER"]
+    if app_id not in scheduler.registered(app_id):
         return aiohttp.web.json_response({"error": "App not found"})
 
-    total_tasks_closed = 0
-    for metric_name, metric_data in data.items():
-        tasks = [x for x in metric_data.values() if isinstance(x, asyncio.Task)]
-        for x in tasks:
-            x.cancel()
-        total_tasks_closed += len(tasks)
-
-    del app["APP_METRICS"][app_id]
-
-    return aiohttp.web.json_response(
-        {
-            "status": f"Deleted processors for {app_id}. Closed {total_tasks_closed} tasks"
-        }
-    )
+    scheduler.unregister(app_id)
+    await scheduler.save(app_id)
+    return aiohttp.web.json_response({"status": f"Deleted processors for {app_id}"})
 
 
 async def create_redis_connection(app):
     app["REDIS"] = await db.connect_with_redis()
 
 
+async def start_scheduler(app):
+    app["SCHEDULER"] = WorkScheduler(WorkQueue(app["REDIS"]))
+    await app["SCHEDULER"].restore()
+    app["SCHEDULER_TASK"] = asyncio.create_task(app["SCHEDULER"].loop_schedule())
+
+
+async def stop_scheduler(app):
+    app["SCHEDULER_TASK"].cancel()
+
+
 def start():
     app = aiohttp.web.Application(middlewares=[aiohttp.web.normalize_path_middleware()])
-    app["METRIC_PROCESSORS"] = {
-        "sequential_processor": (
-            SequentialDetector,
-            SequentialJobsFitter,
-            SequentialFeatureBypass,
-        ),
-    }
-    app["APP_METRICS"] = defaultdict(dict)
     app.router.add_routes(routes)
+    app.router.add_routes(instrumentation.routes)
+    app.router.add_routes(tracing.routes)
+    app.router.add_routes(profiling.routes)
+    app.on_startup.append(profiling.start_loop_monitor)
+    app.on_cleanup.append(profiling.stop_loop_monitor)
     app.on_startup.append(create_redis_connection)
+    app.on_startup.append(start_scheduler)
+    app.on_cleanup.append(stop_scheduler)
     aiohttp.web.run_app(app, port=10000)
@@ -1,7 +1,8 @@
 import asyncio
+import itertools
 from abc import abstractmethod
 from datetime import datetime
-from typing import List, Dict, Type, Set, Iterable
+from typing import List, Dict, Type, Set, Iterable, Optional, Tuple
 
 import graphitesend
 import numpy as np
@@ -17,6 +18,15 @@ from spark_logs.anomaly_detection.features import (
     Feature,
 )
 from spark_logs.config import DEFAULT_CONFIG
+from spark_logs.instrumentation import (
+    InstrumentedGraphite,
+    PROCESSOR_ITERATION,
+    count_round_trips,
+    MODEL_FIT_TIME,
+    MODEL_PREDICT_TIME,
+    report_lag,
+)
+from spark_logs.tracing import span
 from spark_logs.types import JobStages
 
 V = "1"
@@ -52,6 +62,9 @@ class BaseProcessor:
 
 
 class SequentialJobsProcessor(BaseProcessor):
+    # Jobs of groups that could not be processed yet, retried every batch
+    deferred_jobs_limit = 500
+
     @property
     def processor_id(self):
         raise NotImplementedError()
@@ -65,6 +78,8 @@ class SequentialJobsProcessor(BaseProcessor):
         self.graphite_port = DEFAULT_CONFIG.get("graphite_port")
         self._graphite_client = None
         self._batch = batch
+        # Job group names seen in the batch, written with the batch report
+        self._job_groups: Dict[str, str] = dict()
         self.features: List[Feature] = [
             StageRunTimeFeature(),
             StageShuffleReadFeature(),
@@ -73,31 +88,43 @@ class SequentialJobsProcessor(BaseProcessor):
     @property
     def graphite_client(self):
         if self._graphite_client is None:
-            self._graphite_client = graphitesend.GraphiteClient(
-                prefix=self.processor_id,
-                system_name="",
-                graphite_server="localhost",
-                graphite_port=self.graphite_port,
-                autoreconnect=True,
+            self._graphite_client = InstrumentedGraphite(
+                graphitesend.GraphiteClient(
+                    prefix=self.processor_id,
+                    system_name="",
+                    graphite_server="localhost",
+                    graphite_port=self.graphite_port,
+                    autoreconnect=True,
+                )
             )
         return self._graphite_client
 
     async def process_iteration(self, redis: Redis):
+        with PROCESSOR_ITERATION.labels(processor=self.processor_id).time(), span(
+            self.processor_id, root=True, app_id=self.app_id
+        ), count_round_trips(self.processor_id):
+            await self.process_batch(redis)
+
+    async def process_batch(self, redis: Redis):
         try:
-            jobs: List[JobStages] = await self.load_jobs(redis)
+            jobs, watermark = await self.load_jobs(redis)
         except Exception as exc:
             raise
         if self.processor_id == "model_fitter":
             print()
         if not jobs:
+            if watermark is not None:
+                await self.report_jobs(redis, [], [], watermark)
             return
         extractor = self.dataset_extractor_cls(jobs, features=self.features)
-        grouped_dataset: Dict[str, np.ndarray] = extractor.extract()
+        with span("extract", jobs=len(jobs)):
+            grouped_dataset: Dict[str, np.ndarray] = extractor.extract()
         timestamps: Dict[str, List[datetime]] = extractor.get_all_timestamps()
 
-        processed_jobs = []
+        processed_jobs, deferred_jobs = [], []
         try:
             for group_key, group_data in grouped_dataset.items():
+                group_elements = extractor.get_groups()[group_key]
                 try:
                     await self.process_group(
                         group_key,
@@ -107,62 +134,160 @@ class SequentialJobsProcessor(BaseProcessor):
                         group_alias=extractor.group_long_aliases[group_key],
                     )
                 except CancelGroupProcessing:
+                    deferred_jobs.extend([x.job_data for x in group_elements])
                     continue
-                group_elements = extractor.get_groups()[group_key]
                 processed_jobs.extend([x.job_data for x in group_elements])
         except Exception as exc:
             raise
 
-        await self.report_jobs(redis, processed_jobs)
+        await self.report_jobs(redis, processed_jobs, deferred_jobs, watermark)
         print(
             f"{self.processor_id}: Supplied {len(processed_jobs)} jobs from {len(jobs)} available "
-            f"({len(processed_jobs) / len(jobs)})"
+            f"({len(processed_jobs) / len(jobs)}), deferred {len(deferred_jobs)}"
         )
 
-    @abstractmethod
-    async def process_group(
-        self, group_key, group_data: np.ndarray, timestamps, redis, group_alias
-    ):
-        pass
-
-    async def load_jobs(self, redis) -> List[JobStages]:
-        reported_jobs: Set[int] = await self.load_reported_jobs(redis)
-
-        data = {
-            score: job
-            for job, score in await redis.zrevrangebyscore(
-                kvstore.sequential_jobs_key(app_id=self.app_id), withscores=True
+    async def load_jobs(self, redis) -> Tuple[List[JobStages], Optional[bytes]]:
+        """Jobs completed after the watermark and deferred jobs to retry.
+
+        Watermark is the last read entry of the app completed jobs stream, so
+        jobs completed out of id order are not skipped. Returns the jobs and
+        the watermark to report once they are processed.
+        """
+        watermark = await self.load_watermark(redis)
+        entries = await db.read_stream_after(
+            redis,
+            kvstore.completed_jobs_stream_key(app_id=self.app_id),
+            watermark,
+            self._batch,
+            reader=self.processor_id,
+        )
+        if entries:
+            watermark = entries[-1][0]
+        deferred_job_ids = [
+            int(x)
+            for x in await redis.zrange(
+                kvstore.processor_deferred_jobs_key(
+                    app_id=self.app_id, processor_id=self.processor_id
+                )
             )
-        }
-        if not data:
-            print(f"{self.processor_id}: No data")
-            return []
-        print(f"Data: {len(data)} lines")
-
-        job_ids_to_process: List[int] = sorted(data.keys() - reported_jobs)[
-            -self._batch :
         ]
+        job_ids_to_process: List[int] = sorted(
+            {int(fields[b"job_id"]) for _, fields in entries} | set(deferred_job_ids)
+        )
+        await self.report_stream_lag(redis, entries)
+        if not job_ids_to_process:
+            print(f"{self.processor_id}: No data")
+            return [], watermark
+
+        jobs_key = kvstore.sequential_jobs_key(app_id=self.app_id)
+        pipeline = redis.pipeline()
+        for jid in job_ids_to_process:
+            pipeline.zrangebyscore(jobs_key, min=jid, max=jid)
+        data = await pipeline.execute()
+        print(f"Data: {len(entries)} new jobs, {len(deferred_job_ids)} deferred")
         print("Job ids: ", job_ids_to_process)
 
-        return [JobStages.from_json(data[jid]) for jid in job_ids_to_process]
+        with span("decode", jobs=len(job_ids_to_process)):
+            return [JobStages.from_json(job[0]) for job in data if job], watermark
+
+    async def report_stream_lag(self, redis, entries):
+        newest = await redis.xrevrange(
+            kvstore.completed_jobs_stream_key(app_id=self.app_id), count=1
+        )
+        if not newest:
+            return
+        [(_, newest_fields)] = newest
+        newest_job_id = int(newest_fields[b"job_id"])
+        read_job_id = int(entries[-1][1][b"job_id"]) if entries else newest_job_id
+        report_lag(self.processor_id, self.app_id, [newest_job_id], [read_job_id])
 
-    async def load_reported_jobs(self, redis) -> Set[int]:
-        key = kvstore.time_series_processed_jobs(
+    async def load_watermark(self, redis) -> Optional[bytes]:
+        watermark_key = kvstore.processor_watermark_key(
             app_id=self.app_id, processor_id=self.processor_id
         )
-        if not await redis.exists(key):
-            return set()
-        return {int(x) for x in await redis.smembers(key)}
+        watermark = await redis.get(watermark_key)
+        if watermark is not None:
+            return watermark
+
+        # Processed jobs used to be stored as a set, continue after the newest of them
+        reported = {
+            int(x)
+            for x in await redis.smembers(
+                kvstore.time_series_processed_jobs(
+                    app_id=self.app_id, processor_id=self.processor_id
+                )
+            )
+        }
+        if not reported:
+            return None
+        newest_reported = max(reported)
+        stream_key = kvstore.completed_jobs_stream_key(app_id=self.app_id)
+        # The newest reported job may be trimmed from the stream already, the
+        # closest older job is the last one known to be processed
+        closest_job_id = None
+        start = "-"
+        while True:
+            entries = await redis.xrange(stream_key, start=start, count=1000)
+            for entry_id, fields in entries:
+                job_id = int(fields[b"job_id"])
+                if job_id <= newest_reported and (
+                    closest_job_id is None or job_id >= closest_job_id
+                ):
+                    closest_job_id, watermark = job_id, entry_id
+            if len(entries) < 1000:
+                break
+            start = db.next_stream_id(entries[-1][0])
+        if watermark is None:
+            print(f"{self.processor_id}: jobs after {newest_reported} are all new")
+            return None
+        if closest_job_id != newest_reported:
+            print(
+                f"{self.processor_id}: job {newest_reported} is not in the stream, "
+                f"continuing after job {closest_job_id}"
+            )
+        await redis.set(watermark_key, watermark)
+        return watermark
 
-    async def report_jobs(self, redis, jobs: Iterable[JobStages]):
-        if not jobs:
-            return
-        await redis.sadd(
-            kvstore.time_series_processed_jobs(
-                app_id=self.app_id, processor_id=self.processor_id
-            ),
-            *(job.job.jobId for job in jobs),
+    async def report_jobs(
+        self,
+        redis,
+        processed_jobs: Iterable[JobStages],
+        deferred_jobs: Iterable[JobStages],
+        watermark: bytes,
+    ):
+        """Moves the watermark, jobs of cancelled groups are deferred till the next batch"""
+        deferred_key = kvstore.processor_deferred_jobs_key(
+            app_id=self.app_id, processor_id=self.processor_id
         )
+        transaction = redis.multi_exec()
+        transaction.set(
+            kvstore.processor_watermark_key(app_id=self.app_id, processor_id=self.processor_id),
+            watermark,
+        )
+        if self._job_groups:
+            transaction.mset(*itertools.chain.from_iterable(self._job_groups.items()))
+            self._job_groups = dict()
+        processed_ids = [int(job.job.jobId) for job in processed_jobs]
+        if processed_ids:
+            transaction.zrem(deferred_key, *processed_ids)
+        deferred_ids = [int(job.job.jobId) for job in deferred_jobs]
+        if deferred_ids:
+            transaction.zadd(
+                deferred_key,
+                *itertools.chain.from_iterable((jid, jid) for jid in deferred_ids),
+            )
+            # Oldest deferred jobs are given up first
+            transaction.zremrangebyrank(deferred_key, 0, -self.deferred_jobs_limit - 1)
+        await transaction.execute()
+
+    async def warm_up(self, redis: Redis):
+        """Prepares the processor before its first batch"""
+
+    @abstractmethod
+    async def process_group(
+        self, group_key, group_data: np.ndarray, timestamps, redis, group_alias
+    ):
+        pass
 
 
 class SequentialDetector(SequentialJobsProcessor):
@@ -172,14 +297,20 @@ class SequentialDetector(SequentialJobsProcessor):
         super().__init__(*args)
         self.detector_cls = detector_cls
         self._group_detectors = dict()
+        # model_key -> stored model data loaded into the group detector
+        self._loaded_models = dict()
+
+    async def warm_up(self, redis: Redis):
+        await warm_load_models(
+            redis, self.app_id, self.detector_cls, self._group_detectors, self._loaded_models
+        )
 
     async def process_group(
         self, group_key, group_data: np.ndarray, timestamps, redis, group_alias
     ):
-        await redis.set(
-            kvstore.job_group_hashes_key(app_id=self.app_id, group_hash=group_key),
-            group_alias,
-        )
+        self._job_groups[
+            kvstore.job_group_hashes_key(app_id=self.app_id, group_hash=group_key)
+        ] = group_alias
 
         # Write raw features
         self._group_detectors.setdefault(group_key, self.detector_cls())
@@ -190,10 +321,13 @@ class SequentialDetector(SequentialJobsProcessor):
             model_name=self.detector_cls.model_name,
             job_group=group_key,
         )
-        await safe_load_model(model_key, redis, detector)
+        await safe_load_model(model_key, redis, detector, self._loaded_models)
 
         if detector.ready:
-            predicts = detector.detect_anomalies(group_data)
+            with MODEL_PREDICT_TIME.labels(model=detector.model_name).time(), span(
+                "model.predict", model=detector.model_name, group=group_key
+            ):
+                predicts = detector.detect_anomalies(group_data)
             targets = detector.target(group_data)
             try:
                 if len(timestamps) != len(predicts):
@@ -231,10 +365,9 @@ class SequentialFeatureBypass(SequentialJobsProcessor):
     async def process_group(
         self, group_key, group_data: np.ndarray, timestamps, redis, group_alias
     ):
-        await redis.set(
-            kvstore.job_group_hashes_key(app_id=self.app_id, group_hash=group_alias),
-            group_key,
-        )
+        self._job_groups[
+            kvstore.job_group_hashes_key(app_id=self.app_id, group_hash=group_alias)
+        ] = group_key
 
         # Write raw features
         featurenames = [f.name for f in self.features]
@@ -270,6 +403,13 @@ class SequentialJobsFitter(SequentialJobsProcessor):
         super().__init__(*args, **kwargs)
         self.detector_cls = detector_cls
         self._group_detectors = dict()
+        # model_key -> stored model data loaded into the group detector
+        self._loaded_models = dict()
+
+    async def warm_up(self, redis: Redis):
+        await warm_load_models(
+            redis, self.app_id, self.detector_cls, self._group_detectors, self._loaded_models
+        )
 
     async def process_group(
         self, group_key, group_data: np.ndarray, timestamps, redis, group_alias
@@ -279,18 +419,39 @@ class SequentialJobsFitter(SequentialJobsProcessor):
         model_key = kvstore.anomaly_model_key(
             app_id=self.app_id, model_name=detector.model_name, job_group=group_key
         )
-        if not detector.ready:
-            await safe_load_model(model_key, redis, detector)
+        # Model may be fitted further by another worker since the last time
+        await safe_load_model(model_key, redis, detector, self._loaded_models)
         try:
-            detector.fit(group_data)
+            with MODEL_FIT_TIME.labels(model=detector.model_name).time(), span(
+                "model.fit", model=detector.model_name, group=group_key
+            ):
+                detector.fit(group_data)
         except ValueError as exc:
             raise CancelGroupProcessing
 
         filepath = detector.save(model_key)
         await redis.set(model_key, filepath)
-
-
-async def safe_load_model(model_key: str, redis, detector):
+        self._loaded_models[model_key] = filepath
+
+
+async def warm_load_models(redis, app_id, detector_cls, group_detectors, loaded):
+    """Loads all stored models of the app, yielding to the loop between models"""
+    pattern = kvstore.anomaly_model_key(
+        app_id=app_id, model_name=detector_cls.model_name, job_group="*"
+    )
+    model_keys = [key async for key in redis.iscan(match=pattern)]
+    for model_key in model_keys:
+        model_key = model_key.decode()
+        group_key = model_key.rsplit(":", 1)[-1]
+        detector = group_detectors.setdefault(group_key, detector_cls())
+        await safe_load_model(model_key, redis, detector, loaded)
+        await asyncio.sleep(0)
+    if model_keys:
+        print(f"Loaded {len(model_keys)} {detector_cls.model_name} models of {app_id}")
+
+
+async def safe_load_model(model_key: str, redis, detector, loaded=None):
+    """Loads stored model into detector, unless it is in `loaded` already"""
     for i in range(3):
         try:
             data = await redis.get(model_key)
@@ -299,9 +460,13 @@ async def safe_load_model(model_key: str, redis, detector):
 
         if data is None:
             return None
+        if loaded is not None and loaded.get(model_key) == data:
+            return
 
         try:
             detector.load(data)
+            if loaded is not None:
+                loaded[model_key] = data
             return
         except IOError as exc:
             print("Maybe RC appeared. Retying")
@@ -0,0 +1,325 @@
+"""Anomaly processors work queue in a Redis stream with a consumer group.
+
+The API process only schedules: every registered (app, metric, processor)
+gets a work item when its interval passes and no item of it is in flight.
+`spark_logs anomaly-worker` processes run the items. An item that is not
+acked because its worker died is claimed by another worker after
+`reclaim_idle` seconds.
+
+Registrations are persisted in redis, a restarted scheduler restores them
+and workers warm-load models of the registered apps in the background.
+Processors keep a watermark of processed jobs, so nothing is reprocessed.
+"""
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+import traceback
+from typing import Dict, Tuple, Optional, List
+
+import aioredis
+import orjson
+from aioredis import Redis
+
+from spark_logs import db, kvstore
+from spark_logs.anomaly_detection.dataset_extractor import JobGroupedExtractor
+from spark_logs.anomaly_detection.detectors import AutoencoderDetector
+from spark_logs.anomaly_detection.processor import (
+    SequentialDetector,
+    SequentialJobsFitter,
+    SequentialFeatureBypass,
+    SequentialJobsProcessor,
+)
+
+GROUP = "anomaly_workers"
+
+# metric_name -> processor kind -> (factory, interval in seconds)
+METRIC_PROCESSORS = {
+    "sequential_processor": {
+        "task_fit": (
+            lambda app_id: SequentialJobsFitter(
+                app_id,
+                JobGroupedExtractor,
+                detector_cls=AutoencoderDetector,
+                timeout=120,
+                batch=1500,
+            ),
+            120,
+        ),
+        "task_predict": (
+            lambda app_id: SequentialDetector(
+                app_id, JobGroupedExtractor, detector_cls=AutoencoderDetector
+            ),
+            10,
+        ),
+        "task_bypass": (
+            lambda app_id: SequentialFeatureBypass(app_id, JobGroupedExtractor, timeout=10),
+            10,
+        ),
+    },
+}
+
+
+class WorkQueue:
+    stream_len = 10000
+    # Item of a dead worker is moved to a new one after this time, so the
+    # longest fit must be shorter
+    reclaim_idle = 600
+    max_deliveries = 3
+
+    def __init__(self, redis: Redis):
+        self.redis = redis
+        self.stream_key = kvstore.anomaly_work_stream_key()
+
+    async def ensure_group(self):
+        try:
+            await self.redis.xgroup_create(self.stream_key, GROUP, latest_id="0", mkstream=True)
+        except aioredis.ReplyError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+    async def enqueue(self, app_id, metric_name, kind) -> bool:
+        """Adds an item unless the previous one of the processor is not acked yet"""
+        queued = await self.redis.set(
+            kvstore.anomaly_work_queued_key(app_id=app_id, metric_name=metric_name, kind=kind),
+            time.time(),
+            expire=self.reclaim_idle * (self.max_deliveries + 1),
+            exist=self.redis.SET_IF_NOT_EXIST,
+        )
+        if not queued:
+            return False
+        await self.redis.xadd(
+            self.stream_key,
+            {"app_id": app_id, "metric_name": metric_name, "kind": kind},
+            max_len=self.stream_len,
+        )
+        return True
+
+    async def read(self, consumer, timeout=5000) -> List[Tuple[bytes, Dict[bytes, bytes]]]:
+        entries = await self.redis.xread_group(
+            GROUP, consumer, [self.stream_key], timeout=timeout, count=1, latest_ids=[">"]
+        )
+        return [(entry_id, fields) for _, entry_id, fields in entries]
+
+    async def reclaim(self, consumer) -> List[Tuple[bytes, Dict[bytes, bytes]]]:
+        pending = await self.redis.xpending(self.stream_key, GROUP, "-", "+", 10)
+        stale = [
+            (entry_id, deliveries)
+            for entry_id, _, idle, deliveries in pending
+            if idle >= self.reclaim_idle * 1000
+        ]
+        if not stale:
+            return []
+        claimed = await self.redis.xclaim(
+            self.stream_key,
+            GROUP,
+            consumer,
+            self.reclaim_idle * 1000,
+            *[entry_id for entry_id, _ in stale],
+        )
+        deliveries = dict(stale)
+        entries = []
+        for entry_id, fields in claimed:
+            if fields is None:
+                continue
+            if deliveries.get(entry_id, 0) >= self.max_deliveries:
+                print(f"Dropping work item {entry_id}: delivered {deliveries[entry_id]} times")
+                await self.ack(entry_id, fields)
+                continue
+            entries.append((entry_id, fields))
+        return entries
+
+    async def ack(self, entry_id, fields: Dict[bytes, bytes]):
+        await self.redis.xack(self.stream_key, GROUP, entry_id)
+        await self.redis.delete(
+            kvstore.anomaly_work_queued_key(
+                app_id=fields[b"app_id"].decode(),
+                metric_name=fields[b"metric_name"].decode(),
+                kind=fields[b"kind"].decode(),
+            )
+        )
+
+
+class WorkScheduler:
+    """Enqueues work items of registered processors when they are due"""
+
+    tick = 1
+
+    def __init__(self, queue: WorkQueue):
+        self.queue = queue
+        # (app_id, metric_name, kind) -> next due time
+        self.due: Dict[Tuple[str, str, str], float] = dict()
+
+    def register(self, app_id, metric_name):
+        for kind in METRIC_PROCESSORS[metric_name]:
+            self.due.setdefault((app_id, metric_name, kind), 0)
+
+    def unregister(self, app_id, metric_name=None):
+        for key in list(self.due):
+            if key[0] == app_id and metric_name in (None, key[1]):
+                del self.due[key]
+
+    async def save(self, app_id):
+        """Persists registrations of the app, call after register/unregister"""
+        key = kvstore.anomaly_registrations_key()
+        metric_names = self.registered(app_id).get(app_id)
+        if metric_names:
+            await self.queue.redis.hset(key, app_id, orjson.dumps(metric_names))
+        else:
+            await self.queue.redis.hdel(key, app_id)
+
+    async def restore(self):
+        registrations = await load_registrations(self.queue.redis)
+        for app_id, metric_names in registrations.items():
+            for metric_name in metric_names:
+                if metric_name in METRIC_PROCESSORS:
+                    self.register(app_id, metric_name)
+        print(f"Restored registrations of {len(registrations)} apps")
+
+    def registered(self, app_id=None) -> Dict[str, List[str]]:
+        ret = dict()
+        for registered_app_id, metric_name, _ in self.due:
+            if app_id in (None, registered_app_id):
+                ret.setdefault(registered_app_id, [])
+                if metric_name not in ret[registered_app_id]:
+                    ret[registered_app_id].append(metric_name)
+        return ret
+
+    async def loop_schedule(self):
+        try:
+            await self.queue.ensure_group()
+            while True:
+                await self.schedule()
+                await asyncio.sleep(self.tick)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            traceback.print_exc()
+            raise
+
+    async def schedule(self):
+        now = time.time()
+        for key, due in list(self.due.items()):
+            if due > now:
+                continue
+            app_id, metric_name, kind = key
+            await self.queue.enqueue(app_id, metric_name, kind)
+            _, interval = METRIC_PROCESSORS[metric_name][kind]
+            if key in self.due:
+                self.due[key] = now + interval
+
+
+class Worker:
+    # Backoff after a failed round, doubled up to the max while rounds fail
+    error_delay = 1
+    max_error_delay = 60
+
+    def __init__(self, redis: Redis, consumer=None):
+        self.queue = WorkQueue(redis)
+        self.redis = redis
+        self.consumer = consumer or f"{socket.gethostname()}:{os.getpid()}"
+        # Processors keep loaded models between items
+        self.processors: Dict[Tuple[str, str, str], SequentialJobsProcessor] = dict()
+        self._group_ready = False
+
+    def get_processor(self, app_id, metric_name, kind) -> Optional[SequentialJobsProcessor]:
+        key = (app_id, metric_name, kind)
+        if key not in self.processors:
+            try:
+                factory, _ = METRIC_PROCESSORS[metric_name][kind]
+            except KeyError:
+                return None
+            self.processors[key] = factory(app_id)
+        return self.processors[key]
+
+    async def warm_up(self):
+        """Loads models of registered apps, so first items do not wait for them"""
+        try:
+            registrations = await load_registrations(self.redis)
+            for app_id, metric_names in registrations.items():
+                for metric_name in metric_names:
+                    for kind in METRIC_PROCESSORS.get(metric_name, {}):
+                        processor = self.get_processor(app_id, metric_name, kind)
+                        await processor.warm_up(self.redis)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            print("Warming up models failed")
+            traceback.print_exc()
+
+    async def loop_work(self):
+        print(f"Worker {self.consumer} started")
+        asyncio.create_task(self.warm_up())
+        delay = self.error_delay
+        while True:
+            try:
+                await self.work()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Unacked item stays pending and is reclaimed later
+                print(f"Worker {self.consumer} failed, retrying in {delay} s")
+                traceback.print_exc()
+                # Group is created again if the stream was lost
+                self._group_ready = False
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_error_delay)
+            else:
+                delay = self.error_delay
+
+    async def work(self):
+        """Runs reclaimed items or, without them, the next new one"""
+        if not self._group_ready:
+            await self.queue.ensure_group()
+            self._group_ready = True
+        entries = await self.queue.reclaim(self.consumer)
+        if not entries:
+            entries = await self.queue.read(self.consumer)
+        for entry_id, fields in entries:
+            await self.execute(entry_id, fields)
+
+    async def execute(self, entry_id, fields: Dict[bytes, bytes]):
+        app_id = fields[b"app_id"].decode()
+        metric_name = fields[b"metric_name"].decode()
+        kind = fields[b"kind"].decode()
+        processor = self.get_processor(app_id, metric_name, kind)
+        try:
+            if processor is None:
+                print(f"Unknown work item {fields}")
+            else:
+                await processor.process_iteration(self.redis)
+        except Exception:
+            # Failed items are not retried here, scheduler enqueues the next one
+            print(f"Work item {entry_id} {fields} failed")
+            traceback.print_exc()
+        await self.queue.ack(entry_id, fields)
+
+
+async def load_registrations(redis: Redis) -> Dict[str, List[str]]:
+    return {
+        app_id.decode(): orjson.loads(metric_names)
+        for app_id, metric_names in (
+            await redis.hgetall(kvstore.anomaly_registrations_key())
+        ).items()
+    }
+
+
+async def run_worker():
+    redis = await db.connect_with_redis()
+    await Worker(redis).loop_work()
+
+
+def worker_process():
+    asyncio.run(run_worker())
+
+
+def start(workers=1):
+    processes = [
+        multiprocessing.Process(target=worker_process, name=f"anomaly-worker-{idx}")
+        for idx in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
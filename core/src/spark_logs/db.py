@@ -2,19 +2,61 @@ import aioredis
 import graphitesend
 
 from spark_logs.config import DEFAULT_CONFIG
+from spark_logs.instrumentation import InstrumentedRedis, InstrumentedGraphite, STREAM_GAPS
 
 
 async def connect_with_redis() -> aioredis.Redis:
+    """Pool of a service, created once and passed to its loaders and processors"""
     redis_host = DEFAULT_CONFIG["redis_host"]
     redis_port = DEFAULT_CONFIG["redis_port"]
-    return await aioredis.create_redis_pool(f"redis://{redis_host}:{redis_port}")
+    return InstrumentedRedis(
+        await aioredis.create_redis_pool(
+            f"redis://{redis_host}:{redis_port}",
+            minsize=DEFAULT_CONFIG.get("redis_pool_minsize") or 1,
+            maxsize=DEFAULT_CONFIG.get("redis_pool_maxsize") or 10,
+        )
+    )
 
 
 def connect_with_graphtie(prefix) -> graphitesend.GraphiteClient:
-    return graphitesend.GraphiteClient(
-        graphite_server=DEFAULT_CONFIG["graphite_host"],
-        graphite_port=DEFAULT_CONFIG["graphite_port"],
-        system_name="",
-        prefix=prefix,
-        autoreconnect=True,
+    return InstrumentedGraphite(
+        graphitesend.GraphiteClient(
+            graphite_server=DEFAULT_CONFIG["graphite_host"],
+            graphite_port=DEFAULT_CONFIG["graphite_port"],
+            system_name="",
+            prefix=prefix,
+            autoreconnect=True,
+        )
     )
+
+
+def next_stream_id(message_id) -> str:
+    """Smallest stream id after `message_id`, for exclusive XRANGE"""
+    if isinstance(message_id, bytes):
+        message_id = message_id.decode()
+    timestamp, sequence = message_id.split("-")
+    return f"{timestamp}-{int(sequence) + 1}"
+
+
+async def read_stream_after(redis, stream_key, watermark, count, *, reader):
+    """Up to `count` entries after `watermark`, all entries without a watermark.
+
+    Capped streams are trimmed from the oldest entries, a reader behind by
+    more than the cap loses the trimmed ones. Reading from the watermark
+    itself tells it apart: when the watermark entry is gone, the gap is
+    reported and reading continues from the oldest kept entry.
+    """
+    if watermark is None:
+        return await redis.xrange(stream_key, count=count)
+    if isinstance(watermark, str):
+        watermark = watermark.encode()
+    entries = await redis.xrange(stream_key, start=watermark, count=count + 1)
+    if entries and entries[0][0] == watermark:
+        return entries[1:]
+    if entries:
+        print(
+            f"{reader}: {stream_key} is trimmed past watermark {watermark.decode()}, "
+            f"entries up to {entries[0][0].decode()} are skipped"
+        )
+        STREAM_GAPS.labels(processor=reader).inc()
+    return entries[:count]
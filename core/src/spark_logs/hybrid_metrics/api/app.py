@@ -1,12 +1,20 @@
 import asyncio
 from collections import defaultdict
+from functools import partial
 
 import aiohttp
+import orjson
 from aiohttp import http_exceptions
 from aiohttp import web
 
-from spark_logs import db
-from spark_logs.hybrid_metrics import skewness_score
+from spark_logs import db, kvstore, instrumentation, tracing, profiling
+from spark_logs.hybrid_metrics import (
+    skewness_score,
+    spill_ratio,
+    gc_ratio,
+    locality_miss_rate,
+)
+from spark_logs.hybrid_metrics.engine import HybridMetricsEngine
 from spark_logs.task_tools import task_status
 
 routes = web.RouteTableDef()
@@ -20,12 +28,12 @@ async def hello(request):
 @routes.get("/client/ls")
 async def ls_tasks(request: aiohttp.web.Request):
     app = request.app
-    running_processors = app["APP_METRICS"]
+    running_engines = app["APP_METRICS"]
     ret = defaultdict(dict)
-    for app_id, app_processor in running_processors.items():
-        for metric_name, processor in app_processor.items():
-            ret[app_id][metric_name] = {"task": task_status((processor["task"]))}
-        return web.json_response({"applications": ret})
+    for app_id, app_engine in running_engines.items():
+        for metric_name in app_engine["engine"].strategies:
+            ret[app_id][metric_name] = {"task": task_status(app_engine["task"])}
+    return web.json_response({"applications": ret})
 
 
 @routes.post("/metric/create")
@@ -37,14 +45,9 @@ async def client_for_app(request: aiohttp.web.Request):
         processor = app["METRIC_PROCESSORS"][metric_name]()
     except KeyError as exc:
         raise http_exceptions.HttpBadRequest("No key " + str(exc))
-    redis = app["REDIS"]
-    task = asyncio.create_task(processor.loop_app_apply(redis, app["GRAPHITE"], app_id))
-
-    app["APP_METRICS"][app_id][metric_name] = {
-        "processor": processor,
-        "task": task,
-    }
 
+    register_metric(app, app_id, metric_name, processor)
+    await save_registrations(app, app_id)
     return aiohttp.web.json_response({"status": "created new processor"})
 
 
@@ -57,12 +60,15 @@ async def rm_metric_for_app(request: aiohttp.web.Request):
     except KeyError as exc:
         raise http_exceptions.HttpBadRequest("No key " + str(exc))
 
-    data = app["APP_METRICS"].get(app_id, {}).get(metric_name)
-    if data is None:
+    app_engine = app["APP_METRICS"].get(app_id)
+    if app_engine is None or metric_name not in app_engine["engine"].strategies:
         return aiohttp.web.json_response({"error": "Processor not found"})
 
-    data["task"].cancel()
-    del app["APP_METRICS"][app_id][metric_name]
+    app_engine["engine"].unregister(metric_name)
+    if not app_engine["engine"].strategies:
+        app_engine["task"].cancel()
+        del app["APP_METRICS"][app_id]
+    await save_registrations(app, app_id)
     return aiohttp.web.json_response({"status": "Deleted processor"})
 
 
@@ -74,30 +80,78 @@ async def rm_metrics_for_app(request: aiohttp.web.Request):
     except KeyError as exc:
         raise http_exceptions.HttpBadRequest("No key " + str(exc))
 
-    data = app["APP_METRICS"].get(app_id)
-    if data is None:
+    app_engine = app["APP_METRICS"].get(app_id)
+    if app_engine is None:
         return aiohttp.web.json_response({"error": "App not found"})
 
-    keys_to_delete = set()
-    for key, item in data.items():
-        item["task"].cancel()
-        keys_to_delete.add(key)
-    for k in keys_to_delete:
-        del data[k]
+    app_engine["task"].cancel()
+    del app["APP_METRICS"][app_id]
+    await save_registrations(app, app_id)
     return aiohttp.web.json_response({"status": f"Deleted processors for {app_id}"})
 
 
+def register_metric(app, app_id, metric_name, processor):
+    # One engine per app, it reads every job once for all its metrics
+    app_engine = app["APP_METRICS"].get(app_id)
+    if app_engine is None:
+        engine = HybridMetricsEngine(app_id)
+        task = asyncio.create_task(engine.loop_apply(app["REDIS"], app["GRAPHITE"]))
+        app_engine = app["APP_METRICS"][app_id] = {"engine": engine, "task": task}
+    app_engine["engine"].register(metric_name, processor)
+
+
+async def save_registrations(app, app_id):
+    key = kvstore.hybrid_metrics_registrations_key()
+    app_engine = app["APP_METRICS"].get(app_id)
+    if app_engine is None:
+        await app["REDIS"].hdel(key, app_id)
+    else:
+        metric_names = list(app_engine["engine"].strategies)
+        await app["REDIS"].hset(key, app_id, orjson.dumps(metric_names))
+
+
 async def create_redis_connection(app):
     app["REDIS"] = await db.connect_with_redis()
     app["GRAPHITE"] = db.connect_with_graphtie("hybrid_metrics")
 
 
+async def restore_registrations(app):
+    """Engines continue from their watermarks after a restart"""
+    registrations = await app["REDIS"].hgetall(kvstore.hybrid_metrics_registrations_key())
+    for app_id, metric_names in registrations.items():
+        for metric_name in orjson.loads(metric_names):
+            if metric_name in app["METRIC_PROCESSORS"]:
+                processor = app["METRIC_PROCESSORS"][metric_name]()
+                register_metric(app, app_id.decode(), metric_name, processor)
+    print(f"Restored metrics of {len(registrations)} apps")
+
+
+async def stop_engines(app):
+    for app_engine in app["APP_METRICS"].values():
+        app_engine["task"].cancel()
+
+
 def start():
     app = aiohttp.web.Application(middlewares=[aiohttp.web.normalize_path_middleware()])
     app["METRIC_PROCESSORS"] = {
         "skewness_score": skewness_score.SkewDetectStrategy,
+        "skewness_gini": partial(skewness_score.SkewDetectStrategy, score="gini"),
+        "skewness_quantile_ratio": partial(
+            skewness_score.SkewDetectStrategy, score="quantile_ratio"
+        ),
+        "skewness_mad": partial(skewness_score.SkewDetectStrategy, score="mad"),
+        "spill_ratio": spill_ratio.SpillRatioStrategy,
+        "gc_ratio": gc_ratio.GcRatioStrategy,
+        "locality_miss_rate": locality_miss_rate.LocalityMissRateStrategy,
     }
-    app["APP_METRICS"] = defaultdict(dict)
+    app["APP_METRICS"] = dict()
     app.router.add_routes(routes)
+    app.router.add_routes(instrumentation.routes)
+    app.router.add_routes(tracing.routes)
+    app.router.add_routes(profiling.routes)
+    app.on_startup.append(profiling.start_loop_monitor)
+    app.on_cleanup.append(profiling.stop_loop_monitor)
     app.on_startup.append(create_redis_connection)
+    app.on_startup.append(restore_registrations)
+    app.on_cleanup.append(stop_engines)
     aiohttp.web.run_app(app, port=10111)
@@ -0,0 +1,156 @@
+import asyncio
+import itertools
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from aioredis import Redis
+from graphitesend import GraphiteClient
+
+from spark_logs import db, kvstore
+from spark_logs.hybrid_metrics.abc import HybridMetricStrategy
+from spark_logs.instrumentation import (
+    PROCESSOR_ITERATION,
+    PROCESSOR_LAG,
+    count_round_trips,
+    report_lag,
+)
+from spark_logs.tracing import span
+from spark_logs.types import JobStages
+
+
+class HybridMetricsEngine:
+    """Evaluates all registered strategies of an app in one pass over new jobs.
+
+    Every job is read from redis and decoded once, its job group is resolved
+    once, and then it is handed to each strategy. Adding a strategy adds only
+    its own compute.
+    """
+
+    name = "hybrid_metrics"
+    batch = 50
+    timeout = 10
+    job_group_grace_period = 300
+    deferred_jobs_limit = 500
+
+    def __init__(self, app_id, strategies: Optional[Dict[str, HybridMetricStrategy]] = None):
+        self.app_id = app_id
+        self.strategies: Dict[str, HybridMetricStrategy] = dict(strategies or {})
+
+    def register(self, metric_name, strategy: HybridMetricStrategy):
+        self.strategies[metric_name] = strategy
+
+    def unregister(self, metric_name):
+        del self.strategies[metric_name]
+
+    async def loop_apply(self, redis: Redis, graphite: GraphiteClient):
+        try:
+            while True:
+                with PROCESSOR_ITERATION.labels(processor=self.name).time(), span(
+                    "hybrid_metrics.batch", root=True, app_id=self.app_id
+                ), count_round_trips(self.name):
+                    processed = await self.apply_batch(redis, graphite)
+                # Full batch means there is a backlog, catch up without waiting
+                if processed < self.batch:
+                    await asyncio.sleep(self.timeout)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            import traceback
+
+            traceback.print_exc()
+            raise
+
+    async def apply_batch(self, redis: Redis, graphite: GraphiteClient) -> int:
+        """Applies strategies to the next batch of completed jobs after the watermark.
+
+        Watermark is the last processed entry of the app completed jobs stream,
+        it moves only after results are sent. Graphite overwrites a datapoint with
+        the same key and timestamp, so a batch repeated after a crash is harmless.
+        Jobs waiting for their job group are deferred and retried with the next
+        batches, the jobs after them are not held back.
+        """
+        if not self.strategies:
+            return 0
+        watermark_key = kvstore.hybrid_metrics_watermark_key(app_id=self.app_id)
+        deferred_key = kvstore.processor_deferred_jobs_key(
+            app_id=self.app_id, processor_id=self.name
+        )
+        watermark = await redis.get(watermark_key)
+        stream_key = kvstore.completed_jobs_stream_key(app_id=self.app_id)
+        entries = await db.read_stream_after(
+            redis, stream_key, watermark, self.batch, reader=self.name
+        )
+        deferred_ids = [int(x) for x in await redis.zrange(deferred_key)]
+        lag = PROCESSOR_LAG.labels(processor=self.name, app_id=self.app_id)
+        job_ids = [int(fields[b"job_id"]) for _, fields in entries]
+        if not entries and not deferred_ids:
+            lag.set(0)
+            return 0
+
+        # Deferred jobs first, they completed before the new ones
+        to_apply = deferred_ids + [x for x in job_ids if x not in deferred_ids]
+        pipeline = redis.pipeline()
+        for job_id in to_apply:
+            pipeline.zrangebyscore(
+                kvstore.sequential_jobs_key(app_id=self.app_id), min=job_id, max=job_id
+            )
+        data = await pipeline.execute()
+
+        waiting = []
+        for job_id, job_raw in zip(to_apply, data):
+            if not job_raw:
+                continue
+            with span("decode"):
+                job_data = JobStages.from_json(job_raw[0])
+            job_group_alias = await self.resolve_job_group(job_data, redis)
+            if job_group_alias is None and self.wait_for_job_group(job_data):
+                waiting.append(job_id)
+            elif job_group_alias is None:
+                print(f"No job group for job {job_data.job.jobId}, skipped")
+            else:
+                self.apply_strategies(graphite, job_data, job_group_alias.decode())
+
+        transaction = redis.multi_exec()
+        if entries:
+            transaction.set(watermark_key, entries[-1][0])
+        if deferred_ids:
+            transaction.zrem(deferred_key, *deferred_ids)
+        if waiting:
+            transaction.zadd(deferred_key, *itertools.chain.from_iterable((x, x) for x in waiting))
+            # Oldest deferred jobs are given up first
+            transaction.zremrangebyrank(deferred_key, 0, -self.deferred_jobs_limit - 1)
+        await transaction.execute()
+
+        if not entries:
+            lag.set(0)
+            return 0
+        [(_, newest)] = await redis.xrevrange(stream_key, count=1)
+        report_lag(self.name, self.app_id, [int(newest[b"job_id"])], [job_ids[-1]])
+        return len(entries)
+
+    def apply_strategies(self, graphite: GraphiteClient, job_data: JobStages, job_group_alias):
+        for metric_name, strategy in list(self.strategies.items()):
+            try:
+                with span("hybrid_metrics.strategy", metric=metric_name):
+                    test_results = strategy.apply_job(job_data)
+            except Exception:
+                import traceback
+
+                print(f"Strategy {metric_name} failed on job {job_data.job.jobId}")
+                traceback.print_exc()
+                continue
+            for stage_id, test_result in test_results.items():
+                strategy.write_stage_test(
+                    graphite, self.app_id, test_result, job_data.job.completionTime, job_group_alias
+                )
+
+    def wait_for_job_group(self, job_data: JobStages) -> bool:
+        """Job groups are named by anomaly detection, give it time to catch up"""
+        age = datetime.now(timezone.utc) - job_data.job.completionTime
+        return age.total_seconds() < self.job_group_grace_period
+
+    async def resolve_job_group(self, job_data: JobStages, redis: Redis):
+        job_group_raw_key = ",".join(sorted([str(s.stage.numTasks) for s in job_data.stages.values()]))
+        return await redis.get(
+            kvstore.job_group_hashes_key(app_id=self.app_id, group_hash=job_group_raw_key)
+        )
@@ -0,0 +1,18 @@
+from spark_logs.hybrid_metrics.abc import HybridMetricStrategy
+from spark_logs.types import StageTasks
+
+
+class GcRatioStrategy(HybridMetricStrategy):
+    """Share of executor run time spent in JVM garbage collection"""
+
+    test_name = "gc_ratio"
+
+    def apply(self, stage_and_tasks: StageTasks) -> float:
+        gc_time, run_time = 0, 0
+        for task in stage_and_tasks.tasks.values():
+            task_metrics = task.taskMetrics or {}
+            gc_time += task_metrics.get("jvmGcTime", 0)
+            run_time += task_metrics.get("executorRunTime", 0)
+        if run_time == 0:
+            return 0.0
+        return gc_time / run_time
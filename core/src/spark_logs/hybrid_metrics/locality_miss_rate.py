@@ -0,0 +1,18 @@
+from spark_logs.hybrid_metrics.abc import HybridMetricStrategy
+from spark_logs.types import StageTasks
+
+
+class LocalityMissRateStrategy(HybridMetricStrategy):
+    """Share of tasks that had to read their data from another node"""
+
+    test_name = "locality_miss_rate"
+    local_levels = ("PROCESS_LOCAL", "NODE_LOCAL", "NO_PREF")
+
+    def apply(self, stage_and_tasks: StageTasks) -> float:
+        tasks = stage_and_tasks.tasks
+        if not tasks:
+            return 0.0
+        misses = sum(
+            1 for task in tasks.values() if task.taskLocality not in self.local_levels
+        )
+        return misses / len(tasks)
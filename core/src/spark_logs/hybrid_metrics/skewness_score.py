@@ -1,59 +1,148 @@
-from typing import Dict, Any
+from typing import Dict, List, Tuple
 
 from spark_logs.hybrid_metrics.abc import HybridMetricStrategy
-import pandas as pd
 import numpy as np
 
-from spark_logs.types import StageTasks, Task
+from spark_logs.types import StageTasks, JobStages
+
+
+def segment_bounds(lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    starts = np.cumsum(lengths) - lengths
+    segment_ids = np.repeat(np.arange(len(lengths)), lengths)
+    return starts, segment_ids
+
+
+def sort_segments(values: np.ndarray, segment_ids: np.ndarray) -> np.ndarray:
+    return values[np.lexsort((values, segment_ids))]
+
+
+def segment_quantile(sorted_values, starts, lengths, q) -> np.ndarray:
+    """Linear interpolated quantile of every segment, like np.quantile"""
+    position = q * (lengths - 1)
+    lower = np.floor(position).astype(int)
+    upper = np.ceil(position).astype(int)
+    fraction = position - lower
+    return (
+        sorted_values[starts + lower] * (1 - fraction)
+        + sorted_values[starts + upper] * fraction
+    )
+
+
+def max_mean_score(values, lengths) -> np.ndarray:
+    """Distance from the slowest task to the mean in units of 3 std"""
+    starts, segment_ids = segment_bounds(lengths)
+    means = np.add.reduceat(values, starts) / lengths
+    maxs = np.maximum.reduceat(values, starts)
+    stds = np.sqrt(
+        np.add.reduceat((values - means[segment_ids]) ** 2, starts) / lengths
+    )
+    return safe_divide(maxs - means, stds * 3)
+
+
+def gini_score(values, lengths) -> np.ndarray:
+    """Gini coefficient of task values: 0 is uniform, 1 is a single straggler"""
+    starts, segment_ids = segment_bounds(lengths)
+    sorted_values = sort_segments(values, segment_ids)
+    ranks = np.arange(len(values)) - starts[segment_ids] + 1
+    weighted = np.add.reduceat(
+        (2 * ranks - lengths[segment_ids] - 1) * sorted_values, starts
+    )
+    return safe_divide(weighted, lengths * np.add.reduceat(sorted_values, starts))
+
+
+def quantile_ratio_score(values, lengths, q=0.95) -> np.ndarray:
+    """How many times the upper quantile task is slower than the median one"""
+    starts, segment_ids = segment_bounds(lengths)
+    sorted_values = sort_segments(values, segment_ids)
+    return safe_divide(
+        segment_quantile(sorted_values, starts, lengths, q),
+        segment_quantile(sorted_values, starts, lengths, 0.5),
+    )
+
+
+def mad_score(values, lengths) -> np.ndarray:
+    """Robust version of max_mean_score: median and MAD instead of mean and std"""
+    starts, segment_ids = segment_bounds(lengths)
+    sorted_values = sort_segments(values, segment_ids)
+    medians = segment_quantile(sorted_values, starts, lengths, 0.5)
+    deviations = sort_segments(np.abs(values - medians[segment_ids]), segment_ids)
+    mads = segment_quantile(deviations, starts, lengths, 0.5) * 1.4826
+    maxs = np.maximum.reduceat(values, starts)
+    return safe_divide(maxs - medians, mads * 3)
+
+
+def safe_divide(numerator, denominator) -> np.ndarray:
+    result = np.zeros_like(numerator, dtype=float)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
 
 
 class SkewDetectStrategy(HybridMetricStrategy):
     metrics = ("duration",)
-    test_name = "skewness_score"
+    scores = {
+        "max_mean": max_mean_score,
+        "gini": gini_score,
+        "quantile_ratio": quantile_ratio_score,
+        "mad": mad_score,
+    }
+
+    def __init__(self, score="max_mean"):
+        if score not in self.scores:
+            raise ValueError(f"Unknown skewness score {score}")
+        self.score = score
+
+    @property
+    def test_name(self):
+        if self.score == "max_mean":
+            return "skewness_score"
+        return f"skewness_{self.score}"
 
     def apply(self, stage_and_tasks: StageTasks) -> float:
-        tasks = stage_and_tasks.tasks
-        tasks_shuffle_metrics = self.get_stage_shuffle_metrics(tasks)
+        return float(self.apply_stages([stage_and_tasks])[0])
+
+    def apply_job(self, job_data: JobStages) -> Dict[str, float]:
+        stage_ids = list(job_data.stages.keys())
+        scores = self.apply_stages([job_data.stages[s] for s in stage_ids])
+        return dict(zip(stage_ids, scores.tolist()))
+
+    def apply_stages(self, stages: List[StageTasks]) -> np.ndarray:
+        """Scores all stages at once, averaged over metrics"""
         scores = [
-            self.skew_test(tasks_shuffle_metrics[metric].values)
+            self.skew_test(*self.get_stage_metric_columns(stages, metric))
             for metric in self.metrics
         ]
-        return float(np.mean(scores))
-
-    def get_stage_shuffle_metrics(self, tasks: Dict[str, Task]):
-        tasks_shuffle_features = {
-            task_data.taskId: {
-                **{metric: getattr(task_data, metric) for metric in self.metrics},
-            }
-            for task_data in tasks.values()
-        }
-
-        for task_id, shuffle_data in tasks_shuffle_features.items():
-            colnames = shuffle_data.keys()
-            break
-        else:
-            raise ValueError("No task data")
-
-        return pd.DataFrame.from_dict(
-            {k: v.values() for k, v in tasks_shuffle_features.items()},
-            orient="index",
-            columns=colnames,
-        )
+        return np.mean(scores, axis=0)
 
-    def skew_test(self, arr: np.ndarray):
-        assert len(arr.shape) == 1
+    def get_stage_metric_columns(
+        self, stages: List[StageTasks], metric
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """All stages task values concatenated into one array plus stage lengths"""
+        columns = []
+        for stage_and_tasks in stages:
+            stage_values = [
+                getattr(task, metric) for task in stage_and_tasks.tasks.values()
+            ]
+            columns.append(
+                np.fromiter(
+                    (v for v in stage_values if v is not None),
+                    dtype=float,
+                )
+            )
+        lengths = np.fromiter((len(c) for c in columns), dtype=int, count=len(columns))
+        values = np.concatenate(columns) if columns else np.empty(0)
+        return values, lengths
 
-        if arr.shape[0] == 1:
-            return False
-
-        # sorted_arr = np.sort(arr)
-        # shifted = np.array(arr[1:])
-        # diffs = shifted - sorted_arr[:-1]
-        # diffs_normalized = diffs / np.linalg.norm(diffs)
-        #
-        # actual_quantile_deviation = np.max(diffs_normalized)
-        # return actual_quantile_deviation
-
-        std = arr.std()
-        return (arr.max() - arr.mean()) / (std * 3)
+    def skew_test(self, values: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """Stage with less than two tasks cannot be skewed and scores 0"""
+        assert len(values.shape) == 1
+        result = np.zeros(len(lengths), dtype=float)
+        comparable = lengths > 1
+        if not comparable.any():
+            return result
 
+        # reduceat does not support empty segments, so drop short stages first
+        keep = np.repeat(comparable, lengths)
+        result[comparable] = self.scores[self.score](
+            values[keep], lengths[comparable]
+        )
+        return result
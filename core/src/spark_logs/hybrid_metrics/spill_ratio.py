@@ -0,0 +1,15 @@
+from spark_logs.hybrid_metrics.abc import HybridMetricStrategy
+from spark_logs.types import StageTasks
+
+
+class SpillRatioStrategy(HybridMetricStrategy):
+    """Bytes spilled to disk per byte read by the stage"""
+
+    test_name = "spill_ratio"
+
+    def apply(self, stage_and_tasks: StageTasks) -> float:
+        stage = stage_and_tasks.stage
+        bytes_read = stage.inputBytes + stage.shuffleReadBytes
+        if bytes_read == 0:
+            return 0.0
+        return stage.diskBytesSpilled / bytes_read
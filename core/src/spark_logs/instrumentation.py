@@ -0,0 +1,233 @@
+"""Prometheus metrics shared by the backend services.
+
+Every service adds `routes` to its aiohttp app to expose `/metrics`.
+"""
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from aiohttp import web
+from prometheus_client import (
+    Counter,
+    Gauge,
+    Histogram,
+    CONTENT_TYPE_LATEST,
+    generate_latest,
+)
+
+from spark_logs.tracing import span
+
+FETCH_LATENCY = Histogram(
+    "luxmeter_fetch_seconds",
+    "Spark REST API request latency, from request to the whole body read",
+    ["node"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+FETCH_BYTES = Counter(
+    "luxmeter_fetch_bytes", "Bytes received from Spark REST API", ["node"]
+)
+STAGE_CACHE_REQUESTS = Counter(
+    "luxmeter_stage_cache_requests",
+    "Loader lookups of completed stages of running jobs",
+    ["result"],
+)
+PARSE_TIME = Histogram(
+    "luxmeter_parse_seconds", "Time to parse a Spark REST API response", ["node"]
+)
+REDIS_LATENCY = Histogram(
+    "luxmeter_redis_seconds",
+    "Redis command latency, multi_exec and pipeline are timed as a whole",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+GRAPHITE_PENDING = Gauge(
+    "luxmeter_graphite_pending_datapoints", "Datapoints being sent to graphite"
+)
+GRAPHITE_SENT = Counter(
+    "luxmeter_graphite_datapoints", "Datapoints sent to graphite"
+)
+GRAPHITE_SEND_TIME = Histogram(
+    "luxmeter_graphite_send_seconds", "Time to send a batch of datapoints to graphite"
+)
+PROCESSOR_ITERATION = Histogram(
+    "luxmeter_processor_iteration_seconds",
+    "Duration of a processor iteration",
+    ["processor"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+PROCESSOR_LAG = Gauge(
+    "luxmeter_processor_lag_jobs",
+    "Newest stored job id minus newest processed job id, at least 0",
+    ["processor", "app_id"],
+)
+STREAM_GAPS = Counter(
+    "luxmeter_stream_gaps",
+    "Reads finding the watermark trimmed from the completed jobs stream",
+    ["processor"],
+)
+POLL_INTERVAL = Gauge(
+    "luxmeter_poll_interval_seconds",
+    "Time until the next loader round of an app",
+    ["app_id"],
+)
+PIPELINE_QUEUE = Gauge(
+    "luxmeter_loader_queue_items",
+    "Items waiting in a stage of a loader, see spark_logs.loaders.pipeline",
+    ["stage", "app_id"],
+)
+PIPELINE_MERGES = Counter(
+    "luxmeter_loader_queue_merges",
+    "Items a full loader stage merged into the next one",
+    ["stage"],
+)
+PIPELINE_WAIT = Histogram(
+    "luxmeter_loader_queue_wait_seconds",
+    "Time a loader step waited for room in the next stage",
+    ["stage"],
+    buckets=(0.001, 0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+BREAKER_OPENED = Counter(
+    "luxmeter_breaker_opened",
+    "Circuit breakers opened after failed requests, see spark_logs.loaders.breaker",
+    ["endpoint"],
+)
+BREAKER_REJECTED = Counter(
+    "luxmeter_breaker_rejected_requests",
+    "Requests not made while their circuit breaker was open",
+    ["endpoint"],
+)
+RETIRED_APPS = Counter(
+    "luxmeter_retired_apps", "Finished applications removed from loading"
+)
+REDIS_ROUND_TRIPS = Histogram(
+    "luxmeter_redis_round_trips",
+    "Redis round trips of a loader round or a processor iteration",
+    ["processor"],
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 250),
+)
+MODEL_FIT_TIME = Histogram(
+    "luxmeter_model_fit_seconds", "Anomaly model fit time", ["model"]
+)
+MODEL_PREDICT_TIME = Histogram(
+    "luxmeter_model_predict_seconds", "Anomaly model predict time", ["model"]
+)
+
+routes = web.RouteTableDef()
+
+
+@routes.get("/metrics")
+async def metrics(request):
+    return web.Response(
+        body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST}
+    )
+
+
+def report_lag(processor, app_id, stored_job_ids, processed_job_ids):
+    if not stored_job_ids:
+        return
+    newest_processed = max(processed_job_ids, default=min(stored_job_ids) - 1)
+    # Backfilled jobs are stored after newer ones, their ids can be lower
+    PROCESSOR_LAG.labels(processor=processor, app_id=app_id).set(
+        max(0, max(stored_job_ids) - newest_processed)
+    )
+
+
+# Round trips of the current round, see count_round_trips
+_round_trips: ContextVar[Optional[List[int]]] = ContextVar("round_trips", default=None)
+
+
+@contextmanager
+def count_round_trips(processor):
+    """Counts redis round trips made in the block, including its child tasks"""
+    counter = [0]
+    token = _round_trips.set(counter)
+    try:
+        yield counter
+    finally:
+        _round_trips.reset(token)
+        REDIS_ROUND_TRIPS.labels(processor=processor).observe(counter[0])
+
+
+async def observe_redis(command, result, started):
+    counter = _round_trips.get()
+    if counter is not None:
+        counter[0] += 1
+    try:
+        with span("redis", command=command):
+            return await result
+    finally:
+        REDIS_LATENCY.labels(command=command).observe(time.perf_counter() - started)
+
+
+class InstrumentedTransaction:
+    def __init__(self, transaction, command):
+        self._transaction = transaction
+        self._command = command
+
+    def __getattr__(self, name):
+        return getattr(self._transaction, name)
+
+    def execute(self, *args, **kwargs):
+        started = time.perf_counter()
+        return observe_redis(
+            self._command, self._transaction.execute(*args, **kwargs), started
+        )
+
+
+class InstrumentedRedis:
+    """Proxy of an aioredis client that reports command latencies"""
+
+    transaction_factories = ("multi_exec", "pipeline")
+
+    def __init__(self, redis):
+        self._redis = redis
+
+    def __getattr__(self, name):
+        command = getattr(self._redis, name)
+        if not callable(command):
+            return command
+        if name in self.transaction_factories:
+            return lambda *a, **kw: InstrumentedTransaction(command(*a, **kw), name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            result = command(*args, **kwargs)
+            if not inspect.isawaitable(result):
+                return result
+            return observe_redis(name, result, started)
+
+        return timed
+
+
+class InstrumentedGraphite:
+    """Proxy of a graphitesend client that reports sent datapoints.
+
+    graphitesend writes to the socket synchronously, so pending datapoints
+    are the ones of a batch being sent at the moment.
+    """
+
+    def __init__(self, graphite):
+        self._graphite = graphite
+
+    def __getattr__(self, name):
+        return getattr(self._graphite, name)
+
+    @contextmanager
+    def _sending(self, datapoints):
+        GRAPHITE_PENDING.inc(datapoints)
+        try:
+            with GRAPHITE_SEND_TIME.time(), span("graphite.send", datapoints=datapoints):
+                yield
+            GRAPHITE_SENT.inc(datapoints)
+        finally:
+            GRAPHITE_PENDING.dec(datapoints)
+
+    def send(self, *args, **kwargs):
+        with self._sending(1):
+            return self._graphite.send(*args, **kwargs)
+
+    def send_dict(self, data, *args, **kwargs):
+        with self._sending(len(data)):
+            return self._graphite.send_dict(data, *args, **kwargs)
@@ -1,5 +1,31 @@
-def applications_key():
-    return "applications"
+DEFAULT_CLUSTER = "default"
+# Means nothing to Graphite paths, Redis keys and URLs, unlike "." and ":"
+CLUSTER_SEPARATOR = "~"
+
+
+def cluster_app_id(cluster, app_id):
+    """Id of an app in keys of all services, apps of the default cluster keep theirs"""
+    if cluster in (None, DEFAULT_CLUSTER):
+        return app_id
+    return f"{cluster}{CLUSTER_SEPARATOR}{app_id}"
+
+
+def split_cluster_app_id(app_id):
+    """Cluster name and YARN app id of an id made by cluster_app_id"""
+    cluster, sep, yarn_app_id = app_id.rpartition(CLUSTER_SEPARATOR)
+    if not sep:
+        return DEFAULT_CLUSTER, app_id
+    return cluster, yarn_app_id
+
+
+def clusters_key():
+    return "clusters"
+
+
+def applications_key(*, cluster=None):
+    if cluster in (None, DEFAULT_CLUSTER):
+        return "applications"
+    return f"applications:{cluster}"
 
 
 def sequential_jobs_key(*, app_id):
@@ -18,6 +44,14 @@ def job_group_hashes_key(*, app_id, group_hash):
     return f"job_group:{app_id}:{group_hash}"
 
 
+def stored_jobs_index_key(*, app_id):
+    return f"stored_jobs:{app_id}"
+
+
+def backfill_cursor_key(*, app_id):
+    return f"backfill_cursor:{app_id}"
+
+
 def loaded_jobs_key(*, app_id):
     return f"jobs_loaded:{app_id}"
 
@@ -30,5 +64,83 @@ def app_environment_key(*, app_id):
     return f"environment:{app_id}"
 
 
+def executors_key(*, app_id):
+    return f"executors:{app_id}"
+
+
+def executor_key(*, app_id, executor_id):
+    return f"executor:{app_id}:{executor_id}"
+
+
+def running_jobs_key(*, app_id):
+    return f"running_jobs:{app_id}"
+
+
 def maxline_key(*, app_id):
     return f"maxline:{app_id}"
+
+
+def executor_times_key(*, app_id):
+    return f"executor_times:{app_id}"
+
+
+def executor_times_jobs_key(*, app_id):
+    return f"executor_times_jobs:{app_id}"
+
+
+def executor_times_window_key(*, app_id):
+    return f"executor_times_window:{app_id}"
+
+
+def job_durations_key(*, app_id, group_hash=None):
+    if group_hash is None:
+        return f"job_durations:{app_id}"
+    return f"job_durations:{app_id}:{group_hash}"
+
+
+def job_durations_jobs_key(*, app_id):
+    return f"job_durations_jobs:{app_id}"
+
+
+def completed_jobs_stream_key(*, app_id):
+    return f"completed_jobs:{app_id}"
+
+
+def hybrid_metrics_watermark_key(*, app_id):
+    return f"hm_watermark:{app_id}"
+
+
+def hybrid_metrics_registrations_key():
+    return "hm_registrations"
+
+
+def loader_instances_key():
+    return "loader_instances"
+
+
+def loader_apps_key():
+    return "loader_apps"
+
+
+def loader_lease_key(*, app_id):
+    return f"loader_lease:{app_id}"
+
+
+def anomaly_work_stream_key():
+    return "anomaly_work"
+
+
+def anomaly_registrations_key():
+    return "anomaly_registrations"
+
+
+def anomaly_work_queued_key(*, app_id, metric_name, kind):
+    return f"anomaly_work_queued:{app_id}:{metric_name}:{kind}"
+
+
+def processor_watermark_key(*, app_id, processor_id):
+    return f"processor_watermark:{app_id}:{processor_id}"
+
+
+def processor_deferred_jobs_key(*, app_id, processor_id):
+    return f"processor_deferred:{app_id}:{processor_id}"
@@ -0,0 +1,172 @@
+import abc
+from collections import defaultdict
+from typing import Dict, Any
+
+import orjson
+from aioredis import Redis
+from aioredis.commands import MultiExec
+
+from spark_logs import kvstore
+from spark_logs.quantile_sketch import DDSketch
+from spark_logs.types import RawJobStages
+
+
+def executor_time_breakdown(task_metrics: Dict[str, Any]) -> Dict[str, float]:
+    """Splits task wall time into deserialization, gc, cpu and the rest"""
+    executors_des_time = task_metrics["executorDeserializeTime"] / 10 ** 6
+    executors_des_cpu_time = task_metrics["executorDeserializeCpuTime"] / 10 ** 9
+    executors_run_time = task_metrics["executorRunTime"] / 10 ** 6
+    executors_cpu_time = task_metrics["executorCpuTime"] / 10 ** 9
+    java_gc = task_metrics["jvmGcTime"] / 10 ** 6
+
+    return {
+        "executors_des_cpu_time": executors_des_cpu_time,
+        "executors_des_nocpu_time": executors_des_time - executors_des_cpu_time,
+        "java_gc": java_gc,
+        "executors_cpu_time": executors_cpu_time - executors_des_cpu_time - java_gc,
+        "executors_run_time": executors_run_time
+        - executors_cpu_time
+        - executors_des_time
+        + executors_des_cpu_time,
+    }
+
+
+class JobsAggregate(abc.ABC):
+    """Running aggregate updated by the loader for every stored completed job.
+
+    Aggregates may read with `redis`, writes are queued into `tr`, the
+    transaction of the loader round.
+    """
+
+    def __init__(self, app_id):
+        self.app_id = app_id
+
+    @abc.abstractmethod
+    async def add_jobs(self, redis: Redis, tr: MultiExec, jobs: Dict[str, RawJobStages]):
+        pass
+
+
+class ExecutorTimesAggregate(JobsAggregate):
+    """Per executor time breakdown summed over a sliding window of last jobs.
+
+    Sums are kept in one hash with `{metric}:{executor_id}` fields. Every job
+    contribution is stored next to them, so when a job leaves the window its
+    contribution is subtracted instead of recomputing the whole window.
+    """
+
+    def __init__(self, app_id, window=30):
+        super().__init__(app_id)
+        self.window = window
+
+    def job_contribution(self, job_data: RawJobStages) -> Dict[str, float]:
+        contribution = defaultdict(float)
+        for stage in job_data.stages.values():
+            for task in stage.tasks.values():
+                executor_id = task["executorId"]
+                if executor_id is None or "driver" in executor_id:
+                    continue
+                try:
+                    breakdown = executor_time_breakdown(task["taskMetrics"])
+                except (KeyError, TypeError):
+                    continue
+                for metric_name, value in breakdown.items():
+                    contribution[f"{metric_name}:{executor_id}"] += value
+        return contribution
+
+    async def add_jobs(self, redis: Redis, tr: MultiExec, jobs: Dict[str, RawJobStages]):
+        if not jobs:
+            return
+        sums_key = kvstore.executor_times_key(app_id=self.app_id)
+        jobs_key = kvstore.executor_times_jobs_key(app_id=self.app_id)
+        window_key = kvstore.executor_times_window_key(app_id=self.app_id)
+
+        job_ids = list(jobs.keys())
+        pipeline = redis.pipeline()
+        pipeline.hmget(jobs_key, *job_ids)
+        pipeline.zrange(window_key, 0, -1)
+        already_added, stored_window = await pipeline.execute()
+        new_ids = [job_id for job_id, added in zip(job_ids, already_added) if added is None]
+        stored_ids = {int(x) for x in stored_window}
+
+        # Jobs leaving the window are evicted in the same transaction
+        window = sorted(stored_ids | {int(job_id) for job_id in new_ids})
+        evicted = set(window[: max(len(window) - self.window, 0)])
+        deltas = defaultdict(float)
+        for job_id in new_ids:
+            if int(job_id) in evicted:
+                continue
+            contribution = self.job_contribution(jobs[job_id])
+            for field, value in contribution.items():
+                deltas[field] += value
+            tr.hset(jobs_key, job_id, orjson.dumps(contribution))
+            tr.zadd(window_key, int(job_id), job_id)
+
+        evicted_ids = sorted(evicted & stored_ids)
+        decremented = set()
+        if evicted_ids:
+            for raw in await redis.hmget(jobs_key, *evicted_ids):
+                if raw is None:
+                    continue
+                for field, value in orjson.loads(raw).items():
+                    deltas[field] -= value
+                    decremented.add(field)
+            tr.hdel(jobs_key, *evicted_ids)
+            tr.zrem(window_key, *evicted_ids)
+
+        for field, delta in deltas.items():
+            tr.hincrbyfloat(sums_key, field, delta)
+
+        # Executors that left the window would stay as float residue otherwise
+        if decremented:
+            fields = sorted(decremented)
+            current = await redis.hmget(sums_key, *fields)
+            exhausted = [
+                field
+                for field, value in zip(fields, current)
+                if abs(float(value or 0) + deltas[field]) < 1e-9
+            ]
+            if exhausted:
+                tr.hdel(sums_key, *exhausted)
+
+
+class JobDurationsAggregate(JobsAggregate):
+    """Job duration sketch over the whole app lifetime, per app and job group.
+
+    Sketch counts are only incremented, so durations of added jobs are stored
+    next to them and a job loaded again is not counted twice.
+    """
+
+    def __init__(self, app_id, relative_accuracy=0.01):
+        super().__init__(app_id)
+        self.relative_accuracy = relative_accuracy
+
+    async def add_jobs(self, redis: Redis, tr: MultiExec, jobs: Dict[str, RawJobStages]):
+        job_ids = [
+            job_id for job_id, job_data in jobs.items() if job_data.job.completionTime is not None
+        ]
+        if not job_ids:
+            return
+        jobs_key = kvstore.job_durations_jobs_key(app_id=self.app_id)
+        already_added = await redis.hmget(jobs_key, *job_ids)
+
+        sketches = defaultdict(lambda: DDSketch(self.relative_accuracy))
+        durations = dict()
+        for job_id, added in zip(job_ids, already_added):
+            if added is not None:
+                continue
+            job_data = jobs[job_id]
+            job = job_data.job
+            duration = (job.completionTime - job.submissionTime).total_seconds()
+            group_hash = ",".join(
+                sorted([str(s.stage.numTasks) for s in job_data.stages.values()])
+            )
+            sketches[kvstore.job_durations_key(app_id=self.app_id)].add(duration)
+            sketches[
+                kvstore.job_durations_key(app_id=self.app_id, group_hash=group_hash)
+            ].add(duration)
+            durations[job_id] = duration
+        if durations:
+            tr.hmset_dict(jobs_key, durations)
+        for key, sketch in sketches.items():
+            for field, count in sketch.to_fields().items():
+                tr.hincrby(key, field, count)
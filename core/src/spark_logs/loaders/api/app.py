@@ -1,5 +1,8 @@
 import asyncio
 import json
+from functools import partial
+from typing import Optional
+
 import aiohttp
 import graphitesend
 import orjson
@@ -7,10 +10,13 @@ from aiohttp import web
 from aiohttp.http_exceptions import HttpBadRequest
 from aioredis import Redis
 
-from spark_logs import db, kvstore
+from spark_logs import db, kvstore, instrumentation, tracing, profiling
 from spark_logs.config import DEFAULT_CONFIG
-from spark_logs.loaders import application_loader, clients
+from spark_logs.loaders import application_loader
 from spark_logs.loaders.application_loader import AppIdsLoader
+from spark_logs.loaders.clusters import Cluster, load_clusters
+from spark_logs.loaders.sharding import LoaderCoordinator
+from spark_logs.task_tools import task_status
 
 routes = web.RouteTableDef()
 
@@ -20,72 +26,183 @@ async def hello(request):
     return web.json_response({"status": "healthy"})
 
 
+def cluster_of(app, app_id) -> Optional[Cluster]:
+    cluster, _ = kvstore.split_cluster_app_id(app_id)
+    return app["CLUSTERS"].get(cluster)
+
+
 @routes.get("/client/ls")
 async def ls_tasks(request: aiohttp.web.Request):
-    loaders = request.app["LOADERS"]
-    tasks = request.app["LOADER_TASKS"]
+    """Applications of all loader instances, polled ones have a lease owner"""
+    app = request.app
+    tasks = app["LOADER_TASKS"]
+    owners = await app["COORDINATOR"].owners()
     app_loaders = dict()
-    for app_id, loader in loaders.items():
-        task: asyncio.Task = tasks[app_id]
-        status = "running"
-        if task.cancelled():
-            status = "cancelled"
-        app_loaders[app_id] = {loader.name: {"task": status}}
-    return web.json_response({"applications": app_loaders})
+    for app_id, owner in owners.items():
+        if app_id in tasks:
+            status = task_status(tasks[app_id])
+        else:
+            status = "running" if owner else "unassigned"
+        app_loaders[app_id] = {application_loader.ApplicationLoader.name: {"task": status}}
+        cluster = cluster_of(app, app_id)
+        interval = cluster.scheduler.interval(app_id) if cluster else None
+        if interval is not None:
+            app_loaders[app_id]["poll_interval"] = interval
+        loader = app["LOADERS"].get(app_id)
+        if loader is not None and loader.job_selector.backfill_requests:
+            app_loaders[app_id]["backfill"] = loader.job_selector.progress()
+        if loader is not None and loader.breakers.states():
+            app_loaders[app_id]["breakers"] = loader.breakers.states()
+    for cluster in app["CLUSTERS"].values():
+        ids_key = cluster.app_id("IDS")
+        app_loaders[ids_key] = {
+            AppIdsLoader.name: {
+                "task": task_status(tasks[ids_key]),
+                "discovery": cluster.discovery.backend,
+                "breaker": app["LOADERS"][ids_key].breaker.state,
+            }
+        }
+    return web.json_response(
+        {
+            "applications": app_loaders,
+            "owners": owners,
+            "instance_id": app["COORDINATOR"].instance_id,
+            "leader": app["COORDINATOR"].is_leader(),
+        }
+    )
 
 
 @routes.post("/client/create")
 async def client_for_app(request: aiohttp.web.Request):
-    app_id = request.query["app_id"]
-    print(app_id)
     app = request.app
-    if app_id in app["LOADERS"]:
+    # Either an id listed in the applications of a cluster or a YARN one with its cluster
+    app_id = kvstore.cluster_app_id(request.query.get("cluster"), request.query["app_id"])
+    print(app_id)
+    if cluster_of(app, app_id) is None:
+        return aiohttp.web.json_response({"error": "unknown cluster"}, status=404)
+    # Any instance registers the app, its owner starts loading on the next round
+    added = await app["REDIS"].sadd(kvstore.loader_apps_key(), app_id)
+    if not added:
         return aiohttp.web.json_response({"status": "client exists"}, status=302)
-
-    loader = application_loader.ApplicationLoader(
-        app["METRICS_CLIENT"], app_id, fetch_last_jobs=2
-    )
-    task = asyncio.create_task(loader.loop_update_app_metrics())
-    app["LOADERS"][app_id] = loader
-    app["LOADER_TASKS"][app_id] = task
+    await app["COORDINATOR"].coordinate()
     return aiohttp.web.json_response({"status": "created new client"})
 
 
 @routes.post("/client/rm/")
 async def rm_client_for_app(request: aiohttp.web.Request):
     try:
-        app_id = request.query["app_id"]
+        app_id = kvstore.cluster_app_id(request.query.get("cluster"), request.query["app_id"])
     except KeyError as exc:
         raise HttpBadRequest("No key " + str(exc))
 
     app = request.app
-    if app_id not in app["LOADERS"]:
+    removed = await app["REDIS"].srem(kvstore.loader_apps_key(), app_id)
+    if not removed:
         return aiohttp.web.json_response({"error": "client does not exist"}, status=404)
 
-    del app["LOADERS"][app_id]
-    app["LOADER_TASKS"][app_id].cancel()
-    del app["LOADER_TASKS"][app_id]
+    await app["COORDINATOR"].coordinate()
     return aiohttp.web.json_response({"status": f"client for {app_id} deleted"})
 
 
 async def create_redis_connection(app):
+    # One pool and one graphite client shared by all loaders of the instance
     app["REDIS"] = await db.connect_with_redis()
+    app["GRAPHITE"] = db.connect_with_graphtie("loader")
+
+
+def config_value(key, default):
+    """Configured value of `key`, `default` only when it is not set, so 0 is kept"""
+    value = DEFAULT_CONFIG.get(key)
+    return default if value is None else value
+
+
+async def start_loader(app, app_id):
+    cluster = cluster_of(app, app_id)
+    if cluster is None:
+        print(f"No cluster of {app_id} is configured, not loading it")
+        return
+    loader = application_loader.ApplicationLoader(
+        cluster.metrics_client,
+        app_id,
+        fetch_last_jobs=DEFAULT_CONFIG.get("fetch_last_jobs") or 2,
+        backfill_requests=config_value("backfill_requests_per_round", 20),
+        scheduler=cluster.scheduler,
+        redis=app["REDIS"],
+        graphite=app["GRAPHITE"],
+        persist_queue=config_value("loader_persist_queue", 1),
+        emit_queue=config_value("loader_emit_queue", 10),
+        breaker_params=dict(
+            threshold=config_value("breaker_threshold", 3),
+            base_delay=config_value("breaker_base_delay", 5),
+            max_delay=config_value("breaker_max_delay", 600),
+        ),
+    )
+    app["LOADERS"][app_id] = loader
+    app["LOADER_TASKS"][app_id] = asyncio.create_task(loader.loop_update_app_metrics())
+
+
+async def stop_loader(app, app_id):
+    task = app["LOADER_TASKS"].pop(app_id, None)
+    app["LOADERS"].pop(app_id, None)
+    cluster = cluster_of(app, app_id)
+    if cluster is not None:
+        cluster.scheduler.unregister(app_id)
+    if task is not None:
+        task.cancel()
 
 
 async def init_loaders(app):
     app["LOADERS"] = dict()
     app["LOADER_TASKS"] = dict()
-
-    app_ids_loader = AppIdsLoader(app["REDIS"], app["METRICS_CLIENT"], timeout=30)
-    task = asyncio.create_task(app_ids_loader.loop_update_app_ids())
-    app["LOADERS"]["IDS"] = app_ids_loader
-    app["LOADER_TASKS"]["IDS"] = task
+    coordinator = LoaderCoordinator(
+        app["REDIS"],
+        on_claim=partial(start_loader, app),
+        on_release=partial(stop_loader, app),
+        heartbeat_interval=DEFAULT_CONFIG.get("loader_heartbeat_interval") or 5,
+    )
+    # Leader is known before discovery starts
+    await coordinator.heartbeat()
+
+    # Every cluster is discovered and polled on its own
+    app["CLUSTERS"] = load_clusters()
+    await app["REDIS"].sadd(kvstore.clusters_key(), *app["CLUSTERS"])
+    for cluster in app["CLUSTERS"].values():
+        app_ids_loader = AppIdsLoader(
+            app["REDIS"],
+            cluster.metrics_client,
+            timeout=30,
+            scheduler=cluster.scheduler,
+            discovery=cluster.discovery,
+            cluster=cluster.name,
+            is_leader=coordinator.is_leader,
+        )
+        ids_key = cluster.app_id("IDS")
+        app["LOADERS"][ids_key] = app_ids_loader
+        app["LOADER_TASKS"][ids_key] = asyncio.create_task(
+            app_ids_loader.loop_update_app_ids()
+        )
+
+    app["COORDINATOR"] = coordinator
+    app["COORDINATOR_TASK"] = asyncio.create_task(coordinator.loop_coordinate())
+
+
+async def stop_coordinator(app):
+    app["COORDINATOR_TASK"].cancel()
+    try:
+        await app["COORDINATOR_TASK"]
+    except asyncio.CancelledError:
+        pass
 
 
-def start():
+def start(port=8001):
     app = aiohttp.web.Application(middlewares=[aiohttp.web.normalize_path_middleware()])
     app.router.add_routes(routes)
-    app["METRICS_CLIENT"] = clients.MetricsClient(inactive_jobs_only=True)
+    app.router.add_routes(instrumentation.routes)
+    app.router.add_routes(tracing.routes)
+    app.router.add_routes(profiling.routes)
+    app.on_startup.append(profiling.start_loop_monitor)
+    app.on_cleanup.append(profiling.stop_loop_monitor)
     app.on_startup.append(create_redis_connection)
     app.on_startup.append(init_loaders)
-    aiohttp.web.run_app(app, port=8001)
+    app.on_cleanup.append(stop_coordinator)
+    aiohttp.web.run_app(app, port=port)
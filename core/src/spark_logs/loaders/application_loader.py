@@ -1,72 +1,313 @@
 import asyncio
+import contextvars
 import itertools
 import time
-from typing import Optional, List, Dict, Set
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional, List, Dict, Set, Tuple, NamedTuple, Callable
 
 import orjson
 from aioredis import Redis
 from graphitesend import GraphiteClient
 
 from spark_logs import db, kvstore
+from spark_logs.instrumentation import (
+    PROCESSOR_ITERATION,
+    RETIRED_APPS,
+    count_round_trips,
+)
+from spark_logs.tracing import span
+from spark_logs.loaders.aggregates import (
+    JobsAggregate,
+    ExecutorTimesAggregate,
+    JobDurationsAggregate,
+)
+from spark_logs.loaders.breaker import Breakers, CircuitBreaker, CircuitOpen
 from spark_logs.loaders.clients import MetricsClient
-from spark_logs.types import Executor, Job, StageTasks, JobStages, ApplicationMetrics
+from spark_logs.loaders.discovery import FINAL_STATES, YarnAppsDiscovery
+from spark_logs.loaders.job_index import JobIdRanges
+from spark_logs.loaders.pipeline import Stage, run_stages
+from spark_logs.loaders.scheduler import PollingScheduler, PollResult
+from spark_logs.loaders.snapshots import ExecutorsSnapshot, RunningJobsSnapshot
+from spark_logs.loaders.stage_cache import StageCache
+from spark_logs.types import (
+    Executor,
+    Job,
+    RawStageTasks,
+    RawJobStages,
+    ApplicationMetrics,
+)
+
+# graphitesend blocks on one socket, sends of all loaders go through one thread
+GRAPHITE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="graphite")
+
+
+class LoaderRound(NamedTuple):
+    timestamp: float
+    metrics: ApplicationMetrics
+    # Backfill cursor once the jobs of the round are stored
+    next_cursor: Optional[int]
+
+
+def merge_series(older, newer):
+    """Batch of series standing for two emit batches, newer values win"""
+    series, _ = older
+    newer_series, timestamp = newer
+    return {**series, **newer_series}, timestamp
 
 
 class ApplicationLoader:
     name = "application_loader"
+    completed_jobs_stream_len = 100000
+    ts_executor_metric_keys = (
+        "totalGCTime",
+        "totalShuffleRead",
+        "totalShuffleWrite",
+        "memoryUsed",
+    )
 
     def __init__(
-        self, metrics_client: MetricsClient, app_id, fetch_last_jobs, timeout=10
+        self,
+        metrics_client: MetricsClient,
+        app_id,
+        fetch_last_jobs,
+        timeout=10,
+        backfill_requests=0,
+        scheduler: Optional[PollingScheduler] = None,
+        redis: Optional[Redis] = None,
+        graphite: Optional[GraphiteClient] = None,
+        persist_queue=1,
+        emit_queue=10,
+        breaker_params: Optional[Dict] = None,
     ):
         self.app_id = app_id
+        # Keys use the app id of kvstore.cluster_app_id, requests the YARN one
+        _, self.yarn_app_id = kvstore.split_cluster_app_id(app_id)
         self.metrics_client: MetricsClient = metrics_client
-        self.job_selector = JobSelector(fetch_last_jobs)
-        self.redis: Optional[Redis] = None
-        self.graphite: Optional[GraphiteClient] = None
+        self.job_selector = JobSelector(fetch_last_jobs, backfill_requests)
+        self._saved_cursor: Optional[int] = None
+        # Services pass their shared pool and client, own ones are created otherwise
+        self.redis: Optional[Redis] = redis
+        self.graphite: Optional[GraphiteClient] = graphite
         self.timeout = timeout
-
-        self.stored_job_ids: Set[int] = set()
+        # Without a scheduler the app is polled every `timeout` seconds
+        self.scheduler = scheduler
+        self.aggregates: List[JobsAggregate] = [
+            ExecutorTimesAggregate(app_id),
+            JobDurationsAggregate(app_id),
+        ]
+        self.executors = ExecutorsSnapshot(app_id)
+        self.running_jobs = RunningJobsSnapshot(app_id)
+        self.stage_cache = StageCache()
+        # Endpoints of the app, the ResourceManager is asked for its state when one opens
+        self.breakers = Breakers(on_open=self._on_breaker_open, **(breaker_params or {}))
+        self.check_finished = False
+        self.prepared = False
+        self.configuration_stored = False
+
+        self.stored_job_ids = JobIdRanges()
+        # Completed jobs fetched and waiting to be stored, not selected again
+        self.pending_job_ids: Set[int] = set()
+        # Rounds waiting to be written and batches of series waiting to be sent
+        self.persist_stage = Stage(
+            "persist", self._persist_round, size=persist_queue, app_id=app_id
+        )
+        # Series are sent only when they change, so batches waiting too long
+        # are merged into the next ones instead of dropped
+        self.emit_stage = Stage(
+            "emit", self._emit_series, size=emit_queue, merge=merge_series, app_id=app_id
+        )
 
     async def loop_update_app_metrics(self):
+        """Fetches rounds while earlier ones are written and sent by the stages.
+
+        Rounds are written by one worker in the order they were fetched, so
+        snapshots and the backfill cursor see them in order. Failed rounds are
+        retried after the backoff of the failing endpoint, the loop ends when
+        the app has finished.
+        """
+        stages = [self.persist_stage, self.emit_stage]
         try:
-            self.stored_job_ids = await self.load_stored_jobs()
-            await self.store_configuration_info()
-            while True:
-                await self.update_app_metrics()
+            await run_stages(self._loop_fetch(), stages)
+        finally:
+            for stage in stages:
+                stage.close()
+
+    async def _loop_fetch(self):
+        while True:
+            if self.scheduler is not None:
+                await self.scheduler.wait_turn(self.app_id)
+            try:
+                with PROCESSOR_ITERATION.labels(processor=self.name).time():
+                    with span("loader.round", root=True, app_id=self.app_id):
+                        await self.prepare()
+                        loader_round, result = await self.fetch_round()
+                    # Waits while the persist stage is full
+                    await self.persist_stage.put(loader_round)
+            except Exception as exc:
+                print(f"Round of {self.app_id} failed: {type(exc).__name__}: {exc}")
+                if await self.retire_if_finished():
+                    return
+                if self.scheduler is None:
+                    await asyncio.sleep(max(self.timeout, self.breakers.delay()))
+                else:
+                    self.scheduler.back_off(self.app_id, self.breakers.delay())
+                continue
+            if self.scheduler is None:
                 await asyncio.sleep(self.timeout)
-        except Exception:
-            import traceback
+            else:
+                self.scheduler.report(self.app_id, result)
 
-            traceback.print_exc()
-            raise
+    async def prepare(self):
+        """Loads the state of the loader once, stores the configuration until it succeeds"""
+        if not self.prepared:
+            self.stored_job_ids = await self.load_stored_jobs()
+            await self.load_backfill_cursor()
+            self.prepared = True
+        if not self.configuration_stored:
+            try:
+                await self.store_configuration_info()
+            except CircuitOpen:
+                pass
+            except Exception as exc:
+                # Jobs are loaded without the configuration in the meantime
+                print(f"Configuration of {self.app_id} is not stored: {type(exc).__name__}: {exc}")
+
+    def _on_breaker_open(self, endpoint):
+        self.check_finished = True
+
+    async def retire_if_finished(self) -> bool:
+        """Removes the app from loading when the ResourceManager says it finished"""
+        if not self.check_finished:
+            return False
+        self.check_finished = False
+        try:
+            report = await self.metrics_client.get_node_metrics(
+                "yarn_app", application_id=self.yarn_app_id
+            )
+            state = report["app"]["state"]
+        except Exception as exc:
+            print(f"State of {self.app_id} is unknown: {type(exc).__name__}: {exc}")
+            return False
+        if state not in FINAL_STATES:
+            return False
+        print(f"{self.app_id} is {state}, not loading it anymore")
+        # No instance claims it again, its owner releases it on the next round
+        await self.redis.srem(kvstore.loader_apps_key(), self.app_id)
+        RETIRED_APPS.inc()
+        return True
+
+    async def _persist_round(self, loader_round: LoaderRound):
+        try:
+            with count_round_trips(self.name), span(
+                "loader.report", root=True, app_id=self.app_id
+            ):
+                _, changed = await self._store_metrics(
+                    loader_round.metrics, loader_round.next_cursor
+                )
+        except Exception as exc:
+            # Jobs of the round are fetched again by the next rounds
+            print(f"Writing a round of {self.app_id} failed: {type(exc).__name__}: {exc}")
+            return
+        series = self._executor_series(changed)
+        if series:
+            await self.emit_stage.put((series, loader_round.timestamp))
+
+    async def _emit_series(self, item):
+        series, timestamp = item
+        try:
+            with span("loader.emit", root=True, app_id=self.app_id):
+                await self._send_series(series, timestamp)
+        except Exception as exc:
+            print(f"Sending series of {self.app_id} failed: {type(exc).__name__}: {exc}")
 
-    async def load_stored_jobs(self) -> Set[int]:
+    async def load_stored_jobs(self) -> JobIdRanges:
         if self.redis is None:
             self.redis = await db.connect_with_redis()
+        index_key = kvstore.stored_jobs_index_key(app_id=self.app_id)
+        bitmap = await self.redis.get(index_key)
+        if bitmap is None:
+            await self.build_stored_jobs_index()
+            bitmap = await self.redis.get(index_key)
+        return JobIdRanges.from_bitmap(bitmap)
+
+    async def load_backfill_cursor(self):
+        """Resumes the backfill lane where the previous loader left it"""
+        if not self.job_selector.backfill_requests:
+            return
+        cursor = await self.redis.get(kvstore.backfill_cursor_key(app_id=self.app_id))
+        if cursor is not None:
+            self.job_selector.cursor = self._saved_cursor = int(cursor)
+
+    async def build_stored_jobs_index(self, chunk=1000):
+        """Indexes jobs stored before the index existed, once per app"""
         key = kvstore.sequential_jobs_key(app_id=self.app_id)
-        stored_job_ids = {
-            score
-            for _, score in await self.redis.zrevrangebyscore(key, withscores=True)
-        }
-        return stored_job_ids
+        index_key = kvstore.stored_jobs_index_key(app_id=self.app_id)
+        start = 0
+        while True:
+            stored = await self.redis.zrange(key, start, start + chunk - 1, withscores=True)
+            if not stored:
+                break
+            pipeline = self.redis.pipeline()
+            for _, job_id in stored:
+                pipeline.setbit(index_key, int(job_id), 1)
+            await pipeline.execute()
+            start += chunk
+
+    async def update_app_metrics(self) -> PollResult:
+        """One round with its steps in sequence"""
+        with span("loader.round", root=True, app_id=self.app_id):
+            loader_round, result = await self.fetch_round()
+            with span("loader.report"):
+                _, changed = await self._store_metrics(
+                    loader_round.metrics, loader_round.next_cursor
+                )
+            await self._send_series(self._executor_series(changed), loader_round.timestamp)
+        return result
 
-    async def update_app_metrics(self):
+    async def fetch_round(self) -> Tuple[LoaderRound, PollResult]:
+        stage_misses = self.stage_cache.misses
         execution_timestamp = time.time()
-        fresh_metrics = await self.fresh_app_metrics()
-        await self._report_metrics(fresh_metrics, execution_timestamp)
-
-    async def fresh_app_metrics(self) -> ApplicationMetrics:
-        metrics_client = self.metrics_client
-        executor_metrics: List[Executor] = await metrics_client.get_node_metrics(
-            node="executors", application_id=self.app_id
+        with span("loader.fetch"):
+            fresh_metrics = await self.fresh_app_metrics()
+        completed_jobs = [
+            int(job_id)
+            for job_id, job_data in fresh_metrics.jobs_stages.items()
+            if job_data.job.completionTime is not None
+        ]
+        self.pending_job_ids.update(completed_jobs)
+        loader_round = LoaderRound(
+            execution_timestamp, fresh_metrics, self.job_selector.next_cursor
+        )
+        return loader_round, PollResult(
+            completed_jobs=len(completed_jobs),
+            # executors, jobs and a request per stage not in the cache
+            requests=2 + self.stage_cache.misses - stage_misses,
+            backlog=self.job_selector.remaining > 0,
+            backfill=self.job_selector.backfill_remaining > 0,
         )
 
-        jobs: List[Job] = await metrics_client.get_node_metrics(
-            "jobs", application_id=self.app_id
+    async def _get(self, node, **data):
+        """Requests an endpoint of the app through its circuit breaker"""
+        return await self.breakers[node].call(
+            partial(
+                self.metrics_client.get_node_metrics,
+                node,
+                application_id=self.yarn_app_id,
+                **data,
+            )
         )
 
-        jobs_to_fetch: List[Job] = self.job_selector.select(jobs, self.stored_job_ids)
-        jobs_stages_list: List[JobStages] = await asyncio.gather(
+    async def fresh_app_metrics(self) -> ApplicationMetrics:
+        executor_metrics: List[Executor] = await self._get("executors")
+        jobs: List[Job] = await self._get("jobs")
+
+        # Backfill only takes requests the other apps leave unused
+        backfill = self.scheduler is None or self.scheduler.has_spare_budget()
+        jobs_to_fetch: List[Job] = self.job_selector.select(
+            jobs, self.stored_job_ids, backfill=backfill, pending=self.pending_job_ids
+        )
+        jobs_stages_list: List[RawJobStages] = await asyncio.gather(
             *[self.fetch_for_job(job) for job in jobs_to_fetch]
         )
         jobs_data = {js.job.jobId: js for js in jobs_stages_list}
@@ -78,80 +319,128 @@ class ApplicationLoader:
     async def _report_metrics(
         self, fresh_metrics: ApplicationMetrics, execution_timestamp
     ):
+        completed_jobs, changed = await self._store_metrics(
+            fresh_metrics, self.job_selector.next_cursor
+        )
+        await self._send_series(self._executor_series(changed), execution_timestamp)
+        return completed_jobs
+
+    async def _store_metrics(
+        self, fresh_metrics: ApplicationMetrics, next_cursor: Optional[int]
+    ) -> Tuple[int, Dict[str, Dict[str, bytes]]]:
+        """Writes a round in one transaction, returns stored jobs and changed executors"""
         if self.redis is None:
             self.redis = await db.connect_with_redis()
 
-        running_jobs: Dict[str, JobStages] = dict()
-        completed_jobs: Dict[str, JobStages] = dict()
+        running_jobs: Dict[str, RawJobStages] = dict()
+        completed_jobs: Dict[str, RawJobStages] = dict()
         for job_id, job_data in fresh_metrics.jobs_stages.items():
             if job_data.job.completionTime is None:
                 running_jobs[job_id] = job_data
             else:
                 completed_jobs[job_id] = job_data
 
-        self.stored_job_ids |= {
-            int(job_id) for job_id, job_data in fresh_metrics.jobs_stages.items()
-        }
-
-        args = list(
-            itertools.chain.from_iterable(
-                [
-                    (int(job_id), job_data.dump())
-                    for job_id, job_data in completed_jobs.items()
-                ]
+        # All writes of the round go in one transaction
+        tr = self.redis.multi_exec()
+        with span("encode", jobs=len(completed_jobs)):
+            args = list(
+                itertools.chain.from_iterable(
+                    [
+                        (int(job_id), job_data.dump())
+                        for job_id, job_data in completed_jobs.items()
+                    ]
+                )
             )
-        )
         if len(args) > 0:
-            try:
-                await self.redis.zadd(
-                    kvstore.sequential_jobs_key(app_id=self.app_id), *args
-                )
-            except Exception as exc:
-                raise
+            tr.zadd(kvstore.sequential_jobs_key(app_id=self.app_id), *args)
+        # Only completed jobs are indexed, running ones are fetched again
+        for job_id in completed_jobs:
+            tr.setbit(kvstore.stored_jobs_index_key(app_id=self.app_id), int(job_id), 1)
+
+        # Completion order feed for the processors, see kvstore.completed_jobs_stream_key
+        for job_id in sorted(completed_jobs, key=int):
+            tr.xadd(
+                kvstore.completed_jobs_stream_key(app_id=self.app_id),
+                {"job_id": job_id},
+                max_len=self.completed_jobs_stream_len,
+            )
+
+        if next_cursor is not None and next_cursor != self._saved_cursor:
+            tr.set(kvstore.backfill_cursor_key(app_id=self.app_id), next_cursor)
 
-        value = ApplicationMetrics(
-            executor_metrics=fresh_metrics.executor_metrics, jobs_stages=running_jobs
-        ).dump()
-        await self.redis.set(self.app_id, value)
+        for aggregate in self.aggregates:
+            with span("loader.aggregate", aggregate=type(aggregate).__name__):
+                await aggregate.add_jobs(self.redis, tr, completed_jobs)
 
+        with span("loader.snapshot"):
+            await self.running_jobs.update(self.redis, tr, running_jobs)
+            changed = await self.executors.update(
+                self.redis, tr, fresh_metrics.executor_metrics
+            )
+
+        try:
+            await tr.execute()
+        except Exception:
+            # Snapshots would skip changes that were not written
+            self.running_jobs.reset()
+            self.executors.reset()
+            raise
+        finally:
+            # Jobs not written are selected again
+            self.pending_job_ids.difference_update(int(job_id) for job_id in completed_jobs)
+        for job_id in completed_jobs:
+            self.stored_job_ids.add(int(job_id))
+        self.job_selector.cursor = self._saved_cursor = next_cursor
+        return len(completed_jobs), changed
+
+    def _executor_series(self, changed) -> Dict[str, float]:
+        # Only series that changed since the previous round
+        return {
+            f"executors.{self.app_id}.{executor_id}.{k}": orjson.loads(fields[k])
+            for executor_id, fields in changed.items()
+            for k in self.ts_executor_metric_keys
+            if k in fields
+        }
+
+    async def _send_series(self, series: Dict[str, float], timestamp):
+        if not series:
+            return
         if self.graphite is None:
             self.graphite = db.connect_with_graphtie("loader")
-        ts_executor_metric_keys = (
-            "totalGCTime",
-            "totalShuffleRead",
-            "totalShuffleWrite",
-            "memoryUsed",
+        send = partial(self.graphite.send_dict, series, timestamp=timestamp)
+        # The thread sends within the span of the caller
+        await asyncio.get_event_loop().run_in_executor(
+            GRAPHITE_EXECUTOR, contextvars.copy_context().run, send
         )
-        all_executor_metrics = fresh_metrics.executor_metrics
-        ts_executor_metrics = {
-            f"executors.{self.app_id}.{executor.id}.{k}": getattr(executor, k, 0)
-            for executor in all_executor_metrics
-            for k in ts_executor_metric_keys
-        }
-        try:
-            self.graphite.send_dict(ts_executor_metrics)
-        except Exception as exc:
-            raise
 
     async def fetch_for_job(self, job: Job):
         stage_ids = job.stageIds
-        job_stages_list: List[StageTasks] = await asyncio.gather(
-            *[self.fetch_for_stage(stage_id) for stage_id in stage_ids]
-        )
-        job_stages: Dict[str, StageTasks] = {
+        self.stage_cache.check_job(job.jobId, job.numFailedStages)
+        with span("loader.fetch_job", job_id=job.jobId):
+            job_stages_list: List[RawStageTasks] = await asyncio.gather(
+                *[self.fetch_for_stage(stage_id) for stage_id in stage_ids]
+            )
+        if job.completionTime is None:
+            self.stage_cache.put(job.jobId, job_stages_list, job.numFailedStages)
+        else:
+            self.stage_cache.evict_job(job.jobId)
+        job_stages: Dict[str, RawStageTasks] = {
             stage_and_tasks.stage.stageId: stage_and_tasks
             for stage_and_tasks in job_stages_list
             if stage_and_tasks.stage.status in ("COMPLETE", "RUNNING")
         }
-        return JobStages(job=job, stages=job_stages)
+        # Stored stages are written as fetched, without a JobStages object graph
+        return RawJobStages(job=job, stages=job_stages)
 
     async def fetch_for_stage(self, stage_id):
-        stage_and_tasks = await self.metrics_client.get_node_metrics(
-            "stage", application_id=self.app_id, stage_id=str(stage_id)
-        )
+        cached = self.stage_cache.get(stage_id)
+        if cached is not None:
+            return cached
+        stage_and_tasks = await self._get("stage", stage_id=str(stage_id))
         return stage_and_tasks
 
-    async def store_configuration_info(self):
+    async def store_configuration_info(self, spark_properties=None):
+        """Stores resources of the app, `spark_properties` are fetched when not given"""
         memory_keys = (
             "spark.executor.memory",
             "spark.driver.memory",
@@ -163,11 +452,11 @@ class ApplicationLoader:
             "spark.dynamicAllocation.maxExecutors",
         )
         bool_keys = ("spark.dynamicAllocation.enabled",)
-        raw = await self.metrics_client.get_node_metrics(
-            node="environment", application_id=self.app_id
-        )
+        if spark_properties is None:
+            raw = await self._get("environment")
+            spark_properties = raw["sparkProperties"]
         result = dict()
-        for key, value in raw["sparkProperties"]:
+        for key, value in spark_properties:
             if key in memory_keys:
                 multiplier = 1
                 if value.endswith("g"):
@@ -185,45 +474,140 @@ class ApplicationLoader:
         await self.redis.set(
             kvstore.app_environment_key(app_id=self.app_id), orjson.dumps(result)
         )
+        self.configuration_stored = True
 
 
 class AppIdsLoader:
     name = "app_ids_loader"
 
-    def __init__(self, redis, metrics_client: MetricsClient, timeout=10):
+    def __init__(
+        self,
+        redis,
+        metrics_client: MetricsClient,
+        timeout=10,
+        scheduler: Optional[PollingScheduler] = None,
+        discovery: Optional[YarnAppsDiscovery] = None,
+        cluster=kvstore.DEFAULT_CLUSTER,
+        is_leader: Optional[Callable[[], bool]] = None,
+    ):
         self.metrics_client: MetricsClient = metrics_client
         self.redis: Redis = redis
         self.timeout = timeout
+        self.scheduler = scheduler
+        self.discovery = discovery or YarnAppsDiscovery(metrics_client)
+        self.cluster = cluster
+        self.breaker = CircuitBreaker(f"discovery:{cluster}")
+        # With several loader instances only the leader discovers apps
+        self.is_leader = is_leader
+        # Scheduled next to the apps of the cluster
+        self.schedule_id = kvstore.cluster_app_id(cluster, self.name)
+        if scheduler is not None:
+            # Cluster page is polled at a fixed interval stretched by API slowdown
+            scheduler.register(self.schedule_id, interval=timeout)
 
     async def set_for_apps(self, apps):
         running_apps = [app for app in apps if app["State"] == "RUNNING"]
-        data = {
-            app["ID"]: {k: app[k] for k in {"ID", "Name", "StartTime", "User"}}
-            for app in running_apps
-        }
-        await self.redis.set(kvstore.applications_key(), orjson.dumps(data))
+        data = dict()
+        for app in running_apps:
+            app_id = kvstore.cluster_app_id(self.cluster, app["ID"])
+            data[app_id] = {k: app[k] for k in {"Name", "StartTime", "User"}}
+            data[app_id].update(ID=app_id, Cluster=self.cluster)
+        await self.redis.set(
+            kvstore.applications_key(cluster=self.cluster), orjson.dumps(data)
+        )
 
     async def loop_update_app_ids(self):
         while True:
+            if self.is_leader is not None and not self.is_leader():
+                await asyncio.sleep(self.timeout)
+                continue
+            if self.scheduler is not None:
+                await self.scheduler.wait_turn(self.schedule_id)
+            print("Updating app ids of", self.cluster)
             try:
-                print("Updating app ids")
-                apps = await self.metrics_client.get_node_metrics("applications")
+                apps = await self.breaker.call(self.discovery.running_apps)
                 await self.set_for_apps(apps)
-                await asyncio.sleep(self.timeout)
             except Exception as exc:
-                raise
+                print(f"Updating app ids of {self.cluster} failed: {type(exc).__name__}: {exc}")
+                if self.scheduler is None:
+                    await asyncio.sleep(max(self.timeout, self.breaker.delay()))
+                else:
+                    self.scheduler.back_off(self.schedule_id, self.breaker.delay())
+                continue
+            if self.scheduler is None:
+                await asyncio.sleep(self.timeout)
+            else:
+                result = PollResult(completed_jobs=0, requests=self.discovery.requests)
+                self.scheduler.report(self.schedule_id, result)
 
 
 class JobSelector:
-    def __init__(self, batch_size):
-        self.batch_size = batch_size
+    """Picks jobs to load in a round from two lanes.
 
-    def select(self, jobs_data: List[Job], stored_job_ids: Set[int]) -> List[Job]:
-        jobs_dict = {int(j.jobId): j for j in jobs_data}
-        job_ids_to_load = set(jobs_dict.keys()) - stored_job_ids
+    The live lane takes the newest not stored jobs, completed ones first.
+    With a `backfill_requests` budget, jobs older than `cursor` belong to the
+    backfill lane, which walks them newest first with up to that many stage
+    requests per round, and only in rounds the live lane has no backlog.
+    """
 
-        sorted_ids = reversed(sorted(job_ids_to_load))
-        to_load: List[Job] = [jobs_dict[i] for i in sorted_ids][: self.batch_size]
+    def __init__(self, batch_size, backfill_requests=0):
+        self.batch_size = batch_size
+        self.backfill_requests = backfill_requests
+        # Completed jobs below the cursor are left to the backfill lane
+        self.cursor: Optional[int] = None
+        # Cursor after the selected backfill jobs are stored
+        self.next_cursor: Optional[int] = None
+        self.remaining = 0
+        self.backfill_remaining = 0
+
+    def select(
+        self,
+        jobs_data: List[Job],
+        stored_job_ids: JobIdRanges,
+        backfill=True,
+        pending: Set[int] = frozenset(),
+    ) -> List[Job]:
+        """Jobs to load, `pending` ones are being stored and are not selected"""
+        not_stored = [
+            j
+            for j in jobs_data
+            if int(j.jobId) not in stored_job_ids and int(j.jobId) not in pending
+        ]
+        if self.backfill_requests and self.cursor is None:
+            # History before the loader was attached is backfilled
+            newest = sorted((int(j.jobId) for j in jobs_data), reverse=True)
+            self.cursor = newest[: self.batch_size][-1] if newest else 0
+        older: List[Job] = []
+        if self.cursor is not None:
+            older = [
+                j for j in not_stored if j.completionTime and int(j.jobId) < self.cursor
+            ]
+            not_stored = [j for j in not_stored if j not in older]
+        # Newest completed jobs first, running ones are fetched with spare slots
+        not_stored.sort(key=lambda j: (j.completionTime is not None, int(j.jobId)), reverse=True)
+        to_load: List[Job] = not_stored[: self.batch_size]
+        # Completed jobs left for the next rounds
+        self.remaining = len([j for j in not_stored[self.batch_size :] if j.completionTime])
+
+        backfill_jobs = []
+        if backfill and not self.remaining:
+            older.sort(key=lambda j: int(j.jobId), reverse=True)
+            requests = 0
+            for job in older:
+                requests += len(job.stageIds)
+                if backfill_jobs and requests > self.backfill_requests:
+                    break
+                backfill_jobs.append(job)
+        self.next_cursor = int(backfill_jobs[-1].jobId) if backfill_jobs else self.cursor
+        self.backfill_remaining = len(older) - len(backfill_jobs)
+
+        print(
+            "Selected: ",
+            [x.jobId for x in to_load],
+            "backfill: ",
+            [x.jobId for x in backfill_jobs],
+        )
+        return to_load + backfill_jobs
 
-        print("Selected: ", [x.jobId for x in to_load])
-        return to_load
+    def progress(self):
+        return {"cursor": self.cursor, "remaining": self.backfill_remaining}
@@ -0,0 +1,134 @@
+"""Circuit breakers of the endpoints an application is polled from.
+
+After `threshold` consecutive failures a breaker opens and requests fail
+without being made for a backoff, doubled on every consecutive opening from
+`base_delay` up to `max_delay`. Backoffs have equal jitter, so applications
+failing together are not probed again together. Once the backoff passes the
+breaker is half open: one probe request is let through, its success closes
+the breaker and its failure opens it again.
+"""
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from spark_logs.instrumentation import BREAKER_OPENED, BREAKER_REJECTED
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    def __init__(self, endpoint, retry_in):
+        super().__init__(f"{endpoint} is not requested for {retry_in:.0f} s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        endpoint="",
+        *,
+        threshold=3,
+        base_delay=5.0,
+        max_delay=600.0,
+        on_open: Optional[Callable[[str], None]] = None,
+        clock=time.monotonic,
+        rng=random.random,
+    ):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.on_open = on_open
+        self.clock = clock
+        self.rng = rng
+        self.failures = 0
+        # Consecutive openings, the exponent of the backoff
+        self.trips = 0
+        self.retry_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.retry_at is None:
+            return CLOSED
+        if self.clock() < self.retry_at:
+            return OPEN
+        return HALF_OPEN
+
+    def delay(self) -> float:
+        """Seconds until a request is let through"""
+        if self.retry_at is None:
+            return 0.0
+        return max(0.0, self.retry_at - self.clock())
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        BREAKER_REJECTED.labels(endpoint=self.endpoint).inc()
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = None
+        self.probing = False
+
+    def failure(self):
+        # Requests made before the breaker opened do not extend the backoff
+        if self.state == OPEN:
+            return
+        self.failures += 1
+        if self.probing or self.failures >= self.threshold:
+            self.trips += 1
+            backoff = min(self.max_delay, self.base_delay * 2 ** (self.trips - 1))
+            self.retry_at = self.clock() + backoff * (0.5 + self.rng() / 2)
+            BREAKER_OPENED.labels(endpoint=self.endpoint).inc()
+            if self.on_open is not None:
+                self.on_open(self.endpoint)
+        self.probing = False
+
+    async def call(self, request: Callable[[], Awaitable]):
+        if not self.allow():
+            raise CircuitOpen(self.endpoint, self.delay())
+        try:
+            result = await request()
+        except Exception:
+            self.failure()
+            raise
+        finally:
+            # A cancelled probe lets the next one through
+            self.probing = False
+        self.success()
+        return result
+
+
+class Breakers:
+    """Breakers of the endpoints of one application, created on first use"""
+
+    def __init__(self, **params):
+        self.params = params
+        self.endpoints: Dict[str, CircuitBreaker] = dict()
+
+    def __getitem__(self, endpoint) -> CircuitBreaker:
+        breaker = self.endpoints.get(endpoint)
+        if breaker is None:
+            breaker = self.endpoints[endpoint] = CircuitBreaker(endpoint, **self.params)
+        return breaker
+
+    def delay(self) -> float:
+        return max((b.delay() for b in self.endpoints.values()), default=0.0)
+
+    def states(self) -> Dict[str, str]:
+        """Endpoints with a breaker not closed"""
+        return {
+            endpoint: breaker.state
+            for endpoint, breaker in self.endpoints.items()
+            if breaker.state != CLOSED
+        }
@@ -1,19 +1,22 @@
+from spark_logs.instrumentation import PARSE_TIME
 from spark_logs.loaders.fetchers import HttpFetcher
 from spark_logs.loaders.parsers import (
     AppIdsFromHtml,
     JsonParser,
-    StageExtendedParser,
+    StagePassthroughParser,
     Jobs,
+    YarnApps,
 )
 
 
 class MetricsClient:
-    def __init__(self, *, inactive_jobs_only):
-        self.fetcher = HttpFetcher()
+    def __init__(self, *, inactive_jobs_only, config=None):
+        self.fetcher = HttpFetcher(config=config)
         self.parsers = {
             "applications": AppIdsFromHtml(),
+            "yarn_apps": YarnApps(),
             "jobs": Jobs(inactive_only=inactive_jobs_only),
-            "stage": StageExtendedParser(),
+            "stage": StagePassthroughParser(),
         }
         self.default_parser = JsonParser()
 
@@ -23,4 +26,5 @@ class MetricsClient:
             node=node, resp_format=parser.resp_format, **data
         )
         print("Got response")
-        return parser.execute(response)
+        with PARSE_TIME.labels(node=node).time():
+            return parser.execute(response)
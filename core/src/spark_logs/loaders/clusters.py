@@ -0,0 +1,54 @@
+"""YARN clusters monitored by one loader deployment.
+
+Clusters are configured as
+
+    "clusters": {"east": {"base_url": "http://rm-east:8088", ...}, ...}
+
+with the keys of a single cluster config (`base_url`, `fetch_interval`,
+`fetch_concurrency`, `poll_requests_per_second`, `yarn_user`, ...). Without
+`clusters` the top level config is the only cluster, named `default`.
+
+Every cluster has its own fetcher, API health, polling scheduler and
+discovery loop, so a slow or failing cluster only slows down its own apps,
+and request budgets add up with the number of clusters. Apps of a cluster
+are known to all services by `kvstore.cluster_app_id`.
+"""
+from typing import Any, Dict
+
+from spark_logs import kvstore
+from spark_logs.config import DEFAULT_CONFIG
+from spark_logs.loaders.clients import MetricsClient
+from spark_logs.loaders.discovery import YarnAppsDiscovery
+from spark_logs.loaders.scheduler import PollingScheduler
+
+
+class Cluster:
+    def __init__(self, name, config):
+        # Names are a node of Graphite paths and a part of app ids
+        if "." in name or kvstore.CLUSTER_SEPARATOR in name:
+            raise ValueError(
+                f"Cluster name {name} must not contain '.' or '{kvstore.CLUSTER_SEPARATOR}'"
+            )
+        self.name = name
+        self.config = config
+        self.metrics_client = MetricsClient(inactive_jobs_only=True, config=config)
+        self.scheduler = PollingScheduler(
+            self.metrics_client.fetcher.health,
+            requests_per_second=config.get("poll_requests_per_second") or 3,
+            min_interval=config.get("min_poll_interval") or 2,
+            max_interval=config.get("max_poll_interval") or 300,
+            idle_backoff=config.get("idle_poll_backoff") or 2,
+        )
+        self.discovery = YarnAppsDiscovery(
+            self.metrics_client,
+            user=config.get("yarn_user"),
+            queue=config.get("yarn_queue"),
+        )
+
+    def app_id(self, yarn_app_id):
+        return kvstore.cluster_app_id(self.name, yarn_app_id)
+
+
+def load_clusters(config=DEFAULT_CONFIG) -> Dict[str, Cluster]:
+    clusters: Dict[str, Any] = config.get("clusters") or {kvstore.DEFAULT_CLUSTER: config}
+    return {name: Cluster(name, cluster_config) for name, cluster_config in clusters.items()}
@@ -0,0 +1,101 @@
+"""Discovery of running applications from the YARN ResourceManager REST API.
+
+`/ws/v1/cluster/apps` filters applications by state, user and queue on the
+server, so finished applications of the cluster are never downloaded. After
+a full listing of active applications, a poll asks only for applications
+started since the oldest one not running yet, and for applications finished
+since the previous poll. The full listing is repeated every
+`full_refresh_every` polls to correct anything missed. While the REST API is
+not available the `/cluster` page is scraped instead.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from spark_logs.loaders.clients import MetricsClient
+
+ACTIVE_STATES = ("NEW", "NEW_SAVING", "SUBMITTED", "ACCEPTED", "RUNNING")
+FINAL_STATES = ("FINISHED", "FAILED", "KILLED")
+
+
+class YarnAppsDiscovery:
+    def __init__(
+        self,
+        metrics_client: MetricsClient,
+        *,
+        user=None,
+        queue=None,
+        full_refresh_every=20,
+        clock_margin=60,
+    ):
+        self.metrics_client = metrics_client
+        self.user = user
+        self.queue = queue
+        self.full_refresh_every = full_refresh_every
+        # Seconds of clock difference with the ResourceManager tolerated
+        self.clock_margin = clock_margin
+        # Active applications by id
+        self.apps: Dict[str, Dict[str, Any]] = dict()
+        self.polls = 0
+        self.last_poll: Optional[int] = None
+        self.rest_available = True
+        self.backend = "rest"
+        self.requests = 0
+
+    async def running_apps(self) -> List[Dict[str, Any]]:
+        self.requests = 0
+        if self.rest_available:
+            try:
+                apps = await self._poll_rest()
+                self.backend = "rest"
+                return apps
+            except aiohttp.ClientResponseError as exc:
+                # ResourceManagers without the REST API do not get asked again
+                if exc.status == 404:
+                    self.rest_available = False
+                print("YARN REST discovery failed, scraping /cluster:", exc)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as exc:
+                print("YARN REST discovery failed, scraping /cluster:", exc)
+        self.backend = "html"
+        self.requests += 1
+        apps = await self.metrics_client.get_node_metrics("applications")
+        return [app for app in apps if app["State"] == "RUNNING"]
+
+    async def _poll_rest(self) -> List[Dict[str, Any]]:
+        now = int(time.time() * 1000)
+        if self.last_poll is None or self.polls % self.full_refresh_every == 0:
+            apps = await self._query(states=ACTIVE_STATES)
+            self.apps = {app["ID"]: app for app in apps}
+        else:
+            margin = self.clock_margin * 1000
+            # Apps accepted earlier may start running since the previous poll
+            pending = [
+                int(app["StartTime"])
+                for app in self.apps.values()
+                if app["State"] != "RUNNING"
+            ]
+            started = await self._query(
+                states=ACTIVE_STATES,
+                startedTimeBegin=min(pending + [self.last_poll - margin]),
+            )
+            finished = await self._query(
+                states=FINAL_STATES, finishedTimeBegin=self.last_poll - margin
+            )
+            self.apps.update((app["ID"], app) for app in started)
+            for app in finished:
+                self.apps.pop(app["ID"], None)
+        self.polls += 1
+        self.last_poll = now
+        return [app for app in self.apps.values() if app["State"] == "RUNNING"]
+
+    async def _query(self, *, states, **query) -> List[Dict[str, Any]]:
+        self.requests += 1
+        return await self.metrics_client.get_node_metrics(
+            "yarn_apps",
+            states=",".join(states),
+            user=self.user,
+            queue=self.queue,
+            **query,
+        )
@@ -0,0 +1,515 @@
+"""Loading of Spark event logs instead of polling the REST API.
+
+Event logs are read from disk as JSON lines, plain or compressed with the
+`lz4` (Spark LZ4 block stream) or `zstd` codecs, which need the optional
+`lz4` and `zstandard` packages. Rolling event logs are read from their
+directory. Only events the loader needs are decoded, all others are skipped
+by their name.
+
+`EventLogReplay` rebuilds what the REST API would report. Tasks of a stage
+are kept until the stage completes, and stages until their last job ends,
+so memory depends on the jobs running at a time and not on the log size.
+`EventLogLoader` writes completed jobs and executors in batches to the same
+Redis keys and Graphite series as `ApplicationLoader`.
+"""
+import re
+import struct
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set
+
+import orjson
+
+from spark_logs import db
+from spark_logs.loaders.application_loader import ApplicationLoader
+from spark_logs.tracing import span
+from spark_logs.types import (
+    ApplicationMetrics,
+    Executor,
+    Job,
+    RawJobStages,
+    RawStageTasks,
+    Stage,
+)
+
+CHUNK_SIZE = 1 << 20
+_LZ4_HEADER = struct.Struct("<8sBiii")
+_EVENT_PREFIX = b'{"Event":"'
+# Rolling event log files are events_<index>_<app_id>[.codec]
+_ROLLING_INDEX = re.compile(r"events_(\d+)_")
+
+EVENTS = {
+    b"SparkListenerApplicationStart",
+    b"SparkListenerEnvironmentUpdate",
+    b"SparkListenerBlockManagerAdded",
+    b"SparkListenerExecutorAdded",
+    b"SparkListenerExecutorRemoved",
+    b"SparkListenerJobStart",
+    b"SparkListenerJobEnd",
+    b"SparkListenerStageSubmitted",
+    b"SparkListenerStageCompleted",
+    b"SparkListenerTaskEnd",
+}
+
+
+def _lz4_chunks(raw: BinaryIO) -> Iterator[bytes]:
+    """Decompresses the LZ4BlockOutputStream format of lz4-java used by Spark"""
+    try:
+        import lz4.block
+    except ImportError:
+        raise RuntimeError("lz4 package is required for lz4 event logs") from None
+
+    while True:
+        header = raw.read(_LZ4_HEADER.size)
+        if len(header) < _LZ4_HEADER.size:
+            # End of file, or an in-progress log cut in the middle of a block
+            return
+        magic, token, compressed, original, _ = _LZ4_HEADER.unpack(header)
+        if magic != b"LZ4Block":
+            raise ValueError("Not an lz4 event log")
+        data = raw.read(compressed)
+        if len(data) < compressed:
+            return
+        if original == 0:
+            # End of a stream, the file may continue with another one
+            continue
+        if token & 0xF0 == 0x10:
+            yield data
+        else:
+            yield lz4.block.decompress(data, uncompressed_size=original)
+
+
+def _zstd_chunks(raw: BinaryIO) -> Iterator[bytes]:
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstandard package is required for zstd event logs") from None
+
+    reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+    while True:
+        chunk = reader.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _plain_chunks(raw: BinaryIO) -> Iterator[bytes]:
+    while True:
+        chunk = raw.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+CODECS = {
+    ".lz4": _lz4_chunks,
+    ".zstd": _zstd_chunks,
+    ".zst": _zstd_chunks,
+}
+
+
+def event_log_files(path) -> List[Path]:
+    """Files of an event log, a rolling one is a directory of numbered files"""
+    path = Path(path)
+    if not path.is_dir():
+        return [path]
+    files = [f for f in path.iterdir() if _ROLLING_INDEX.match(f.name)]
+    return sorted(files, key=lambda f: int(_ROLLING_INDEX.match(f.name).group(1)))
+
+
+def read_lines(path) -> Iterator[bytes]:
+    for file in event_log_files(path):
+        name = file.name
+        in_progress = name.endswith(".inprogress")
+        if in_progress:
+            name = name[: -len(".inprogress")]
+        suffix = Path(name).suffix
+        if suffix in (".snappy", ".lzf"):
+            raise RuntimeError(f"Event logs compressed with {suffix[1:]} are not supported")
+        chunks = CODECS.get(suffix, _plain_chunks)
+        with open(file, "rb") as raw:
+            rest = b""
+            for chunk in chunks(raw):
+                lines = (rest + chunk).split(b"\n")
+                rest = lines.pop()
+                yield from lines
+            # The last event of a log being written may be incomplete
+            if rest and not in_progress:
+                yield rest
+
+
+def read_events(path, events: Set[bytes] = EVENTS) -> Iterator[Dict[str, Any]]:
+    """Decoded events with names in `events`"""
+    start = len(_EVENT_PREFIX)
+    for line in read_lines(path):
+        if line.startswith(_EVENT_PREFIX):
+            if line[start : line.index(b'"', start)] not in events:
+                continue
+        elif not line.strip():
+            continue
+        yield orjson.loads(line)
+
+
+def read_app_id(path) -> str:
+    for event in read_events(path, {b"SparkListenerApplicationStart"}):
+        return event["App ID"]
+    raise ValueError(f"No application start in {path}")
+
+
+def spark_time(timestamp_ms) -> Optional[str]:
+    """Time in the format of Spark REST API"""
+    if timestamp_ms is None:
+        return None
+    dt = datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}GMT"
+
+
+class StageState:
+    """Stage attempt in the shape of Spark REST API, summed from its tasks"""
+
+    def __init__(self, info: Dict[str, Any]):
+        self.stage = {
+            "status": "ACTIVE",
+            "stageId": info["Stage ID"],
+            "attemptId": info["Stage Attempt ID"],
+            "numTasks": info["Number of Tasks"],
+            "numActiveTasks": 0,
+            "numCompleteTasks": 0,
+            "numFailedTasks": 0,
+            "numKilledTasks": 0,
+            "numCompletedIndices": 0,
+            "executorRunTime": 0,
+            "executorCpuTime": 0,
+            "inputBytes": 0,
+            "inputRecords": 0,
+            "outputBytes": 0,
+            "outputRecords": 0,
+            "shuffleReadBytes": 0,
+            "shuffleReadRecords": 0,
+            "shuffleWriteBytes": 0,
+            "shuffleWriteRecords": 0,
+            "memoryBytesSpilled": 0,
+            "diskBytesSpilled": 0,
+            "name": info["Stage Name"],
+        }
+        self.tasks: Dict[str, Dict[str, Any]] = dict()
+        self.completed_indices: Set[int] = set()
+
+    def add_task(self, task: Dict[str, Any]):
+        stage = self.stage
+        if task["status"] == "SUCCESS":
+            stage["numCompleteTasks"] += 1
+            self.completed_indices.add(task["index"])
+            stage["numCompletedIndices"] = len(self.completed_indices)
+        elif task["status"] == "KILLED":
+            stage["numKilledTasks"] += 1
+        else:
+            stage["numFailedTasks"] += 1
+        metrics = task["taskMetrics"]
+        if metrics:
+            shuffle_read = metrics["shuffleReadMetrics"]
+            stage["executorRunTime"] += metrics["executorRunTime"]
+            stage["executorCpuTime"] += metrics["executorCpuTime"]
+            stage["inputBytes"] += metrics["inputMetrics"]["bytesRead"]
+            stage["inputRecords"] += metrics["inputMetrics"]["recordsRead"]
+            stage["outputBytes"] += metrics["outputMetrics"]["bytesWritten"]
+            stage["outputRecords"] += metrics["outputMetrics"]["recordsWritten"]
+            stage["shuffleReadBytes"] += (
+                shuffle_read["remoteBytesRead"] + shuffle_read["localBytesRead"]
+            )
+            stage["shuffleReadRecords"] += shuffle_read["recordsRead"]
+            stage["shuffleWriteBytes"] += metrics["shuffleWriteMetrics"]["bytesWritten"]
+            stage["shuffleWriteRecords"] += metrics["shuffleWriteMetrics"]["recordsWritten"]
+            stage["memoryBytesSpilled"] += metrics["memoryBytesSpilled"]
+            stage["diskBytesSpilled"] += metrics["diskBytesSpilled"]
+        self.tasks[task["taskId"]] = task
+
+    def complete(self, info: Dict[str, Any]) -> RawStageTasks:
+        self.stage["status"] = "FAILED" if "Failure Reason" in info else "COMPLETE"
+        stage = Stage.prune(self.stage)
+        # Tasks are built in the Task schema already, see EventLogReplay.on_TaskEnd
+        payload = orjson.dumps({"stage": stage, "tasks": self.tasks})
+        return RawStageTasks(Stage(**stage), self.tasks, payload)
+
+
+def task_metrics(metrics: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not metrics:
+        return None
+    shuffle_read = metrics.get("Shuffle Read Metrics") or {}
+    shuffle_write = metrics.get("Shuffle Write Metrics") or {}
+    input_metrics = metrics.get("Input Metrics") or {}
+    output_metrics = metrics.get("Output Metrics") or {}
+    return {
+        "executorDeserializeTime": metrics.get("Executor Deserialize Time", 0),
+        "executorDeserializeCpuTime": metrics.get("Executor Deserialize CPU Time", 0),
+        "executorRunTime": metrics.get("Executor Run Time", 0),
+        "executorCpuTime": metrics.get("Executor CPU Time", 0),
+        "resultSize": metrics.get("Result Size", 0),
+        "jvmGcTime": metrics.get("JVM GC Time", 0),
+        "resultSerializationTime": metrics.get("Result Serialization Time", 0),
+        "memoryBytesSpilled": metrics.get("Memory Bytes Spilled", 0),
+        "diskBytesSpilled": metrics.get("Disk Bytes Spilled", 0),
+        "peakExecutionMemory": metrics.get("Peak Execution Memory", 0),
+        "inputMetrics": {
+            "bytesRead": input_metrics.get("Bytes Read", 0),
+            "recordsRead": input_metrics.get("Records Read", 0),
+        },
+        "outputMetrics": {
+            "bytesWritten": output_metrics.get("Bytes Written", 0),
+            "recordsWritten": output_metrics.get("Records Written", 0),
+        },
+        "shuffleReadMetrics": {
+            "remoteBlocksFetched": shuffle_read.get("Remote Blocks Fetched", 0),
+            "localBlocksFetched": shuffle_read.get("Local Blocks Fetched", 0),
+            "fetchWaitTime": shuffle_read.get("Fetch Wait Time", 0),
+            "remoteBytesRead": shuffle_read.get("Remote Bytes Read", 0),
+            "remoteBytesReadToDisk": shuffle_read.get("Remote Bytes Read To Disk", 0),
+            "localBytesRead": shuffle_read.get("Local Bytes Read", 0),
+            "recordsRead": shuffle_read.get("Total Records Read", 0),
+        },
+        "shuffleWriteMetrics": {
+            "bytesWritten": shuffle_write.get("Shuffle Bytes Written", 0),
+            "writeTime": shuffle_write.get("Shuffle Write Time", 0),
+            "recordsWritten": shuffle_write.get("Shuffle Records Written", 0),
+        },
+    }
+
+
+class EventLogReplay:
+    def __init__(self):
+        self.app_id: Optional[str] = None
+        self.spark_properties: Optional[List[List[str]]] = None
+        self.timestamp: Optional[int] = None
+        self.executors: Dict[str, Dict[str, Any]] = dict()
+        self.jobs: Dict[int, Dict[str, Any]] = dict()
+        self.stage_attempts: Dict[tuple, StageState] = dict()
+        # Completed stages and ids of running jobs they belong to
+        self.stages: Dict[int, RawStageTasks] = dict()
+        self.stage_jobs: Dict[int, Set[int]] = dict()
+        self.completed_jobs: Dict[str, RawJobStages] = dict()
+        self.completed_tasks = 0
+
+    def feed(self, event: Dict[str, Any]):
+        handler = getattr(self, "on_" + event["Event"][len("SparkListener") :], None)
+        if handler is not None:
+            handler(event)
+
+    def on_ApplicationStart(self, event):
+        self.app_id = event["App ID"]
+        self.timestamp = event["Timestamp"]
+
+    def on_EnvironmentUpdate(self, event):
+        properties = event["Spark Properties"]
+        if isinstance(properties, dict):
+            properties = list(properties.items())
+        self.spark_properties = properties
+
+    def _executor(self, executor_id) -> Dict[str, Any]:
+        if executor_id not in self.executors:
+            self.executors[executor_id] = {
+                "id": executor_id,
+                "hostPort": "",
+                "isActive": True,
+                "memoryUsed": 0,
+                "diskUsed": 0,
+                "totalCores": 0,
+                "maxTasks": 0,
+                "maxMemory": 0,
+                "totalShuffleRead": 0,
+                "totalShuffleWrite": 0,
+                "totalGCTime": 0,
+            }
+        return self.executors[executor_id]
+
+    def on_BlockManagerAdded(self, event):
+        block_manager = event["Block Manager ID"]
+        executor = self._executor(block_manager["Executor ID"])
+        executor["hostPort"] = f"{block_manager['Host']}:{block_manager['Port']}"
+        executor["maxMemory"] = event.get("Maximum Memory", 0)
+
+    def on_ExecutorAdded(self, event):
+        executor = self._executor(event["Executor ID"])
+        info = event["Executor Info"]
+        executor["totalCores"] = executor["maxTasks"] = info["Total Cores"]
+        if not executor["hostPort"]:
+            executor["hostPort"] = info["Host"]
+        executor["isActive"] = True
+        self.timestamp = event["Timestamp"]
+
+    def on_ExecutorRemoved(self, event):
+        self._executor(event["Executor ID"])["isActive"] = False
+        self.timestamp = event["Timestamp"]
+
+    def on_JobStart(self, event):
+        job_id = event["Job ID"]
+        infos = sorted(event.get("Stage Infos", []), key=lambda info: info["Stage ID"])
+        self.jobs[job_id] = {
+            "jobId": job_id,
+            "name": infos[-1]["Stage Name"] if infos else "",
+            "submissionTime": spark_time(event["Submission Time"]),
+            "stageIds": event["Stage IDs"],
+            "status": "RUNNING",
+        }
+        for stage_id in event["Stage IDs"]:
+            self.stage_jobs.setdefault(stage_id, set()).add(job_id)
+
+    def on_StageSubmitted(self, event):
+        info = event["Stage Info"]
+        self.stage_attempts[(info["Stage ID"], info["Stage Attempt ID"])] = StageState(info)
+
+    def on_TaskEnd(self, event):
+        state = self.stage_attempts.get((event["Stage ID"], event["Stage Attempt ID"]))
+        if state is None:
+            return
+        info = event["Task Info"]
+        status = "SUCCESS"
+        if info.get("Killed"):
+            status = "KILLED"
+        elif info.get("Failed"):
+            status = "FAILED"
+        metrics = task_metrics(event.get("Task Metrics"))
+        finish_time = info.get("Finish Time") or 0
+        duration = max(finish_time - info["Launch Time"], 0) if finish_time else None
+        # Fields of Task in their order, the stage payload is dumped without pruning
+        state.add_task(
+            {
+                "taskId": str(info["Task ID"]),
+                "index": info["Index"],
+                "attempt": info["Attempt"],
+                "executorId": info["Executor ID"],
+                "host": info["Host"],
+                "status": status,
+                "duration": duration,
+                "taskLocality": info["Locality"],
+                "speculative": info["Speculative"],
+                "taskMetrics": metrics,
+                "shuffleReadMetrics": {},
+                "shuffleWriteMetrics": {},
+            }
+        )
+        if metrics:
+            executor = self._executor(info["Executor ID"])
+            shuffle_read = metrics["shuffleReadMetrics"]
+            executor["totalGCTime"] += metrics["jvmGcTime"]
+            executor["totalShuffleRead"] += (
+                shuffle_read["remoteBytesRead"] + shuffle_read["localBytesRead"]
+            )
+            executor["totalShuffleWrite"] += metrics["shuffleWriteMetrics"]["bytesWritten"]
+        if finish_time:
+            self.timestamp = finish_time
+
+    def on_StageCompleted(self, event):
+        info = event["Stage Info"]
+        state = self.stage_attempts.pop((info["Stage ID"], info["Stage Attempt ID"]), None)
+        if state is None:
+            return
+        stage = state.complete(info)
+        if info["Stage ID"] in self.stage_jobs:
+            self.stages[info["Stage ID"]] = stage
+
+    def on_JobEnd(self, event):
+        job_data = self.jobs.pop(event["Job ID"], None)
+        if job_data is None:
+            return
+        result = event.get("Job Result", {}).get("Result")
+        job_data["status"] = "SUCCEEDED" if result == "JobSucceeded" else "FAILED"
+        job_data["completionTime"] = spark_time(event["Completion Time"])
+        self.timestamp = event["Completion Time"]
+        stages = dict()
+        for stage_id in job_data["stageIds"]:
+            stage = self.stages.get(stage_id)
+            if stage is not None and stage.stage.status == "COMPLETE":
+                stages[stage.stage.stageId] = stage
+            jobs = self.stage_jobs.get(stage_id, set())
+            jobs.discard(job_data["jobId"])
+            if not jobs:
+                self.stage_jobs.pop(stage_id, None)
+                self.stages.pop(stage_id, None)
+        job = Job.create_from_dict(job_data)
+        self.completed_jobs[job.jobId] = RawJobStages(job, stages)
+        self.completed_tasks += sum(len(stage.tasks) for stage in stages.values())
+
+    def take_completed_jobs(self) -> Dict[str, RawJobStages]:
+        completed, self.completed_jobs = self.completed_jobs, dict()
+        self.completed_tasks = 0
+        return completed
+
+    def executor_metrics(self) -> List[Executor]:
+        return [Executor.create_from_dict(e) for e in self.executors.values()]
+
+
+class EventLogLoader(ApplicationLoader):
+    """Loads an event log into the sinks of ApplicationLoader.
+
+    Completed jobs are written when there are `batch_jobs` of them or they
+    have `batch_tasks` tasks, which bounds memory held by a batch.
+    """
+
+    name = "event_log_loader"
+
+    def __init__(
+        self,
+        path,
+        *,
+        app_id=None,
+        batch_jobs=100,
+        batch_tasks=50000,
+        redis=None,
+        graphite=None,
+    ):
+        super().__init__(
+            None,
+            app_id or read_app_id(path),
+            fetch_last_jobs=0,
+            redis=redis,
+            graphite=graphite,
+        )
+        self.path = path
+        self.batch_jobs = batch_jobs
+        self.batch_tasks = batch_tasks
+        self.replay = EventLogReplay()
+        self.loaded_jobs = 0
+
+    async def load(self, events: Optional[Iterable[Dict[str, Any]]] = None):
+        self.stored_job_ids = await self.load_stored_jobs()
+        configuration_stored = False
+        started = time.perf_counter()
+        replay = self.replay
+        for event in read_events(self.path) if events is None else events:
+            replay.feed(event)
+            if not configuration_stored and replay.spark_properties is not None:
+                await self.store_configuration_info(replay.spark_properties)
+                configuration_stored = True
+            if (
+                len(replay.completed_jobs) >= self.batch_jobs
+                or replay.completed_tasks >= self.batch_tasks
+            ):
+                await self.report_batch()
+        await self.report_batch()
+        print(
+            f"Loaded {self.loaded_jobs} jobs of {self.app_id} from {self.path}"
+            f" in {time.perf_counter() - started:.1f} s"
+        )
+
+    async def report_batch(self):
+        jobs = {
+            job_id: job_data
+            for job_id, job_data in self.replay.take_completed_jobs().items()
+            if int(job_id) not in self.stored_job_ids
+        }
+        metrics = ApplicationMetrics(
+            executor_metrics=self.replay.executor_metrics(), jobs_stages=jobs
+        )
+        # Series are sent at the time of the last event, not the time of loading
+        timestamp = (self.replay.timestamp or 0) / 1000 or time.time()
+        with span("event_log.report", root=True, app_id=self.app_id, jobs=len(jobs)):
+            self.loaded_jobs += await self._report_metrics(metrics, timestamp)
+
+
+async def load_event_logs(paths, *, batch_jobs=100):
+    redis = await db.connect_with_redis()
+    graphite = db.connect_with_graphtie("loader")
+    for path in paths:
+        loader = EventLogLoader(path, batch_jobs=batch_jobs, redis=redis, graphite=graphite)
+        await loader.load()
@@ -1,16 +1,23 @@
 import abc
 import asyncio
+import time
 
 import aiohttp
+import orjson
 from yarl import URL
 
 from spark_logs.config import DEFAULT_CONFIG
+from spark_logs.instrumentation import FETCH_LATENCY, FETCH_BYTES
+from spark_logs.loaders.scheduler import ApiHealth
+from spark_logs.tracing import span
 
 
 class BaseFetcher:
     def __init__(self, *, config=None):
-        self.fetch_lock = asyncio.Lock()
         self.config = config or DEFAULT_CONFIG
+        # Requests to one cluster made at a time
+        self.fetch_slots = asyncio.Semaphore(self.config.get("fetch_concurrency") or 1)
+        self.health = ApiHealth()
 
     @abc.abstractmethod
     async def fetch(self, **kwargs):
@@ -23,6 +30,11 @@ class HttpFetcher(BaseFetcher):
 
         if node == "applications":
             return base_url / "cluster"
+        if node == "yarn_apps":
+            query = {k: str(v) for k, v in data.items() if v is not None}
+            return (base_url / "ws" / "v1" / "cluster" / "apps").with_query(query)
+        if node == "yarn_app":
+            return base_url / "ws" / "v1" / "cluster" / "apps" / data["application_id"]
 
         application_id = data.pop("application_id")
         api_url = (
@@ -61,17 +73,40 @@ class HttpFetcher(BaseFetcher):
         raise NotImplementedError()
 
     async def fetch(self, *, node, resp_format, **data):
-        async with self.fetch_lock:
-            await asyncio.sleep(0.3)  # For not making too much requests per second
-            async with aiohttp.client.ClientSession() as session:
-                url = self.get_url(node=node, **data)
-                print(url)
-                response = await session.get(url)
-                response.raise_for_status()
-                if resp_format is "meta":
-                    return response
-                if resp_format == "json":
-                    return await response.json()
-                if resp_format == "html":
-                    return await response.text()
-                raise NotImplementedError()
+        # Own time of the span is waiting for a slot and the interval
+        with span("fetch", node=node):
+            async with self.fetch_slots:
+                # For not making too much requests per second
+                fetch_interval = self.config.get("fetch_interval")
+                await asyncio.sleep(0.3 if fetch_interval is None else fetch_interval)
+                started = time.perf_counter()
+                try:
+                    with span("fetch.http", node=node):
+                        response = await self._request(
+                            node=node, resp_format=resp_format, **data
+                        )
+                except Exception:
+                    self.health.observe(time.perf_counter() - started, error=True)
+                    raise
+                self.health.observe(time.perf_counter() - started)
+                return response
+
+    async def _request(self, *, node, resp_format, **data):
+        async with aiohttp.client.ClientSession() as session:
+            url = self.get_url(node=node, **data)
+            print(url)
+            started = time.perf_counter()
+            response = await session.get(url)
+            response.raise_for_status()
+            if resp_format is "meta":
+                return response
+            body = await response.read()
+            FETCH_LATENCY.labels(node=node).observe(time.perf_counter() - started)
+            FETCH_BYTES.labels(node=node).inc(len(body))
+            if resp_format == "bytes":
+                return body
+            if resp_format == "json":
+                return orjson.loads(body)
+            if resp_format == "html":
+                return await response.text()
+            raise NotImplementedError()
@@ -0,0 +1,72 @@
+"""Compact index of stored job ids.
+
+Redis keeps stored job ids of an app as a bitmap, bit `job_id` is set when
+the job is stored. In process they are sorted disjoint ranges: job ids are
+sequential, so an app with millions of jobs needs a handful of ranges, and
+loading the index is one GET of a bitmap of `max job id / 8` bytes.
+"""
+import bisect
+import re
+from typing import Iterable, List, Tuple
+
+# Runs of fully set bytes and single partially set bytes of a bitmap
+_SET_BITS = re.compile(rb"\xff+|[^\x00\xff]")
+
+
+class JobIdRanges:
+    def __init__(self, job_ids: Iterable[int] = ()):
+        # Range i is [starts[i], ends[i])
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        for job_id in job_ids:
+            self.add(job_id)
+
+    @classmethod
+    def from_bitmap(cls, bitmap: bytes) -> "JobIdRanges":
+        ranges = cls()
+        for match in _SET_BITS.finditer(bitmap or b""):
+            start, end = match.span()
+            if end - start > 1 or bitmap[start] == 0xFF:
+                ranges._append(start * 8, end * 8)
+                continue
+            byte = bitmap[start]
+            # Redis bitmaps start from the most significant bit
+            for bit in range(8):
+                if byte & (0x80 >> bit):
+                    ranges._append(start * 8 + bit, start * 8 + bit + 1)
+        return ranges
+
+    def _append(self, start, end):
+        """Adds a range after all existing ones"""
+        if self.ends and self.ends[-1] == start:
+            self.ends[-1] = end
+        else:
+            self.starts.append(start)
+            self.ends.append(end)
+
+    def add(self, job_id: int):
+        idx = bisect.bisect_right(self.starts, job_id)
+        if idx and job_id < self.ends[idx - 1]:
+            return
+        joins_previous = idx and self.ends[idx - 1] == job_id
+        joins_next = idx < len(self.starts) and self.starts[idx] == job_id + 1
+        if joins_previous and joins_next:
+            self.ends[idx - 1] = self.ends[idx]
+            del self.starts[idx], self.ends[idx]
+        elif joins_previous:
+            self.ends[idx - 1] = job_id + 1
+        elif joins_next:
+            self.starts[idx] = job_id
+        else:
+            self.starts.insert(idx, job_id)
+            self.ends.insert(idx, job_id + 1)
+
+    def __contains__(self, job_id: int) -> bool:
+        idx = bisect.bisect_right(self.starts, job_id)
+        return bool(idx) and job_id < self.ends[idx - 1]
+
+    def __len__(self):
+        return sum(end - start for start, end in zip(self.starts, self.ends))
+
+    def ranges(self) -> List[Tuple[int, int]]:
+        return list(zip(self.starts, self.ends))
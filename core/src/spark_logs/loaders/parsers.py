@@ -2,9 +2,11 @@ import abc
 
 import json
 
+import orjson
 from lxml import html
 
-from spark_logs.types import Stage, Job, Task, StageTasks
+from spark_logs.tracing import span
+from spark_logs.types import Stage, Job, Task, StageTasks, RawStageTasks
 
 
 class BaseParser:
@@ -12,7 +14,11 @@ class BaseParser:
     node_cls = None
 
     def execute(self, response_data):
-        return self._node_transform(self._parse(response_data))
+        parser = type(self).__name__
+        with span("parse", parser=parser):
+            data = self._parse(response_data)
+        with span("decode", parser=parser):
+            return self._node_transform(data)
 
     def _parse(self, data):
         return data
@@ -71,6 +77,37 @@ class StageExtendedParser(JsonParser):
         )
 
 
+class StagePassthroughParser(BaseParser):
+    """Stage decoded from response bytes and pruned in one step, see RawStageTasks"""
+
+    resp_format = "bytes"
+
+    def _parse(self, data):
+        data, *_ = orjson.loads(data)  # Stage data is a list of one element
+        return data
+
+    def _node_transform(self, data):
+        return RawStageTasks.from_spark(data)
+
+
+class YarnApps(JsonParser):
+    """Applications of ResourceManager REST API in the shape of AppIdsFromHtml"""
+
+    def _parse(self, data):
+        apps = (data.get("apps") or {}).get("app") or []
+        return [
+            {
+                "ID": app["id"],
+                "Name": app["name"],
+                "User": app["user"],
+                "Queue": app.get("queue"),
+                "State": app["state"],
+                "StartTime": str(app["startedTime"]),
+            }
+            for app in apps
+        ]
+
+
 class AppIdsFromHtml(BaseParser):
     resp_format = "html"
 
@@ -0,0 +1,111 @@
+"""Bounded stages between the steps of a loader round.
+
+A stage holds up to `size` items in its queue and handles them with
+`workers` tasks. Putting into a full stage waits until it has room, so a slow
+stage slows down the ones before it and memory is bounded by the queue sizes.
+A stage with `merge` instead takes its oldest queued item out and merges it
+into the item handled after it, for items a newer one can absorb.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Any, Optional
+
+from spark_logs.instrumentation import PIPELINE_MERGES, PIPELINE_QUEUE, PIPELINE_WAIT
+
+
+class Stage:
+    def __init__(
+        self,
+        name,
+        handler: Callable[[Any], Awaitable[None]],
+        *,
+        size=1,
+        workers=1,
+        merge: Optional[Callable[[Any, Any], Any]] = None,
+        app_id="",
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        # merge(older, newer) returns the item standing for both
+        self.merge = merge
+        self.app_id = app_id
+        self.queue: asyncio.Queue = asyncio.Queue(size)
+        self.merged = 0
+        # Items taken out of a full queue, merged into the next handled one
+        self._carry = None
+        self._has_carry = False
+        self._occupancy = PIPELINE_QUEUE.labels(stage=name, app_id=app_id)
+
+    async def put(self, item):
+        if self.merge is not None and self.queue.full():
+            oldest = self.queue.get_nowait()
+            self.queue.task_done()
+            self._absorb(oldest)
+            self.merged += 1
+            PIPELINE_MERGES.labels(stage=self.name).inc()
+        started = time.perf_counter()
+        await self.queue.put(item)
+        PIPELINE_WAIT.labels(stage=self.name).observe(time.perf_counter() - started)
+        self._occupancy.set(self.queue.qsize())
+
+    def _absorb(self, item):
+        if self._has_carry:
+            item = self.merge(self._carry, item)
+        self._carry, self._has_carry = item, True
+
+    async def _work(self):
+        while True:
+            item = await self.queue.get()
+            # Items taken out of the queue were ahead of this one
+            if self._has_carry:
+                item = self.merge(self._carry, item)
+                self._carry, self._has_carry = None, False
+            self._occupancy.set(self.queue.qsize())
+            try:
+                await self.handler(item)
+            finally:
+                self.queue.task_done()
+
+    def start(self) -> List[asyncio.Task]:
+        return [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def join(self):
+        """Waits until every queued item is handled"""
+        await self.queue.join()
+
+    def close(self):
+        """Removes the occupancy gauge of a stage not used anymore"""
+        try:
+            PIPELINE_QUEUE.remove(self.name, self.app_id)
+        except KeyError:
+            pass
+
+
+async def run_stages(producer: Awaitable[None], stages: List[Stage]):
+    """Runs `producer` with the workers of `stages`, the first failure stops all.
+
+    When the producer returns, items queued in the stages are handled first.
+    """
+    tasks = [asyncio.ensure_future(producer)]
+    for stage in stages:
+        tasks += stage.start()
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+        drained = asyncio.ensure_future(_drain(stages))
+        tasks.append(drained)
+        done, _ = await asyncio.wait(tasks[1:], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _drain(stages: List[Stage]):
+    # In order, a stage puts into the next ones
+    for stage in stages:
+        await stage.join()
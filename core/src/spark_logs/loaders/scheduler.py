@@ -0,0 +1,218 @@
+"""Adaptive polling of applications sharing one Spark REST API budget.
+
+Every application is polled again after the time it is expected to complete
+`jobs_per_poll` jobs, estimated by an EWMA of its job completion rate and
+clamped to [min_interval, max_interval]. Every round without new jobs
+multiplies the interval by `idle_backoff` up to `max_interval`, so idle
+applications back off geometrically, and applications with a backlog of jobs
+to fetch are polled again after `min_interval`. Applications
+with older jobs to backfill are polled at least every `backfill_interval`.
+
+Rounds of all applications take their expected number of requests from one
+token bucket. While the bucket is empty, turns are granted in order of due
+time, so applications with expensive rounds do not starve the others.
+Intervals are stretched while the API is slow or failing, and apps with
+failed rounds wait for the backoff of their circuit breakers.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, NamedTuple, Optional
+
+from spark_logs.instrumentation import POLL_INTERVAL
+
+
+class Ewma:
+    def __init__(self, alpha, value: Optional[float] = None):
+        self.alpha = alpha
+        self.value = value
+
+    def update(self, x) -> float:
+        if self.value is None:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, tokens) -> float:
+        """Seconds until `tokens` are available, capped by capacity"""
+        self._refill()
+        missing = min(tokens, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, tokens):
+        self._refill()
+        self.tokens -= min(tokens, self.capacity)
+
+
+class ApiHealth:
+    """Latency and error rate of Spark REST API requests"""
+
+    def __init__(self, alpha=0.2):
+        self.latency = Ewma(alpha)
+        self.errors = Ewma(alpha, 0.0)
+
+    def observe(self, latency, error=False):
+        self.latency.update(latency)
+        self.errors.update(1.0 if error else 0.0)
+
+    def slowdown(self, slow_latency) -> float:
+        """Multiplier of polling intervals, 1 for a healthy API"""
+        factor = 1.0
+        if self.latency.value is not None and self.latency.value > slow_latency:
+            factor *= self.latency.value / slow_latency
+        # Up to 5 times longer intervals when all requests fail
+        return factor * (1 + 4 * self.errors.value)
+
+
+class PollResult(NamedTuple):
+    completed_jobs: int
+    requests: int
+    # More jobs to fetch than one round loads
+    backlog: bool = False
+    # Older jobs left to the backfill lane
+    backfill: bool = False
+
+
+class AppSchedule:
+    def __init__(self, interval, alpha, fixed=False):
+        self.interval = interval
+        self.fixed = fixed
+        self.rate = Ewma(alpha)
+        self.requests = Ewma(alpha, 1.0)
+        self.due = 0.0
+        self.reported: Optional[float] = None
+
+
+class PollingScheduler:
+    def __init__(
+        self,
+        health: ApiHealth,
+        *,
+        requests_per_second=3,
+        burst=30,
+        min_interval=2,
+        max_interval=300,
+        default_interval=10,
+        backfill_interval=30,
+        jobs_per_poll=1,
+        idle_backoff=2.0,
+        slow_latency=1.0,
+        alpha=0.3,
+    ):
+        self.health = health
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval
+        self.backfill_interval = backfill_interval
+        self.jobs_per_poll = jobs_per_poll
+        self.idle_backoff = idle_backoff
+        self.slow_latency = slow_latency
+        self.alpha = alpha
+        self.apps: Dict[str, AppSchedule] = dict()
+        self._ready = []
+        self._sequence = itertools.count()
+        self._condition = asyncio.Condition()
+
+    def register(self, app_id, interval=None):
+        """Adds an app, `interval` makes its polling interval fixed"""
+        if app_id not in self.apps:
+            self.apps[app_id] = AppSchedule(
+                interval or self.default_interval, self.alpha, fixed=interval is not None
+            )
+
+    def unregister(self, app_id):
+        self.apps.pop(app_id, None)
+        try:
+            POLL_INTERVAL.remove(app_id)
+        except KeyError:
+            pass
+
+    async def wait_turn(self, app_id):
+        self.register(app_id)
+        schedule = self.apps[app_id]
+        await asyncio.sleep(max(0.0, schedule.due - time.monotonic()))
+
+        cost = schedule.requests.value
+        entry = (schedule.due, next(self._sequence), app_id)
+        granted = False
+        async with self._condition:
+            heapq.heappush(self._ready, entry)
+            try:
+                while True:
+                    delay = None
+                    if self._ready[0] == entry:
+                        delay = self.bucket.delay(cost)
+                        if delay <= 0:
+                            break
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                heapq.heappop(self._ready)
+                self.bucket.take(cost)
+                granted = True
+            finally:
+                if not granted:
+                    self._ready.remove(entry)
+                    heapq.heapify(self._ready)
+                self._condition.notify_all()
+
+    def report(self, app_id, result: PollResult):
+        schedule = self.apps.get(app_id)
+        if schedule is None:
+            return
+        now = time.monotonic()
+        schedule.requests.update(result.requests)
+        if schedule.reported is not None:
+            schedule.rate.update(result.completed_jobs / max(now - schedule.reported, 1e-3))
+        schedule.reported = now
+
+        if not schedule.fixed and result.backlog:
+            schedule.interval = self.min_interval
+        elif not schedule.fixed and result.completed_jobs == 0:
+            # The rate of 0 would jump straight to max_interval
+            schedule.interval = min(self.max_interval, schedule.interval * self.idle_backoff)
+        elif not schedule.fixed and schedule.rate.value is not None:
+            interval = self.jobs_per_poll / max(schedule.rate.value, 1e-9)
+            schedule.interval = min(self.max_interval, max(self.min_interval, interval))
+        if not schedule.fixed and result.backfill:
+            schedule.interval = min(schedule.interval, self.backfill_interval)
+
+        interval = schedule.interval * self.health.slowdown(self.slow_latency)
+        schedule.due = now + interval
+        POLL_INTERVAL.labels(app_id=app_id).set(interval)
+
+    def back_off(self, app_id, delay):
+        """After a failed round the app is polled after its interval or `delay`"""
+        schedule = self.apps.get(app_id)
+        if schedule is None:
+            return
+        interval = max(delay, schedule.interval * self.health.slowdown(self.slow_latency))
+        schedule.due = time.monotonic() + interval
+        POLL_INTERVAL.labels(app_id=app_id).set(interval)
+
+    def has_spare_budget(self) -> bool:
+        """No other app waits for its turn and the bucket is at least half full"""
+        return not self._ready and self.bucket.delay(self.bucket.capacity / 2) <= 0
+
+    def interval(self, app_id) -> Optional[float]:
+        schedule = self.apps.get(app_id)
+        if schedule is None:
+            return None
+        return schedule.interval * self.health.slowdown(self.slow_latency)
@@ -0,0 +1,167 @@
+"""Assignment of applications to loader instances sharing one Redis.
+
+Every instance heartbeats into a zset of live instances. Applications to
+load are registered in a set, each one is owned by the instance with the
+highest rendezvous hash among live ones and is polled only while the owner
+holds its lease. When instances join or die, rendezvous hashing moves only
+the applications of the changed instance: previous owners release them,
+leases of dead instances expire and new owners claim them on their next
+round. Work done once for all instances, like discovering applications, is
+run by the leader, the live instance with the lowest id.
+"""
+import asyncio
+import hashlib
+import os
+import socket
+import time
+import uuid
+from typing import Iterable, Dict, List, Set, Callable, Awaitable
+
+from aioredis import Redis
+
+from spark_logs import kvstore
+
+# Lease is renewed only by its holder and released only by its holder
+RENEW_LEASE = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LEASE = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+def rendezvous_score(instance_id, app_id) -> int:
+    digest = hashlib.blake2b(f"{instance_id}/{app_id}".encode(), digest_size=8)
+    return int.from_bytes(digest.digest(), "big")
+
+
+def rendezvous_owner(app_id, instances: Iterable[str]):
+    return max(instances, key=lambda instance: rendezvous_score(instance, app_id), default=None)
+
+
+def assign(app_ids: Iterable[str], instances: Iterable[str]) -> Dict[str, str]:
+    instances = sorted(instances)
+    return {app_id: rendezvous_owner(app_id, instances) for app_id in app_ids}
+
+
+def default_instance_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class LoaderCoordinator:
+    def __init__(
+        self,
+        redis: Redis,
+        *,
+        on_claim: Callable[[str], Awaitable],
+        on_release: Callable[[str], Awaitable],
+        instance_id=None,
+        heartbeat_interval=5,
+    ):
+        self.redis = redis
+        self.on_claim = on_claim
+        self.on_release = on_release
+        self.instance_id = instance_id or default_instance_id()
+        self.heartbeat_interval = heartbeat_interval
+        # Instance or lease is dead after three missed heartbeats
+        self.ttl = heartbeat_interval * 3
+        self.owned: Set[str] = set()
+        # Live instances seen by the last heartbeat
+        self.instances: List[str] = []
+
+    async def loop_coordinate(self):
+        try:
+            while True:
+                await self.coordinate()
+                await asyncio.sleep(self.heartbeat_interval)
+        except asyncio.CancelledError:
+            await self.shutdown()
+            raise
+        except Exception:
+            import traceback
+
+            traceback.print_exc()
+            raise
+
+    async def coordinate(self):
+        instances = await self.heartbeat()
+        app_ids = {x.decode() for x in await self.redis.smembers(kvstore.loader_apps_key())}
+        assignment = assign(app_ids, instances)
+        desired = {app_id for app_id, owner in assignment.items() if owner == self.instance_id}
+
+        for app_id in sorted(self.owned - desired):
+            await self.release(app_id)
+        for app_id in sorted(self.owned & desired):
+            if not await self.renew(app_id):
+                print(f"Lease for {app_id} is lost")
+                await self.drop(app_id)
+        for app_id in sorted(desired - self.owned):
+            await self.claim(app_id)
+
+    async def heartbeat(self) -> List[str]:
+        now = time.time()
+        key = kvstore.loader_instances_key()
+        transaction = self.redis.multi_exec()
+        transaction.zadd(key, now, self.instance_id)
+        transaction.zremrangebyscore(key, max=now - self.ttl)
+        transaction.zrange(key)
+        *_, instances = await transaction.execute()
+        self.instances = sorted(x.decode() for x in instances)
+        return self.instances
+
+    def is_leader(self) -> bool:
+        return bool(self.instances) and self.instances[0] == self.instance_id
+
+    async def claim(self, app_id) -> bool:
+        claimed = await self.redis.set(
+            kvstore.loader_lease_key(app_id=app_id),
+            self.instance_id,
+            pexpire=int(self.ttl * 1000),
+            exist=self.redis.SET_IF_NOT_EXIST,
+        )
+        if claimed:
+            print(f"{self.instance_id}: claimed {app_id}")
+            self.owned.add(app_id)
+            await self.on_claim(app_id)
+        return bool(claimed)
+
+    async def renew(self, app_id) -> bool:
+        return bool(
+            await self.redis.eval(
+                RENEW_LEASE,
+                keys=[kvstore.loader_lease_key(app_id=app_id)],
+                args=[self.instance_id, int(self.ttl * 1000)],
+            )
+        )
+
+    async def release(self, app_id):
+        await self.drop(app_id)
+        await self.redis.eval(
+            RELEASE_LEASE,
+            keys=[kvstore.loader_lease_key(app_id=app_id)],
+            args=[self.instance_id],
+        )
+        print(f"{self.instance_id}: released {app_id}")
+
+    async def drop(self, app_id):
+        self.owned.discard(app_id)
+        await self.on_release(app_id)
+
+    async def shutdown(self):
+        """Hands applications over right away instead of after lease expiry"""
+        for app_id in sorted(self.owned):
+            await self.release(app_id)
+        await self.redis.zrem(kvstore.loader_instances_key(), self.instance_id)
+
+    async def owners(self) -> Dict[str, str]:
+        app_ids = sorted(x.decode() for x in await self.redis.smembers(kvstore.loader_apps_key()))
+        if not app_ids:
+            return {}
+        leases = await self.redis.mget(*[kvstore.loader_lease_key(app_id=x) for x in app_ids])
+        return {app_id: lease and lease.decode() for app_id, lease in zip(app_ids, leases)}
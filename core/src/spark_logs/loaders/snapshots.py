@@ -0,0 +1,104 @@
+"""Change detection of executors and running jobs between loader rounds.
+
+Every executor is stored as a hash of JSON field values, so a round writes
+only fields that changed since the previous round and sends to graphite
+only series that changed. Running jobs are stored in one hash by job id and
+a job is rewritten only when its data changes. Writes are queued into the
+transaction of the loader round.
+"""
+from typing import Dict, List, Set, Tuple, Optional
+
+from aioredis import Redis
+from aioredis.commands import MultiExec
+
+from spark_logs import kvstore
+from spark_logs.types import Executor, RawJobStages
+
+# executor id -> field -> JSON value
+ExecutorFields = Dict[str, Dict[str, bytes]]
+
+
+class ExecutorsSnapshot:
+    def __init__(self, app_id):
+        self.app_id = app_id
+        self.executors: Optional[ExecutorFields] = None
+
+    async def load(self, redis: Redis):
+        executor_ids = [
+            x.decode() for x in await redis.smembers(kvstore.executors_key(app_id=self.app_id))
+        ]
+        pipeline = redis.pipeline()
+        for executor_id in executor_ids:
+            pipeline.hgetall(kvstore.executor_key(app_id=self.app_id, executor_id=executor_id))
+        self.executors = {
+            executor_id: {name.decode(): value for name, value in fields.items()}
+            for executor_id, fields in zip(executor_ids, await pipeline.execute())
+        }
+
+    def diff(self, executors: List[Executor]) -> Tuple[ExecutorFields, Set[str]]:
+        """Changed fields of present executors, all fields of new ones, and removed ids"""
+        previous = self.executors or dict()
+        changed = dict()
+        for executor in executors:
+            fields = executor.dump_fields()
+            known = previous.get(executor.id, {})
+            changed_fields = {
+                name: value for name, value in fields.items() if known.get(name) != value
+            }
+            if changed_fields:
+                changed[executor.id] = changed_fields
+        removed = previous.keys() - {executor.id for executor in executors}
+        return changed, removed
+
+    async def update(
+        self, redis: Redis, transaction: MultiExec, executors: List[Executor]
+    ) -> ExecutorFields:
+        """Queues writes of changes into `transaction`, call `reset` if it fails"""
+        if self.executors is None:
+            await self.load(redis)
+        changed, removed = self.diff(executors)
+
+        for executor_id, fields in changed.items():
+            transaction.hmset_dict(
+                kvstore.executor_key(app_id=self.app_id, executor_id=executor_id), fields
+            )
+            self.executors.setdefault(executor_id, {}).update(fields)
+        if changed:
+            transaction.sadd(kvstore.executors_key(app_id=self.app_id), *changed)
+        for executor_id in removed:
+            transaction.delete(kvstore.executor_key(app_id=self.app_id, executor_id=executor_id))
+            del self.executors[executor_id]
+        if removed:
+            transaction.srem(kvstore.executors_key(app_id=self.app_id), *removed)
+        return changed
+
+    def reset(self):
+        self.executors = None
+
+
+class RunningJobsSnapshot:
+    def __init__(self, app_id):
+        self.app_id = app_id
+        self.jobs: Optional[Dict[str, bytes]] = None
+
+    async def update(
+        self, redis: Redis, transaction: MultiExec, running_jobs: Dict[str, RawJobStages]
+    ):
+        key = kvstore.running_jobs_key(app_id=self.app_id)
+        if self.jobs is None:
+            self.jobs = {
+                job_id.decode(): data for job_id, data in (await redis.hgetall(key)).items()
+            }
+        dumped = {job_id: job_data.dump() for job_id, job_data in running_jobs.items()}
+        changed = {
+            job_id: data for job_id, data in dumped.items() if self.jobs.get(job_id) != data
+        }
+        finished = self.jobs.keys() - dumped.keys()
+        if changed:
+            transaction.hmset_dict(key, changed)
+        if finished:
+            transaction.hdel(key, *finished)
+        self.jobs = dumped
+
+    def reset(self):
+        self.jobs = None
@@ -0,0 +1,93 @@
+"""Completed stages of running jobs, kept between loader rounds.
+
+A running job is fetched every round with all its stages, but a completed
+or skipped stage attempt never changes. The cache keeps such attempts
+serialized and the loader refetches only active and pending stages.
+Stages of a job are evicted when the job completes, and the least
+recently used attempts when the cache is full, so jobs that never complete
+are forgotten with their last stage. A stage failing makes Spark
+resubmit the stages it depends on as new attempts, so stages of a job are
+also evicted when its number of failed stages changes.
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from spark_logs.instrumentation import STAGE_CACHE_REQUESTS
+from spark_logs.types import RawStageTasks
+
+FINAL_STATUSES = ("COMPLETE", "SKIPPED")
+
+
+class StageCache:
+    def __init__(self, max_stages=5000):
+        self.max_stages = max_stages
+        # (stageId, attemptId) -> serialized RawStageTasks
+        self.stages: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        # Latest cached attempt of a stage
+        self.attempts: Dict[str, int] = dict()
+        self.job_stages: Dict[str, Set[str]] = dict()
+        # Jobs listing a stage, a skipped stage may be listed by several
+        self.stage_jobs: Dict[str, Set[str]] = dict()
+        # Failed stages of a job when its stages were cached
+        self.job_failures: Dict[str, int] = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, stage_id) -> Optional[RawStageTasks]:
+        stage_id = str(stage_id)
+        key = (stage_id, self.attempts.get(stage_id))
+        data = self.stages.get(key)
+        STAGE_CACHE_REQUESTS.labels(result="miss" if data is None else "hit").inc()
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.stages.move_to_end(key)
+        return RawStageTasks.from_json(data)
+
+    def check_job(self, job_id, failed_stages):
+        """Evicts stages of a job whose stages failed since they were cached"""
+        cached = self.job_failures.get(job_id)
+        if cached is not None and cached != failed_stages:
+            self.evict_job(job_id)
+
+    def put(self, job_id, stages: Iterable[RawStageTasks], failed_stages=0):
+        """Caches final stage attempts of a running job"""
+        for stage_and_tasks in stages:
+            stage = stage_and_tasks.stage
+            if stage.status not in FINAL_STATUSES:
+                continue
+            key = (stage.stageId, stage.attemptId)
+            if key not in self.stages:
+                previous = self.attempts.get(stage.stageId)
+                if previous is not None:
+                    self.stages.pop((stage.stageId, previous), None)
+                self.stages[key] = stage_and_tasks.dump()
+                self.attempts[stage.stageId] = stage.attemptId
+            self.job_stages.setdefault(job_id, set()).add(stage.stageId)
+            self.stage_jobs.setdefault(stage.stageId, set()).add(job_id)
+        # Jobs without cached stages have nothing to evict
+        if job_id in self.job_stages:
+            self.job_failures[job_id] = failed_stages
+        while len(self.stages) > self.max_stages:
+            (stage_id, attempt_id), _ = self.stages.popitem(last=False)
+            if self.attempts.get(stage_id) == attempt_id:
+                del self.attempts[stage_id]
+                self._forget_stage(stage_id)
+
+    def evict_job(self, job_id):
+        for stage_id in list(self.job_stages.get(job_id, ())):
+            attempt_id = self.attempts.pop(stage_id, None)
+            self.stages.pop((stage_id, attempt_id), None)
+            self._forget_stage(stage_id)
+        self.job_stages.pop(job_id, None)
+        self.job_failures.pop(job_id, None)
+
+    def _forget_stage(self, stage_id):
+        # Drops jobs left without cached stages
+        for job_id in self.stage_jobs.pop(stage_id, ()):
+            job_stages = self.job_stages.get(job_id, set())
+            job_stages.discard(stage_id)
+            if not job_stages:
+                self.job_stages.pop(job_id, None)
+                self.job_failures.pop(job_id, None)
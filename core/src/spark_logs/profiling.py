@@ -0,0 +1,191 @@
+"""On-demand sampling profiler and event loop lag monitor.
+
+`/debug/profile?seconds=N` samples the stacks of the event loop thread from
+a separate thread and returns them collapsed (flamegraph.pl, speedscope
+import) or as speedscope JSON with `format=speedscope`. The route requires
+`debug_token` from config in the `X-Debug-Token` header and is disabled when
+no token is configured.
+
+The loop lag monitor wakes up every `interval` and measures how late it is.
+A watchdog thread prints the loop thread stack when the loop does not wake
+up for more than `threshold`, which points at the blocking call itself.
+"""
+import asyncio
+import hmac
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Dict, Optional
+
+from aiohttp import web
+from prometheus_client import Histogram
+
+from spark_logs.config import DEFAULT_CONFIG
+
+MAX_PROFILE_SECONDS = 60
+
+LOOP_LAG = Histogram(
+    "luxmeter_event_loop_lag_seconds",
+    "Delay of event loop wake ups",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+def frame_stack(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class StackSampler:
+    """Statistical profiler of one thread, samples its stack every `interval`"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.duration = 0.0
+
+    def run(self, seconds):
+        started = time.perf_counter()
+        deadline = started + seconds
+        while time.perf_counter() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[frame_stack(frame)] += 1
+            del frame
+            time.sleep(self.interval)
+        self.duration = time.perf_counter() - started
+
+    def collapsed(self) -> str:
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+    def speedscope(self, name="profile") -> Dict:
+        frames, frame_index = [], {}
+        samples, weights = [], []
+        for stack, count in self.samples.items():
+            sample = []
+            for frame_name in stack.split(";"):
+                if frame_name not in frame_index:
+                    frame_index[frame_name] = len(frames)
+                    frames.append({"name": frame_name})
+                sample.append(frame_index[frame_name])
+            samples.append(sample)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold=0.1, interval=0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self._stopped = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self.monitor())
+        self._watchdog = threading.Thread(
+            target=self.watch, name="loop-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def monitor(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.heartbeat = time.monotonic()
+            lag = self.heartbeat - expected
+            LOOP_LAG.observe(max(lag, 0.0))
+            if lag > self.threshold:
+                print(f"Event loop was blocked for {lag:.3f}s")
+
+    def watch(self):
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self.heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            # One stack per blocking episode, caught while it is still blocking
+            if blocked_for > self.threshold and reported != heartbeat:
+                reported = heartbeat
+                frame = sys._current_frames().get(self.loop_thread_id)
+                if frame is None:
+                    continue
+                print(
+                    f"Event loop blocked for {blocked_for:.3f}s, loop thread stack:\n"
+                    + "".join(traceback.format_stack(frame))
+                )
+                del frame
+
+
+async def start_loop_monitor(app: web.Application):
+    monitor = LoopLagMonitor(
+        threshold=DEFAULT_CONFIG.get("loop_lag_threshold") or 0.1
+    )
+    monitor.start()
+    app["LOOP_MONITOR"] = monitor
+
+
+async def stop_loop_monitor(app: web.Application):
+    app["LOOP_MONITOR"].stop()
+
+
+routes = web.RouteTableDef()
+_profile_lock = threading.Lock()
+
+
+@routes.get("/debug/profile")
+async def profile(request: web.Request):
+    token = DEFAULT_CONFIG.get("debug_token")
+    if not token:
+        raise web.HTTPNotFound()
+    if not hmac.compare_digest(request.headers.get("X-Debug-Token", ""), token):
+        raise web.HTTPForbidden()
+
+    try:
+        seconds = float(request.query.get("seconds", 10))
+    except ValueError:
+        raise web.HTTPBadRequest(text="seconds must be a number")
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise web.HTTPBadRequest(text=f"seconds must be in (0, {MAX_PROFILE_SECONDS}]")
+    if not _profile_lock.acquire(blocking=False):
+        raise web.HTTPConflict(text="Profiling is already running")
+    try:
+        sampler = StackSampler(threading.get_ident())
+        await asyncio.get_event_loop().run_in_executor(None, sampler.run, seconds)
+    finally:
+        _profile_lock.release()
+
+    if request.query.get("format") == "speedscope":
+        return web.json_response(sampler.speedscope(name=request.path_qs))
+    return web.Response(text=sampler.collapsed())
@@ -0,0 +1,84 @@
+import math
+from collections import defaultdict
+from typing import Dict, Optional, Iterable
+
+ZERO_BIN = "z"
+
+
+class DDSketch:
+    """Mergeable quantile sketch with relative accuracy guarantee.
+
+    Values are counted in logarithmic bins, so a quantile is answered with
+    a relative error of at most `relative_accuracy` regardless of how many
+    values were added. Bins are plain counters, therefore two sketches are
+    merged by summing them and a sketch stored as a redis hash is updated
+    with HINCRBY only.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-3):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.bins: Dict[int, int] = defaultdict(int)
+        self.zero_count = 0
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.bins.values())
+
+    def bin_key(self, value) -> str:
+        if value < self.min_value:
+            return ZERO_BIN
+        return str(math.ceil(math.log(value) / self.log_gamma))
+
+    def add(self, value, count=1):
+        key = self.bin_key(value)
+        if key == ZERO_BIN:
+            self.zero_count += count
+        else:
+            self.bins[int(key)] += count
+
+    def merge(self, other: "DDSketch"):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        self.zero_count += other.zero_count
+        for key, count in other.bins.items():
+            self.bins[key] += count
+
+    def quantile(self, q) -> Optional[float]:
+        assert 0 <= q <= 1, q
+        total = self.count
+        if total == 0:
+            return None
+
+        rank = q * (total - 1)
+        cumulative = self.zero_count
+        if cumulative > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            cumulative += self.bins[key]
+            if cumulative > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def quantiles(self, qs: Iterable[float]):
+        return [self.quantile(q) for q in qs]
+
+    def to_fields(self) -> Dict[str, int]:
+        fields = {str(key): count for key, count in self.bins.items()}
+        if self.zero_count:
+            fields[ZERO_BIN] = self.zero_count
+        return fields
+
+    @classmethod
+    def from_fields(cls, fields: Dict, **kwargs) -> "DDSketch":
+        """Restores sketch from redis HGETALL result"""
+        sketch = cls(**kwargs)
+        for key, count in fields.items():
+            key = key.decode() if isinstance(key, bytes) else key
+            if key == ZERO_BIN:
+                sketch.zero_count += int(count)
+            else:
+                sketch.bins[int(key)] += int(count)
+        return sketch
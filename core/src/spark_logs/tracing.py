@@ -0,0 +1,210 @@
+"""Lightweight in-process tracing.
+
+Spans follow the OpenTelemetry model (trace id, span id, parent span id,
+start and end in unix nanoseconds, attributes) and are propagated with
+contextvars, so tasks of `asyncio.gather` become children of the span that
+started them. Finished traces are kept in a ring buffer and served by
+`/debug/traces`, no collector is needed.
+
+Only the loop rounds open root spans. Everything else is traced only inside
+a round, outside of one `span` is a no-op.
+"""
+import functools
+import inspect
+import os
+import time
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, List, Dict, Any, Deque
+
+from aiohttp import web
+
+
+class Span:
+    __slots__ = (
+        "trace",
+        "span_id",
+        "parent_id",
+        "name",
+        "attributes",
+        "start_time",
+        "end_time",
+        "status",
+    )
+
+    def __init__(self, trace: "Trace", name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes: Dict[str, Any] = attributes or {}
+        self.start_time = time.time_ns()
+        self.end_time = None
+        self.status = "OK"
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_time or time.time_ns()) - self.start_time) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_time,
+            "endTimeUnixNano": self.end_time,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration
+
+    def timeline(self) -> Dict[str, Any]:
+        """Spans as a tree, every node has its total and self time"""
+        children = defaultdict(list)
+        for s in self.spans[1:]:
+            children[s.parent_id].append(s)
+
+        def node(s: Span):
+            nested = [node(c) for c in sorted(children[s.span_id], key=lambda c: c.start_time)]
+            # Children may run concurrently, self time is never negative
+            self_time = max(0.0, s.duration - sum(c["duration"] for c in nested))
+            return {
+                "name": s.name,
+                "attributes": s.attributes,
+                "status": s.status,
+                "offset": (s.start_time - self.root.start_time) / 1e9,
+                "duration": s.duration,
+                "self": self_time,
+                "children": nested,
+            }
+
+        return node(self.root)
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        """Flame-style totals per span name, sorted by self time"""
+        children_time = defaultdict(float)
+        for s in self.spans[1:]:
+            children_time[s.parent_id] += s.duration
+
+        totals = defaultdict(lambda: {"count": 0, "duration": 0.0, "self": 0.0})
+        for s in self.spans:
+            total = totals[s.name]
+            total["count"] += 1
+            total["duration"] += s.duration
+            total["self"] += max(0.0, s.duration - children_time[s.span_id])
+        return sorted(
+            [{"name": name, **total} for name, total in totals.items()],
+            key=lambda x: x["self"],
+            reverse=True,
+        )
+
+
+class RingBufferExporter:
+    def __init__(self, maxlen=256):
+        self.traces: Deque[Trace] = deque(maxlen=maxlen)
+
+    def export(self, trace: Trace):
+        self.traces.append(trace)
+
+    def slowest(self, limit, name=None) -> List[Trace]:
+        traces = [t for t in list(self.traces) if name is None or t.root.name == name]
+        return sorted(traces, key=lambda t: t.duration, reverse=True)[:limit]
+
+
+EXPORTER = RingBufferExporter()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, *, root=False, **attributes):
+    """Opens a child of the current span, or a new trace with `root`"""
+    parent = _current_span.get()
+    if parent is None and not root:
+        yield None
+        return
+
+    trace = Trace() if parent is None else parent.trace
+    s = Span(trace, name, parent.span_id if parent else None, attributes)
+    trace.spans.append(s)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as exc:
+        s.status = "ERROR"
+        s.attributes["exception"] = type(exc).__name__
+        raise
+    finally:
+        s.end_time = time.time_ns()
+        _current_span.reset(token)
+        if parent is None:
+            EXPORTER.export(trace)
+
+
+def traced(name=None, *, root=False):
+    """Decorator version of `span` for functions and coroutine functions"""
+
+    def decorator(func):
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, root=root):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, root=root):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+routes = web.RouteTableDef()
+
+
+@routes.get("/debug/traces")
+async def debug_traces(request: web.Request):
+    limit = int(request.query.get("limit", 10))
+    traces = EXPORTER.slowest(limit, name=request.query.get("name"))
+    if request.query.get("format") == "otel":
+        return web.json_response(
+            {"spans": [s.to_dict() for t in traces for s in t.spans]}
+        )
+    return web.json_response(
+        {
+            "traces": [
+                {
+                    "traceId": t.trace_id,
+                    "duration": t.duration,
+                    "breakdown": t.breakdown(),
+                    "timeline": t.timeline(),
+                }
+                for t in traces
+            ]
+        }
+    )
@@ -1,5 +1,6 @@
 from datetime import datetime
-from typing import List, Dict, Any, NamedTuple, Optional
+from functools import lru_cache
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple, Callable
 
 import attr
 import orjson
@@ -64,10 +65,50 @@ class Node:
             pudb.set_trace()
             raise
 
+    def dump_fields(self) -> Dict[str, bytes]:
+        """JSON of every field, for nodes stored as redis hashes"""
+        return {name: orjson.dumps(value) for name, value in self._to_dict().items()}
+
+    @classmethod
+    def create_from_fields(cls, fields: Dict[bytes, bytes]):
+        return cls.create_from_dict(
+            {name.decode(): orjson.loads(value) for name, value in fields.items()}
+        )
+
     def _to_dict(self):
         attr_names = [x.name for x in attr.fields(self.__class__)]
         return dict(zip(attr_names, [getattr(self, x) for x in attr_names]))
 
+    @classmethod
+    def prune(cls, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Fields of the node as `create_from_dict(data)._to_dict()` has them.
+
+        For flat nodes whose converters are `str` and `int` only, the result
+        is built without creating the node.
+        """
+        result = dict()
+        for name, converter, default in _prune_schema(cls):
+            if name in data:
+                value = data[name]
+                result[name] = value if converter is None else converter(value)
+            elif default is attr.NOTHING:
+                raise TypeError(f"{cls.__name__} requires {name}")
+            elif isinstance(default, attr.Factory):
+                result[name] = default.factory()
+            else:
+                result[name] = default
+        return result
+
+
+@lru_cache(maxsize=None)
+def _prune_schema(cls) -> Tuple[Tuple[str, Optional[Callable], Any], ...]:
+    schema = []
+    for field in attr.fields(cls):
+        if field.converter not in (None, str, int):
+            raise TypeError(f"{cls.__name__}.{field.name} can not be pruned")
+        schema.append((field.name, field.converter, field.default))
+    return tuple(schema)
+
 
 @attr.s(kw_only=True)
 class Job(Node):
@@ -79,6 +120,8 @@ class Job(Node):
     )
     stageIds: List[int] = attr.ib()
     status: str = attr.ib()
+    # A failed stage attempt makes Spark resubmit stages, completed ones too
+    numFailedStages: int = attr.ib(converter=int, default=0)
 
 
 @attr.s(kw_only=True)
@@ -93,6 +136,7 @@ class Executor(Node):
     maxMemory: int = attr.ib()
     totalShuffleRead: int = attr.ib()
     totalShuffleWrite: int = attr.ib()
+    totalGCTime: int = attr.ib(default=0)
 
 
 @attr.s(kw_only=True)
@@ -168,3 +212,60 @@ class ApplicationMetrics(Node):
 
     def __str__(self):
         return f"Application metrics {id(self)}"
+
+
+class RawStageTasks(Node):
+    """Stage with tasks pruned to the StageTasks schema and kept as JSON.
+
+    Only the stage is a node, tasks stay plain dicts, and `dump()` returns
+    the same bytes as `StageTasks.dump()` without serializing them again.
+    """
+
+    __slots__ = ("stage", "tasks", "payload")
+
+    def __init__(self, stage: Stage, tasks: Dict[str, Dict[str, Any]], payload: bytes):
+        self.stage = stage
+        self.tasks = tasks
+        self.payload = payload
+
+    @classmethod
+    def from_spark(cls, stage_data: Dict[str, Any]) -> "RawStageTasks":
+        """From a stage attempt of Spark REST API with a `tasks` dict"""
+        stage = Stage.prune(stage_data)
+        tasks = dict()
+        for task_data in stage_data["tasks"].values():
+            task = Task.prune(task_data)
+            tasks[task["taskId"]] = task
+        payload = orjson.dumps({"stage": stage, "tasks": tasks})
+        return cls(Stage(**stage), tasks, payload)
+
+    @classmethod
+    def from_json(cls, payload: bytes) -> "RawStageTasks":
+        data = orjson.loads(payload)
+        return cls(Stage(**data["stage"]), data["tasks"], payload)
+
+    def dump(self) -> bytes:
+        return self.payload
+
+    def _to_dict(self):
+        return {"stage": self.stage, "tasks": self.tasks}
+
+
+class RawJobStages(Node):
+    """JobStages of raw stages, `dump()` joins their JSON with the job one"""
+
+    __slots__ = ("job", "stages")
+
+    def __init__(self, job: Job, stages: Dict[str, RawStageTasks]):
+        self.job = job
+        self.stages = stages
+
+    def dump(self) -> bytes:
+        stages = b",".join(
+            orjson.dumps(stage_id) + b":" + stage.payload
+            for stage_id, stage in self.stages.items()
+        )
+        return b'{"job":' + self.job.dump() + b',"stages":{' + stages + b"}}"
+
+    def _to_dict(self):
+        return {"job": self.job, "stages": self.stages}
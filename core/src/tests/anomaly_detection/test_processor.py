@@ -0,0 +1,123 @@
+import pytest
+
+from spark_logs import kvstore
+from spark_logs.anomaly_detection.dataset_extractor import JobGroupedExtractor
+from spark_logs.anomaly_detection.processor import SequentialJobsProcessor
+from tests.fake_redis import FakeRedis
+from tests.jobs import job_stages_json
+
+APP_ID = "application_1_0001"
+
+
+class Processor(SequentialJobsProcessor):
+    processor_id = "test_processor"
+
+    async def process_group(self, group_key, group_data, timestamps, redis, group_alias):
+        pass
+
+
+async def store_jobs(redis, job_ids):
+    jobs_key = kvstore.sequential_jobs_key(app_id=APP_ID)
+    stream_key = kvstore.completed_jobs_stream_key(app_id=APP_ID)
+    entry_ids = []
+    for job_id in job_ids:
+        await redis.zadd(jobs_key, job_id, job_stages_json(job_id))
+        entry_ids.append(await redis.xadd(stream_key, {"job_id": job_id}))
+    return entry_ids
+
+
+def job_ids(jobs):
+    return [int(job.job.jobId) for job in jobs]
+
+
+def watermark_key():
+    return kvstore.processor_watermark_key(app_id=APP_ID, processor_id=Processor.processor_id)
+
+
+def deferred_key():
+    return kvstore.processor_deferred_jobs_key(app_id=APP_ID, processor_id=Processor.processor_id)
+
+
+async def legacy_reported(redis, *job_ids):
+    await redis.sadd(
+        kvstore.time_series_processed_jobs(app_id=APP_ID, processor_id=Processor.processor_id),
+        *job_ids,
+    )
+
+
+@pytest.mark.asyncio
+async def test_jobs_are_loaded_after_watermark():
+    redis = FakeRedis()
+    entry_ids = await store_jobs(redis, [1, 2, 3])
+    processor = Processor(APP_ID, JobGroupedExtractor, batch=2)
+
+    jobs, watermark = await processor.load_jobs(redis)
+    assert job_ids(jobs) == [1, 2]
+    assert watermark == entry_ids[1]
+    # Nothing is moved before the jobs are reported
+    assert (await processor.load_jobs(redis))[1] == entry_ids[1]
+
+    await processor.report_jobs(redis, jobs, [], watermark)
+    assert await redis.get(watermark_key()) == entry_ids[1]
+    jobs, watermark = await processor.load_jobs(redis)
+    assert job_ids(jobs) == [3]
+    await processor.report_jobs(redis, jobs, [], watermark)
+    assert await processor.load_jobs(redis) == ([], entry_ids[2])
+
+
+@pytest.mark.asyncio
+async def test_deferred_jobs_are_retried_and_capped():
+    redis = FakeRedis()
+    await store_jobs(redis, [1, 2, 3, 4, 5, 6])
+    processor = Processor(APP_ID, JobGroupedExtractor, batch=5)
+    processor.deferred_jobs_limit = 3
+
+    jobs, watermark = await processor.load_jobs(redis)
+    await processor.report_jobs(redis, [], jobs, watermark)
+    # Oldest deferred jobs are given up
+    assert await redis.zrange(deferred_key()) == [b"3", b"4", b"5"]
+
+    jobs, watermark = await processor.load_jobs(redis)
+    assert job_ids(jobs) == [3, 4, 5, 6]
+    processed = [job for job in jobs if job.job.jobId != "4"]
+    deferred = [job for job in jobs if job.job.jobId == "4"]
+    await processor.report_jobs(redis, processed, deferred, watermark)
+    assert await redis.zrange(deferred_key()) == [b"4"]
+
+
+@pytest.mark.asyncio
+async def test_watermark_is_migrated_from_reported_jobs():
+    redis = FakeRedis()
+    entry_ids = await store_jobs(redis, [1, 2, 3])
+    await legacy_reported(redis, 1, 2)
+    processor = Processor(APP_ID, JobGroupedExtractor)
+
+    assert await processor.load_watermark(redis) == entry_ids[1]
+    assert await redis.get(watermark_key()) == entry_ids[1]
+    jobs, _ = await processor.load_jobs(redis)
+    assert job_ids(jobs) == [3]
+
+
+@pytest.mark.asyncio
+async def test_watermark_migration_without_newest_reported_job_in_stream():
+    redis = FakeRedis()
+    # Jobs 3 and 5 are trimmed from the stream, 5 is the newest reported one
+    entry_ids = await store_jobs(redis, [2, 4, 6, 7])
+    await legacy_reported(redis, 1, 3, 5)
+    processor = Processor(APP_ID, JobGroupedExtractor)
+
+    assert await processor.load_watermark(redis) == entry_ids[1]
+    jobs, _ = await processor.load_jobs(redis)
+    assert job_ids(jobs) == [6, 7]
+
+
+@pytest.mark.asyncio
+async def test_watermark_migration_with_only_newer_jobs_in_stream():
+    redis = FakeRedis()
+    await store_jobs(redis, [4, 5])
+    await legacy_reported(redis, 1, 3)
+    processor = Processor(APP_ID, JobGroupedExtractor)
+
+    assert await processor.load_watermark(redis) is None
+    jobs, _ = await processor.load_jobs(redis)
+    assert job_ids(jobs) == [4, 5]
@@ -0,0 +1,181 @@
+import asyncio
+
+import pytest
+
+from spark_logs import kvstore
+from spark_logs.anomaly_detection.work_queue import (
+    GROUP,
+    METRIC_PROCESSORS,
+    WorkQueue,
+    WorkScheduler,
+    Worker,
+)
+from tests import fake_redis
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    async def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field.encode()] = value
+
+    async def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(field.encode(), None)
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+
+class FakeQueue:
+    def __init__(self):
+        self.items = []
+        self.redis = FakeRedis()
+
+    async def enqueue(self, app_id, metric_name, kind):
+        self.items.append((app_id, metric_name, kind))
+        return True
+
+
+@pytest.mark.asyncio
+async def test_scheduler_enqueues_due_processors():
+    queue = FakeQueue()
+    scheduler = WorkScheduler(queue)
+    scheduler.register("app_1", "sequential_processor")
+    scheduler.register("app_2", "sequential_processor")
+
+    await scheduler.schedule()
+    kinds = set(METRIC_PROCESSORS["sequential_processor"])
+    assert {(a, k) for a, _, k in queue.items} == {
+        (app_id, kind) for app_id in ("app_1", "app_2") for kind in kinds
+    }
+
+    # Nothing is due right after the first round
+    await scheduler.schedule()
+    assert len(queue.items) == 2 * len(kinds)
+
+
+def test_scheduler_unregister():
+    scheduler = WorkScheduler(FakeQueue())
+    scheduler.register("app_1", "sequential_processor")
+    scheduler.register("app_2", "sequential_processor")
+    assert scheduler.registered() == {
+        "app_1": ["sequential_processor"],
+        "app_2": ["sequential_processor"],
+    }
+
+    scheduler.unregister("app_1", "sequential_processor")
+    assert scheduler.registered() == {"app_2": ["sequential_processor"]}
+    scheduler.unregister("app_2")
+    assert scheduler.registered() == {}
+
+
+@pytest.mark.asyncio
+async def test_scheduler_restores_saved_registrations():
+    queue = FakeQueue()
+    scheduler = WorkScheduler(queue)
+    for app_id in ("app_1", "app_2"):
+        scheduler.register(app_id, "sequential_processor")
+        await scheduler.save(app_id)
+    scheduler.unregister("app_1")
+    await scheduler.save("app_1")
+
+    restarted = WorkScheduler(queue)
+    await restarted.restore()
+    assert restarted.registered() == {"app_2": ["sequential_processor"]}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def queue():
+    return WorkQueue(fake_redis.FakeRedis(clock=Clock()))
+
+
+async def pending(queue):
+    return await queue.redis.xpending(queue.stream_key, GROUP, "-", "+", 10)
+
+
+@pytest.mark.asyncio
+async def test_processor_is_enqueued_until_acked(queue):
+    await queue.ensure_group()
+    await queue.ensure_group()
+    assert await queue.enqueue("app_1", "sequential_processor", "task_fit")
+    assert not await queue.enqueue("app_1", "sequential_processor", "task_fit")
+    assert await queue.enqueue("app_1", "sequential_processor", "task_predict")
+
+    [(entry_id, fields)] = await queue.read("worker_1")
+    assert fields[b"kind"] == b"task_fit"
+    await queue.ack(entry_id, fields)
+    assert await pending(queue) == []
+    assert await queue.enqueue("app_1", "sequential_processor", "task_fit")
+
+
+@pytest.mark.asyncio
+async def test_items_of_dead_workers_are_reclaimed(queue):
+    await queue.ensure_group()
+    await queue.enqueue("app_1", "sequential_processor", "task_fit")
+    [(entry_id, _)] = await queue.read("dead")
+
+    assert await queue.reclaim("alive") == []
+    queue.redis.clock.now += queue.reclaim_idle
+    [(reclaimed_id, fields)] = await queue.reclaim("alive")
+    assert reclaimed_id == entry_id
+    assert fields[b"app_id"] == b"app_1"
+    [(_, consumer, _, deliveries)] = await pending(queue)
+    assert (consumer, deliveries) == (b"alive", 2)
+
+
+@pytest.mark.asyncio
+async def test_items_are_dropped_after_max_deliveries(queue):
+    await queue.ensure_group()
+    await queue.enqueue("app_1", "sequential_processor", "task_fit")
+    await queue.read("worker")
+    for _ in range(queue.max_deliveries - 1):
+        queue.redis.clock.now += queue.reclaim_idle
+        assert len(await queue.reclaim("worker")) == 1
+
+    queue.redis.clock.now += queue.reclaim_idle
+    assert await queue.reclaim("worker") == []
+    assert await pending(queue) == []
+    # The processor can be enqueued again
+    assert await queue.enqueue("app_1", "sequential_processor", "task_fit")
+
+
+class FlakyRedis(fake_redis.FakeRedis):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    async def xpending(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("redis is down")
+        return await super().xpending(*args, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_redis_errors():
+    redis = FlakyRedis(failures=3)
+    worker = Worker(redis, consumer="worker")
+    worker.error_delay = 0.001
+    assert await worker.queue.enqueue("app_1", "unknown_metric", "task_fit")
+
+    task = asyncio.ensure_future(worker.loop_work())
+    await asyncio.sleep(0.1)
+    assert not task.done()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    assert redis.failures == 0
+    assert await pending(worker.queue) == []
+    queued_key = kvstore.anomaly_work_queued_key(
+        app_id="app_1", metric_name="unknown_metric", kind="task_fit"
+    )
+    assert await redis.get(queued_key) is None
@@ -0,0 +1,401 @@
+"""In-memory stand-in for the aioredis 1.3 commands used by the services.
+
+Replies are shaped like aioredis ones: values come back as bytes, streams as
+lists of `(entry_id, fields)`. Expiry, stream ids and idle times follow
+`clock`, which tests may replace to move time forward.
+"""
+import asyncio
+import fnmatch
+import time
+from collections import OrderedDict
+
+import aioredis
+
+from spark_logs.loaders.sharding import RELEASE_LEASE, RENEW_LEASE
+
+
+def encode(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, bytearray):
+        return bytes(value)
+    if isinstance(value, float):
+        return repr(value).encode()
+    return str(value).encode()
+
+
+def parse_id(entry_id):
+    timestamp, sequence = encode(entry_id).split(b"-")
+    return int(timestamp), int(sequence)
+
+
+def stream_bound(value, default):
+    value = encode(value)
+    if value == b"-":
+        return 0, 0
+    if value == b"+":
+        return float("inf"), float("inf")
+    if b"-" not in value:
+        return int(value), default
+    return parse_id(value)
+
+
+class Batch:
+    """Pipeline or MULTI/EXEC, commands run in order on execute"""
+
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self._redis, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+
+        return queue
+
+    async def execute(self):
+        return [await command(*args, **kwargs) for command, args, kwargs in self._commands]
+
+
+class FakeRedis:
+    SET_IF_NOT_EXIST = "SET_IF_NOT_EXIST"
+    SET_IF_EXIST = "SET_IF_EXIST"
+    ZSET_IF_NOT_EXIST = "ZSET_IF_NOT_EXIST"
+    ZSET_IF_EXIST = "ZSET_IF_EXIST"
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.data = dict()
+        self.expires = dict()
+        # stream key -> group -> {"last": id, "pending": {id: [consumer, delivered, count]}}
+        self.groups = dict()
+        self._last_id = (0, 0)
+
+    def _alive(self, key):
+        key = encode(key)
+        expires = self.expires.get(key)
+        if expires is not None and self.clock() >= expires:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key
+
+    def _get(self, key, factory=None):
+        key = self._alive(key)
+        if key not in self.data and factory is not None:
+            self.data[key] = factory()
+        return self.data.get(key)
+
+    def pipeline(self):
+        return Batch(self)
+
+    def multi_exec(self):
+        return Batch(self)
+
+    # Keys and strings
+
+    async def get(self, key):
+        value = self._get(key)
+        return None if value is None else bytes(value)
+
+    async def mget(self, *keys):
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key, value, *, expire=0, pexpire=0, exist=None):
+        key = self._alive(key)
+        if exist == self.SET_IF_NOT_EXIST and key in self.data:
+            return None
+        if exist == self.SET_IF_EXIST and key not in self.data:
+            return None
+        self.data[key] = encode(value)
+        self.expires.pop(key, None)
+        if expire or pexpire:
+            self.expires[key] = self.clock() + (expire or pexpire / 1000)
+        return True
+
+    async def mset(self, *pairs):
+        for key, value in zip(pairs[::2], pairs[1::2]):
+            await self.set(key, value)
+        return True
+
+    async def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            key = self._alive(key)
+            deleted += self.data.pop(key, None) is not None
+            self.expires.pop(key, None)
+        return deleted
+
+    async def exists(self, key):
+        return int(self._get(key) is not None)
+
+    async def pexpire(self, key, milliseconds):
+        key = self._alive(key)
+        if key not in self.data:
+            return 0
+        self.expires[key] = self.clock() + milliseconds / 1000
+        return 1
+
+    async def setbit(self, key, offset, value):
+        bitmap = self._get(key)
+        bitmap = bytearray(bitmap or b"")
+        if len(bitmap) <= offset // 8:
+            bitmap.extend(bytes(offset // 8 + 1 - len(bitmap)))
+        old = bool(bitmap[offset // 8] & (0x80 >> offset % 8))
+        if value:
+            bitmap[offset // 8] |= 0x80 >> offset % 8
+        else:
+            bitmap[offset // 8] &= ~(0x80 >> offset % 8) & 0xFF
+        self.data[encode(key)] = bytes(bitmap)
+        return int(old)
+
+    async def iscan(self, *, match="*"):
+        for key in list(self.data):
+            if self._get(key) is not None and fnmatch.fnmatchcase(key.decode(), match):
+                yield key
+
+    async def eval(self, script, keys=(), args=()):
+        [key] = keys
+        holder = await self.get(key)
+        if holder != encode(args[0]):
+            return 0
+        if script == RENEW_LEASE:
+            return await self.pexpire(key, int(args[1]))
+        if script == RELEASE_LEASE:
+            return await self.delete(key)
+        raise NotImplementedError(script)
+
+    # Hashes
+
+    async def hset(self, key, field, value):
+        fields = self._get(key, dict)
+        added = encode(field) not in fields
+        fields[encode(field)] = encode(value)
+        return int(added)
+
+    async def hmset_dict(self, key, *args, **kwargs):
+        mapping = dict(*args, **kwargs)
+        for field, value in mapping.items():
+            await self.hset(key, field, value)
+        return True
+
+    async def hget(self, key, field):
+        return (self._get(key) or {}).get(encode(field))
+
+    async def hmget(self, key, *fields):
+        stored = self._get(key) or {}
+        return [stored.get(encode(field)) for field in fields]
+
+    async def hgetall(self, key):
+        return dict(self._get(key) or {})
+
+    async def hdel(self, key, *fields):
+        stored = self._get(key) or {}
+        return sum(stored.pop(encode(field), None) is not None for field in fields)
+
+    async def hincrby(self, key, field, increment=1):
+        fields = self._get(key, dict)
+        value = int(fields.get(encode(field), b"0")) + increment
+        fields[encode(field)] = encode(value)
+        return value
+
+    async def hincrbyfloat(self, key, field, increment=1.0):
+        fields = self._get(key, dict)
+        value = float(fields.get(encode(field), b"0")) + increment
+        fields[encode(field)] = encode(value)
+        return value
+
+    # Sets
+
+    async def sadd(self, key, member, *members):
+        stored = self._get(key, set)
+        added = {encode(m) for m in (member, *members)} - stored
+        stored.update(added)
+        return len(added)
+
+    async def srem(self, key, member, *members):
+        stored = self._get(key) or set()
+        removed = {encode(m) for m in (member, *members)} & stored
+        stored.difference_update(removed)
+        return len(removed)
+
+    async def smembers(self, key):
+        return list(self._get(key) or set())
+
+    async def sismember(self, key, member):
+        return int(encode(member) in (self._get(key) or set()))
+
+    # Sorted sets
+
+    def _sorted(self, key):
+        stored = self._get(key) or {}
+        return sorted(stored.items(), key=lambda item: (item[1], item[0]))
+
+    async def zadd(self, key, score, member, *pairs, exist=None):
+        stored = self._get(key, dict)
+        added = 0
+        pairs = (score, member) + pairs
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            member = encode(member)
+            if exist == self.ZSET_IF_NOT_EXIST and member in stored:
+                continue
+            if exist == self.ZSET_IF_EXIST and member not in stored:
+                continue
+            added += member not in stored
+            stored[member] = float(score)
+        return added
+
+    async def zrange(self, key, start=0, stop=-1, withscores=False):
+        items = self._sorted(key)
+        stop = len(items) + stop if stop < 0 else stop
+        items = items[start : stop + 1]
+        if withscores:
+            return [(member, score) for member, score in items]
+        return [member for member, _ in items]
+
+    async def zrangebyscore(
+        self, key, min=float("-inf"), max=float("inf"), *, withscores=False, offset=None, count=None
+    ):
+        items = [(m, s) for m, s in self._sorted(key) if min <= s <= max]
+        if offset is not None:
+            items = items[offset : offset + count]
+        if withscores:
+            return items
+        return [member for member, _ in items]
+
+    async def zscore(self, key, member):
+        return (self._get(key) or {}).get(encode(member))
+
+    async def zcard(self, key):
+        return len(self._get(key) or {})
+
+    async def zrem(self, key, member, *members):
+        stored = self._get(key) or {}
+        return sum(stored.pop(encode(m), None) is not None for m in (member, *members))
+
+    async def zremrangebyrank(self, key, start, stop):
+        members = await self.zrange(key, start, stop)
+        for member in members:
+            await self.zrem(key, member)
+        return len(members)
+
+    async def zremrangebyscore(self, key, *, min=float("-inf"), max=float("inf")):
+        members = await self.zrangebyscore(key, min, max)
+        for member in members:
+            await self.zrem(key, member)
+        return len(members)
+
+    # Streams
+
+    def _stream(self, key, create=False):
+        return self._get(key, OrderedDict if create else None)
+
+    async def xadd(self, stream, fields, message_id=b"*", max_len=None, exact_len=False):
+        entries = self._stream(stream, create=True)
+        if message_id == b"*":
+            timestamp = int(self.clock() * 1000)
+            if timestamp <= self._last_id[0]:
+                entry = (self._last_id[0], self._last_id[1] + 1)
+            else:
+                entry = (timestamp, 0)
+        else:
+            entry = parse_id(message_id)
+        self._last_id = max(self._last_id, entry)
+        entry_id = f"{entry[0]}-{entry[1]}".encode()
+        entries[entry_id] = OrderedDict((encode(k), encode(v)) for k, v in fields.items())
+        while max_len is not None and len(entries) > max_len:
+            entries.popitem(last=False)
+        return entry_id
+
+    async def xrange(self, stream, start="-", stop="+", count=None):
+        low, high = stream_bound(start, 0), stream_bound(stop, float("inf"))
+        entries = [
+            (entry_id, fields)
+            for entry_id, fields in (self._stream(stream) or {}).items()
+            if low <= parse_id(entry_id) <= high
+        ]
+        return entries[:count] if count is not None else entries
+
+    async def xrevrange(self, stream, start="+", stop="-", count=None):
+        entries = list(reversed(await self.xrange(stream, stop, start)))
+        return entries[:count] if count is not None else entries
+
+    async def xlen(self, stream):
+        return len(self._stream(stream) or {})
+
+    async def xgroup_create(self, stream, group_name, latest_id="$", mkstream=False):
+        entries = self._stream(stream, create=mkstream)
+        if entries is None:
+            raise aioredis.ReplyError("ERR The XGROUP subcommand requires the key to exist")
+        groups = self.groups.setdefault(encode(stream), dict())
+        if encode(group_name) in groups:
+            raise aioredis.ReplyError("BUSYGROUP Consumer Group name already exists")
+        if latest_id == "$":
+            last = list(entries)[-1] if entries else b"0-0"
+        else:
+            last = encode(latest_id)
+        groups[encode(group_name)] = {"last": stream_bound(last, 0), "pending": OrderedDict()}
+        return True
+
+    def _group(self, stream, group_name):
+        try:
+            return self.groups[encode(stream)][encode(group_name)]
+        except KeyError:
+            raise aioredis.ReplyError("NOGROUP No such consumer group")
+
+    async def xread_group(
+        self,
+        group_name,
+        consumer_name,
+        streams,
+        timeout=0,
+        count=None,
+        latest_ids=None,
+        no_ack=False,
+    ):
+        read = []
+        for stream in streams:
+            group = self._group(stream, group_name)
+            for entry_id, fields in (self._stream(stream) or {}).items():
+                if parse_id(entry_id) <= group["last"]:
+                    continue
+                group["last"] = parse_id(entry_id)
+                group["pending"][entry_id] = [encode(consumer_name), self.clock(), 1]
+                read.append((encode(stream), entry_id, fields))
+                if count is not None and len(read) >= count:
+                    return read
+        if not read:
+            # Stands for blocking until the timeout
+            await asyncio.sleep(0.001)
+        return read
+
+    async def xpending(self, stream, group_name, start=None, stop=None, count=None, consumer=None):
+        group = self._group(stream, group_name)
+        now = self.clock()
+        pending = [
+            [entry_id, owner, int((now - delivered) * 1000), deliveries]
+            for entry_id, (owner, delivered, deliveries) in group["pending"].items()
+        ]
+        return pending[:count] if count is not None else pending
+
+    async def xclaim(self, stream, group_name, consumer_name, min_idle_time, *ids):
+        group = self._group(stream, group_name)
+        entries = self._stream(stream) or {}
+        now = self.clock()
+        claimed = []
+        for entry_id in map(encode, ids):
+            pending = group["pending"].get(entry_id)
+            if pending is None or (now - pending[1]) * 1000 < min_idle_time:
+                continue
+            if entry_id not in entries:
+                # Trimmed entries are claimed without fields
+                claimed.append((entry_id, None))
+                continue
+            group["pending"][entry_id] = [encode(consumer_name), now, pending[2] + 1]
+            claimed.append((entry_id, entries[entry_id]))
+        return claimed
+
+    async def xack(self, stream, group_name, *ids):
+        group = self._group(stream, group_name)
+        return sum(group["pending"].pop(encode(i), None) is not None for i in ids)
@@ -0,0 +1,52 @@
+import asyncio
+
+import orjson
+import pytest
+
+from spark_logs import kvstore
+from spark_logs.hybrid_metrics.api.app import restore_registrations, save_registrations
+from spark_logs.hybrid_metrics.gc_ratio import GcRatioStrategy
+from spark_logs.hybrid_metrics.spill_ratio import SpillRatioStrategy
+from tests.fake_redis import FakeRedis
+
+
+@pytest.fixture
+def app():
+    app = {
+        "REDIS": FakeRedis(),
+        "GRAPHITE": None,
+        "METRIC_PROCESSORS": {"gc_ratio": GcRatioStrategy, "spill_ratio": SpillRatioStrategy},
+        "APP_METRICS": dict(),
+    }
+    yield app
+    for app_engine in app["APP_METRICS"].values():
+        app_engine["task"].cancel()
+
+
+@pytest.mark.asyncio
+async def test_registrations_are_restored(app):
+    key = kvstore.hybrid_metrics_registrations_key()
+    await app["REDIS"].hset(key, "app_1", orjson.dumps(["gc_ratio", "spill_ratio"]))
+    await app["REDIS"].hset(key, "app_2", orjson.dumps(["gc_ratio", "removed_metric"]))
+
+    await restore_registrations(app)
+    engines = {app_id: x["engine"] for app_id, x in app["APP_METRICS"].items()}
+    assert set(engines) == {"app_1", "app_2"}
+    assert set(engines["app_1"].strategies) == {"gc_ratio", "spill_ratio"}
+    assert isinstance(engines["app_2"].strategies["gc_ratio"], GcRatioStrategy)
+    assert set(engines["app_2"].strategies) == {"gc_ratio"}
+    # One engine task per app
+    assert all(isinstance(x["task"], asyncio.Task) for x in app["APP_METRICS"].values())
+
+
+@pytest.mark.asyncio
+async def test_saved_registrations_follow_engines(app):
+    await app["REDIS"].hset(
+        kvstore.hybrid_metrics_registrations_key(), "app_1", orjson.dumps(["gc_ratio"])
+    )
+    await restore_registrations(app)
+    app["APP_METRICS"]["app_1"]["engine"].unregister("gc_ratio")
+    app["APP_METRICS"].pop("app_1")["task"].cancel()
+    await save_registrations(app, "app_1")
+
+    assert await app["REDIS"].hgetall(kvstore.hybrid_metrics_registrations_key()) == {}
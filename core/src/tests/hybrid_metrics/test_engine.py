@@ -0,0 +1,172 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from prometheus_client import REGISTRY
+
+from spark_logs import kvstore
+from spark_logs.hybrid_metrics.abc import HybridMetricStrategy
+from spark_logs.hybrid_metrics.engine import HybridMetricsEngine
+from tests.fake_redis import FakeRedis
+from tests.jobs import job_stages_json
+
+APP_ID = "application_1_0001"
+
+
+class TaskCount(HybridMetricStrategy):
+    test_name = "tasks"
+
+    def apply(self, data):
+        return data.stage.numTasks
+
+
+class Broken(HybridMetricStrategy):
+    test_name = "broken"
+
+    def apply(self, data):
+        raise ValueError("broken")
+
+
+class FakeGraphite:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    def send(self, key, value, timestamp):
+        if self.fail:
+            raise ConnectionError("graphite is down")
+        self.sent.append((key, value))
+
+
+async def store_job(redis, job_id, num_tasks=4, age=timedelta(hours=1)):
+    completed = datetime.now(timezone.utc) - age
+    await redis.zadd(
+        kvstore.sequential_jobs_key(app_id=APP_ID),
+        job_id,
+        job_stages_json(job_id, num_tasks, completed),
+    )
+    return await redis.xadd(
+        kvstore.completed_jobs_stream_key(app_id=APP_ID), {"job_id": job_id}
+    )
+
+
+async def name_group(redis, num_tasks=4):
+    await redis.set(
+        kvstore.job_group_hashes_key(app_id=APP_ID, group_hash=str(num_tasks)), f"group{num_tasks}"
+    )
+
+
+def lag():
+    return REGISTRY.get_sample_value(
+        "luxmeter_processor_lag_jobs", {"processor": "hybrid_metrics", "app_id": APP_ID}
+    )
+
+
+@pytest.mark.asyncio
+async def test_batches_resume_from_watermark():
+    redis, graphite = FakeRedis(), FakeGraphite()
+    await name_group(redis)
+    entry_ids = [await store_job(redis, job_id) for job_id in range(3)]
+    engine = HybridMetricsEngine(APP_ID, {"tasks": TaskCount()})
+    engine.batch = 2
+
+    assert await engine.apply_batch(redis, graphite) == 2
+    watermark_key = kvstore.hybrid_metrics_watermark_key(app_id=APP_ID)
+    assert await redis.get(watermark_key) == entry_ids[1]
+    assert lag() == 1
+
+    assert await engine.apply_batch(redis, graphite) == 1
+    assert await redis.get(watermark_key) == entry_ids[2]
+    assert lag() == 0
+    assert len(graphite.sent) == 3
+
+    assert await engine.apply_batch(redis, graphite) == 0
+    assert len(graphite.sent) == 3
+
+
+@pytest.mark.asyncio
+async def test_watermark_moves_after_results_are_sent():
+    redis = FakeRedis()
+    await name_group(redis)
+    await store_job(redis, 1)
+    engine = HybridMetricsEngine(APP_ID, {"tasks": TaskCount()})
+
+    with pytest.raises(ConnectionError):
+        await engine.apply_batch(redis, FakeGraphite(fail=True))
+    assert await redis.get(kvstore.hybrid_metrics_watermark_key(app_id=APP_ID)) is None
+
+    graphite = FakeGraphite()
+    assert await engine.apply_batch(redis, graphite) == 1
+    assert graphite.sent == [(f"app.{APP_ID}.job_group.group4.test.tasks", 4.0)]
+
+
+@pytest.mark.asyncio
+async def test_failing_strategy_does_not_block_others():
+    redis, graphite = FakeRedis(), FakeGraphite()
+    await name_group(redis)
+    for job_id in range(2):
+        await store_job(redis, job_id)
+    engine = HybridMetricsEngine(APP_ID, {"broken": Broken(), "tasks": TaskCount()})
+
+    assert await engine.apply_batch(redis, graphite) == 2
+    assert [key for key, _ in graphite.sent] == [
+        f"app.{APP_ID}.job_group.group4.test.tasks"
+    ] * 2
+
+
+@pytest.mark.asyncio
+async def test_job_without_group_does_not_stall_batch():
+    redis, graphite = FakeRedis(), FakeGraphite()
+    await name_group(redis, num_tasks=4)
+    await store_job(redis, 1, num_tasks=8, age=timedelta(seconds=10))
+    await store_job(redis, 2, num_tasks=4)
+    last = await store_job(redis, 3, num_tasks=16)
+    engine = HybridMetricsEngine(APP_ID, {"tasks": TaskCount()})
+    deferred_key = kvstore.processor_deferred_jobs_key(app_id=APP_ID, processor_id=engine.name)
+
+    # Job 1 waits for its group, job 3 is past the grace period and skipped
+    assert await engine.apply_batch(redis, graphite) == 3
+    assert graphite.sent == [(f"app.{APP_ID}.job_group.group4.test.tasks", 4.0)]
+    assert await redis.get(kvstore.hybrid_metrics_watermark_key(app_id=APP_ID)) == last
+    assert await redis.zrange(deferred_key) == [b"1"]
+
+    await name_group(redis, num_tasks=8)
+    assert await engine.apply_batch(redis, graphite) == 0
+    assert graphite.sent[-1] == (f"app.{APP_ID}.job_group.group8.test.tasks", 8.0)
+    assert await redis.zrange(deferred_key) == []
+
+
+@pytest.mark.asyncio
+async def test_catches_up_after_stream_is_trimmed():
+    redis, graphite = FakeRedis(), FakeGraphite()
+    await name_group(redis)
+    first = await store_job(redis, 1)
+    engine = HybridMetricsEngine(APP_ID, {"tasks": TaskCount()})
+    assert await engine.apply_batch(redis, graphite) == 1
+    assert await redis.get(kvstore.hybrid_metrics_watermark_key(app_id=APP_ID)) == first
+
+    for job_id in range(2, 6):
+        await store_job(redis, job_id)
+    stream_key = kvstore.completed_jobs_stream_key(app_id=APP_ID)
+    # The loader caps the stream, the watermark entry and job 2 are trimmed
+    redis.data[stream_key.encode()].popitem(last=False)
+    redis.data[stream_key.encode()].popitem(last=False)
+
+    assert await engine.apply_batch(redis, graphite) == 3
+    assert len(graphite.sent) == 4
+    assert lag() == 0
+
+
+@pytest.mark.asyncio
+async def test_backfilled_jobs_do_not_make_lag_negative():
+    redis, graphite = FakeRedis(), FakeGraphite()
+    await name_group(redis)
+    engine = HybridMetricsEngine(APP_ID, {"tasks": TaskCount()})
+    engine.batch = 1
+    await store_job(redis, 10)
+    # The backfill lane stores older jobs after newer ones
+    await store_job(redis, 3)
+
+    assert await engine.apply_batch(redis, graphite) == 1
+    assert lag() == 0
+    assert await engine.apply_batch(redis, graphite) == 1
+    assert lag() == 0
@@ -90,3 +90,38 @@ def test_shuffle_score(metrics, expected_skewness_test):
     skew_detector = SkewDetectStrategy()
     actual_skew_test = skew_detector.apply(stage_metrics)
     assert bool(actual_skew_test) == expected_skewness_test
+
+
+@pytest.mark.parametrize("score", sorted(SkewDetectStrategy.scores))
+def test_apply_job_matches_single_stage(score):
+    durations = [[95, 102, 90, 400], [10, 11], [7], []]
+    stages = {}
+    for stage_id, stage_durations in enumerate(durations):
+        stage = MagicMock()
+        stage.__class__ = Node
+        tasks = {
+            str(task_id): {
+                "taskId": task_id,
+                "index": task_id,
+                "attempt": 0,
+                "executorId": "1",
+                "host": "host.com",
+                "status": "SUCCESS",
+                "duration": duration,
+                "taskLocality": "PROCESS_LOCAL",
+                "speculative": False,
+            }
+            for task_id, duration in enumerate(stage_durations)
+        }
+        stages[str(stage_id)] = StageTasks(stage=stage, tasks=tasks)
+    job_data = MagicMock()
+    job_data.stages = stages
+
+    skew_detector = SkewDetectStrategy(score=score)
+    batched = skew_detector.apply_job(job_data)
+
+    assert batched == pytest.approx(
+        {stage_id: skew_detector.apply(stage) for stage_id, stage in stages.items()}
+    )
+    assert batched["0"] > 0
+    assert batched["2"] == batched["3"] == 0
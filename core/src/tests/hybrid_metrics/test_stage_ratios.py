@@ -0,0 +1,46 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from spark_logs.hybrid_metrics.gc_ratio import GcRatioStrategy
+from spark_logs.hybrid_metrics.locality_miss_rate import LocalityMissRateStrategy
+from spark_logs.hybrid_metrics.spill_ratio import SpillRatioStrategy
+from spark_logs.types import StageTasks, Node
+
+
+@pytest.fixture
+def stage_tasks():
+    stage = MagicMock()
+    stage.__class__ = Node
+    stage.inputBytes = 300
+    stage.shuffleReadBytes = 100
+    stage.diskBytesSpilled = 100
+    tasks = {
+        str(task_id): {
+            "taskId": task_id,
+            "index": task_id,
+            "attempt": 0,
+            "executorId": "1",
+            "host": "host.com",
+            "status": "SUCCESS",
+            "taskLocality": locality,
+            "speculative": False,
+            "taskMetrics": {"jvmGcTime": 10, "executorRunTime": 100},
+        }
+        for task_id, locality in enumerate(
+            ["PROCESS_LOCAL", "NODE_LOCAL", "RACK_LOCAL", "ANY"]
+        )
+    }
+    return StageTasks(stage=stage, tasks=tasks)
+
+
+@pytest.mark.parametrize(
+    "strategy, expected",
+    [
+        (SpillRatioStrategy(), 0.25),
+        (GcRatioStrategy(), 0.1),
+        (LocalityMissRateStrategy(), 0.5),
+    ],
+)
+def test_stage_ratio(stage_tasks, strategy, expected):
+    assert strategy.apply(stage_tasks) == pytest.approx(expected)
@@ -0,0 +1,36 @@
+"""Spark job payloads for tests of code reading stored jobs"""
+from datetime import datetime, timedelta, timezone
+
+import orjson
+
+STAGE_COUNTERS = (
+    "attemptId numActiveTasks numCompleteTasks numFailedTasks numKilledTasks "
+    "numCompletedIndices executorRunTime executorCpuTime inputBytes inputRecords "
+    "outputBytes outputRecords shuffleReadBytes shuffleReadRecords shuffleWriteBytes "
+    "shuffleWriteRecords memoryBytesSpilled diskBytesSpilled"
+).split()
+
+
+def stage_fields(stage_id, num_tasks, **fields):
+    stage = dict.fromkeys(STAGE_COUNTERS, 0)
+    stage.update(status="COMPLETE", stageId=stage_id, numTasks=num_tasks, name="stage")
+    stage.update(fields)
+    return stage
+
+
+def job_fields(job_id, completed=None, duration=1):
+    completed = completed or datetime(2021, 5, 5, tzinfo=timezone.utc)
+    return {
+        "jobId": job_id,
+        "name": "job",
+        "submissionTime": (completed - timedelta(seconds=duration)).isoformat(),
+        "completionTime": completed.isoformat(),
+        "stageIds": [job_id],
+        "status": "SUCCEEDED",
+    }
+
+
+def job_stages_json(job_id, num_tasks=4, completed=None):
+    """Stored job with one stage of `num_tasks` tasks"""
+    stage = {"stage": stage_fields(job_id, num_tasks), "tasks": {}}
+    return orjson.dumps({"job": job_fields(job_id, completed), "stages": {str(job_id): stage}})
@@ -0,0 +1,124 @@
+import pytest
+
+from spark_logs import kvstore
+from spark_logs.loaders.aggregates import ExecutorTimesAggregate, JobDurationsAggregate
+from spark_logs.quantile_sketch import DDSketch
+from spark_logs.types import Job, RawJobStages, RawStageTasks, Stage
+from tests.fake_redis import FakeRedis
+from tests.jobs import job_fields, stage_fields
+
+APP_ID = "application_1_0001"
+
+
+def task(task_id, executor_id, run_ms=2, cpu_s=1):
+    return {
+        "taskId": task_id,
+        "executorId": executor_id,
+        "taskMetrics": {
+            "executorDeserializeTime": 0,
+            "executorDeserializeCpuTime": 0,
+            "executorRunTime": run_ms * 10 ** 6,
+            "executorCpuTime": cpu_s * 10 ** 9,
+            "jvmGcTime": 0,
+        },
+    }
+
+
+def job(job_id, executors=("1",), num_tasks=None, duration=10):
+    stage = Stage(**stage_fields(job_id, num_tasks or len(executors)))
+    tasks = {str(i): task(str(i), executor_id) for i, executor_id in enumerate(executors)}
+    return RawJobStages(
+        Job(**job_fields(job_id, duration=duration)),
+        {str(job_id): RawStageTasks(stage, tasks, b"")},
+    )
+
+
+async def add_jobs(redis, aggregate, jobs):
+    tr = redis.multi_exec()
+    await aggregate.add_jobs(redis, tr, {str(job.job.jobId): job for job in jobs})
+    await tr.execute()
+
+
+async def executor_times(redis):
+    stored = await redis.hgetall(kvstore.executor_times_key(app_id=APP_ID))
+    return {field.decode(): round(float(value), 6) for field, value in stored.items()}
+
+
+@pytest.mark.asyncio
+async def test_executor_times_are_summed_per_executor():
+    redis = FakeRedis()
+    aggregate = ExecutorTimesAggregate(APP_ID)
+    await add_jobs(redis, aggregate, [job(1, ["1", "2", "driver"]), job(2, ["1"])])
+
+    times = await executor_times(redis)
+    assert times["executors_cpu_time:1"] == 2
+    assert times["executors_run_time:1"] == 2
+    assert times["executors_cpu_time:2"] == 1
+    assert not any(field.endswith(":driver") for field in times)
+
+
+@pytest.mark.asyncio
+async def test_executor_times_add_a_job_once():
+    redis = FakeRedis()
+    aggregate = ExecutorTimesAggregate(APP_ID)
+    await add_jobs(redis, aggregate, [job(1, ["1"])])
+    added = await executor_times(redis)
+
+    await add_jobs(redis, aggregate, [job(1, ["1"])])
+    await add_jobs(redis, aggregate, [job(1, ["1"]), job(2, ["1"])])
+    times = await executor_times(redis)
+    assert times["executors_cpu_time:1"] == 2 * added["executors_cpu_time:1"]
+
+
+@pytest.mark.asyncio
+async def test_executor_times_drop_jobs_leaving_window():
+    redis = FakeRedis()
+    aggregate = ExecutorTimesAggregate(APP_ID, window=2)
+    await add_jobs(redis, aggregate, [job(1, ["1", "2"]), job(2, ["1"])])
+    await add_jobs(redis, aggregate, [job(3, ["1"])])
+
+    times = await executor_times(redis)
+    assert times["executors_cpu_time:1"] == 2
+    # Executor 2 ran only in the evicted job
+    assert not any(field.endswith(":2") for field in times)
+    window = await redis.zrange(kvstore.executor_times_window_key(app_id=APP_ID))
+    assert window == [b"2", b"3"]
+    jobs = await redis.hgetall(kvstore.executor_times_jobs_key(app_id=APP_ID))
+    assert set(jobs) == {b"2", b"3"}
+
+    # Job older than the window is not added
+    await add_jobs(redis, aggregate, [job(0, ["3"])])
+    assert await executor_times(redis) == times
+
+
+async def job_durations(redis, group_hash=None):
+    stored = await redis.hgetall(kvstore.job_durations_key(app_id=APP_ID, group_hash=group_hash))
+    return {field.decode(): int(value) for field, value in stored.items()}
+
+
+@pytest.mark.asyncio
+async def test_job_durations_are_sketched_per_group():
+    redis = FakeRedis()
+    aggregate = JobDurationsAggregate(APP_ID)
+    await add_jobs(redis, aggregate, [job(1, duration=10), job(2, num_tasks=3, duration=20)])
+
+    assert sum((await job_durations(redis)).values()) == 2
+    assert sum((await job_durations(redis, "1")).values()) == 1
+    assert sum((await job_durations(redis, "3")).values()) == 1
+    sketch = DDSketch(aggregate.relative_accuracy)
+    sketch.add(20)
+    assert await job_durations(redis, "3") == sketch.to_fields()
+
+
+@pytest.mark.asyncio
+async def test_job_durations_count_a_job_once():
+    redis = FakeRedis()
+    aggregate = JobDurationsAggregate(APP_ID)
+    await add_jobs(redis, aggregate, [job(1)])
+    await add_jobs(redis, aggregate, [job(1)])
+    await add_jobs(redis, aggregate, [job(1), job(2)])
+
+    assert sum((await job_durations(redis)).values()) == 2
+    assert sum((await job_durations(redis, "1")).values()) == 2
+    added = await redis.hgetall(kvstore.job_durations_jobs_key(app_id=APP_ID))
+    assert set(added) == {b"1", b"2"}
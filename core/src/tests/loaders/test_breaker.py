@@ -0,0 +1,145 @@
+import asyncio
+
+import aiohttp
+import pytest
+from yarl import URL
+
+from spark_logs import kvstore
+from spark_logs.loaders.application_loader import ApplicationLoader
+from spark_logs.loaders.breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    Breakers,
+    CircuitBreaker,
+    CircuitOpen,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_with_growing_jittered_backoff():
+    clock = Clock()
+    breaker = CircuitBreaker(
+        "jobs", threshold=2, base_delay=10, max_delay=30, clock=clock, rng=lambda: 1.0
+    )
+    breaker.failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    assert breaker.delay() == 10
+
+    clock.now = 10
+    assert breaker.state == HALF_OPEN
+    # One probe at a time
+    assert breaker.allow() and not breaker.allow()
+    breaker.failure()
+    assert breaker.delay() == 20
+
+    clock.now = 30
+    breaker.allow()
+    breaker.failure()
+    clock.now = 60
+    breaker.allow()
+    breaker.failure()
+    assert breaker.delay() == 30
+
+    clock.now = 90
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED and breaker.trips == 0
+
+
+def test_jitter_keeps_half_of_backoff():
+    delays = [
+        CircuitBreaker(threshold=1, base_delay=10, clock=Clock(), rng=lambda r=r: r)
+        for r in (0.0, 0.5)
+    ]
+    for breaker in delays:
+        breaker.failure()
+    assert [b.delay() for b in delays] == [5, 7.5]
+
+
+@pytest.mark.asyncio
+async def test_open_breaker_makes_no_requests():
+    breakers = Breakers(threshold=1, base_delay=60)
+    requests = []
+
+    async def request():
+        requests.append(1)
+        raise aiohttp.ClientConnectionError()
+
+    with pytest.raises(aiohttp.ClientConnectionError):
+        await breakers["stage"].call(request)
+    with pytest.raises(CircuitOpen):
+        await breakers["stage"].call(request)
+    assert len(requests) == 1
+    assert breakers.states() == {"stage": OPEN}
+    assert breakers.delay() > 0
+
+
+class FinishedAppClient:
+    def __init__(self, state):
+        self.state = state
+        self.requests = []
+
+    async def get_node_metrics(self, node, **data):
+        self.requests.append(node)
+        if node == "yarn_app":
+            return {"app": {"id": data["application_id"], "state": self.state}}
+        url = URL(f"http://rm/proxy/{data['application_id']}/{node}")
+        request_info = aiohttp.RequestInfo(url, "GET", {}, url)
+        raise aiohttp.ClientResponseError(request_info, (), status=500)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.removed = []
+
+    async def srem(self, key, member):
+        self.removed.append((key, member))
+
+
+@pytest.mark.asyncio
+async def test_loader_survives_failures_and_retires_finished_app():
+    client = FinishedAppClient("FINISHED")
+    redis = FakeRedis()
+    loader = ApplicationLoader(
+        client,
+        "application_1_0001",
+        fetch_last_jobs=2,
+        timeout=0,
+        redis=redis,
+        breaker_params=dict(threshold=2, base_delay=0.01),
+    )
+    loader.prepared = loader.configuration_stored = True
+
+    await asyncio.wait_for(loader.loop_update_app_metrics(), 1)
+    assert client.requests == ["executors", "executors", "yarn_app"]
+    assert redis.removed == [(kvstore.loader_apps_key(), "application_1_0001")]
+
+
+@pytest.mark.asyncio
+async def test_running_app_is_polled_after_backoff():
+    client = FinishedAppClient("RUNNING")
+    loader = ApplicationLoader(
+        client,
+        "application_1_0001",
+        fetch_last_jobs=2,
+        timeout=0,
+        redis=FakeRedis(),
+        breaker_params=dict(threshold=1, base_delay=60),
+    )
+    loader.prepared = loader.configuration_stored = True
+
+    task = asyncio.ensure_future(loader.loop_update_app_metrics())
+    await asyncio.sleep(0.1)
+    assert not task.done()
+    assert client.requests == ["executors", "yarn_app"]
+    task.cancel()
@@ -0,0 +1,121 @@
+import asyncio
+
+import orjson
+import pytest
+
+from spark_logs import kvstore
+from spark_logs.loaders.application_loader import AppIdsLoader, ApplicationLoader
+from spark_logs.loaders.clusters import Cluster, load_clusters
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = dict()
+
+    async def set(self, key, value):
+        self.values[key] = value
+
+
+def test_cluster_app_ids_roundtrip():
+    app_id = "application_1600000000000_0001"
+    assert kvstore.cluster_app_id(None, app_id) == app_id
+    assert kvstore.cluster_app_id(kvstore.DEFAULT_CLUSTER, app_id) == app_id
+    assert kvstore.split_cluster_app_id(app_id) == (kvstore.DEFAULT_CLUSTER, app_id)
+
+    qualified = kvstore.cluster_app_id("east", app_id)
+    assert qualified == f"east~{app_id}"
+    assert kvstore.split_cluster_app_id(qualified) == ("east", app_id)
+    assert kvstore.applications_key(cluster="east") == "applications:east"
+    assert kvstore.applications_key(cluster=kvstore.DEFAULT_CLUSTER) == "applications"
+
+
+def test_clusters_have_own_clients_and_schedulers():
+    config = {
+        "clusters": {
+            "east": {"base_url": "http://rm-east:8088", "poll_requests_per_second": 5},
+            "west": {"base_url": "http://rm-west:8088", "fetch_concurrency": 2},
+        }
+    }
+    clusters = load_clusters(config)
+    assert set(clusters) == {"east", "west"}
+    east, west = clusters["east"], clusters["west"]
+    assert east.metrics_client.fetcher.config["base_url"] == "http://rm-east:8088"
+    assert west.metrics_client.fetcher.config["base_url"] == "http://rm-west:8088"
+    assert east.scheduler is not west.scheduler
+    assert east.scheduler.bucket.rate == 5
+    assert east.app_id("application_1_0001") == "east~application_1_0001"
+
+    loader = ApplicationLoader(
+        west.metrics_client, west.app_id("application_1_0001"), fetch_last_jobs=2
+    )
+    assert loader.yarn_app_id == "application_1_0001"
+
+    default = load_clusters({"base_url": "http://rm:8088"})
+    assert list(default) == [kvstore.DEFAULT_CLUSTER]
+    assert default[kvstore.DEFAULT_CLUSTER].app_id("application_1_0001") == "application_1_0001"
+
+
+def test_cluster_names_cannot_contain_dots():
+    with pytest.raises(ValueError):
+        Cluster("us.east", {"base_url": "http://rm:8088"})
+    with pytest.raises(ValueError):
+        Cluster("us~east", {"base_url": "http://rm:8088"})
+
+
+def test_clustered_app_is_one_node_of_graphite_paths():
+    changed = {"1": {"memoryUsed": b"5"}}
+    paths = []
+    for app_id in ("application_1_0001", kvstore.cluster_app_id("east", "application_1_0001")):
+        loader = ApplicationLoader(None, app_id, fetch_last_jobs=2)
+        (path,) = loader._executor_series(changed)
+        paths.append(path)
+    assert paths[1] == "executors.east~application_1_0001.1.memoryUsed"
+    assert len(paths[0].split(".")) == len(paths[1].split("."))
+
+
+@pytest.mark.asyncio
+async def test_app_ids_are_stored_per_cluster():
+    cluster = Cluster("east", {"base_url": "http://rm-east:8088"})
+    redis = FakeRedis()
+    loader = AppIdsLoader(redis, cluster.metrics_client, cluster=cluster.name)
+    apps = [
+        {"ID": "application_1_0001", "Name": "a", "StartTime": "1", "User": "u", "State": "RUNNING"},
+        {"ID": "application_1_0002", "Name": "b", "StartTime": "2", "User": "u", "State": "FINISHED"},
+    ]
+    await loader.set_for_apps(apps)
+    stored = orjson.loads(redis.values["applications:east"])
+    assert list(stored) == ["east~application_1_0001"]
+    assert stored["east~application_1_0001"]["Cluster"] == "east"
+    assert stored["east~application_1_0001"]["ID"] == "east~application_1_0001"
+
+
+class FakeDiscovery:
+    def __init__(self):
+        self.polls = 0
+
+    async def running_apps(self):
+        self.polls += 1
+        return []
+
+
+@pytest.mark.asyncio
+async def test_only_leader_discovers_apps():
+    leader = {"east": False}
+    discovery = FakeDiscovery()
+    loader = AppIdsLoader(
+        FakeRedis(),
+        None,
+        timeout=0.01,
+        discovery=discovery,
+        cluster="east",
+        is_leader=lambda: leader["east"],
+    )
+    task = asyncio.ensure_future(loader.loop_update_app_ids())
+    await asyncio.sleep(0.05)
+    assert discovery.polls == 0
+
+    leader["east"] = True
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert discovery.polls > 0
@@ -0,0 +1,68 @@
+import aiohttp
+import pytest
+from yarl import URL
+
+from spark_logs.loaders.discovery import YarnAppsDiscovery
+from spark_logs.loaders.parsers import YarnApps
+
+
+def yarn_app(app_id, state="RUNNING", started=1000):
+    return {
+        "id": app_id,
+        "user": "user",
+        "name": app_id,
+        "queue": "default",
+        "state": state,
+        "startedTime": started,
+    }
+
+
+class FakeMetricsClient:
+    def __init__(self, responses, cluster=None):
+        self.responses = responses
+        self.cluster = cluster
+        self.queries = []
+
+    async def get_node_metrics(self, node, **query):
+        if node == "applications":
+            return self.cluster
+        self.queries.append(query)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return YarnApps().execute({"apps": {"app": response} if response else None})
+
+
+@pytest.mark.asyncio
+async def test_polls_started_and_finished_apps_after_full_listing():
+    client = FakeMetricsClient(
+        [
+            [yarn_app("a"), yarn_app("b", state="ACCEPTED", started=500)],
+            [yarn_app("b", started=500), yarn_app("c")],
+            [yarn_app("a", state="FINISHED")],
+        ]
+    )
+    discovery = YarnAppsDiscovery(client, user="user", full_refresh_every=10)
+    assert [app["ID"] for app in await discovery.running_apps()] == ["a"]
+    assert client.queries[0]["states"].endswith("RUNNING")
+    assert client.queries[0]["user"] == "user"
+
+    assert [app["ID"] for app in await discovery.running_apps()] == ["b", "c"]
+    # Accepted app is looked up again from its start
+    assert client.queries[1]["startedTimeBegin"] == 500
+    assert client.queries[2]["states"] == "FINISHED,FAILED,KILLED"
+    assert discovery.requests == 2
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_cluster_page():
+    url = URL("http://rm/ws/v1/cluster/apps")
+    request_info = aiohttp.RequestInfo(url, "GET", {}, url)
+    not_found = aiohttp.ClientResponseError(request_info, (), status=404)
+    cluster = [{"ID": "a", "State": "RUNNING"}, {"ID": "b", "State": "FINISHED"}]
+    client = FakeMetricsClient([not_found], cluster=cluster)
+    discovery = YarnAppsDiscovery(client)
+    assert await discovery.running_apps() == cluster[:1]
+    assert discovery.backend == "html" and not discovery.rest_available
+    await discovery.running_apps()
+    assert len(client.queries) == 1
@@ -0,0 +1,132 @@
+import struct
+
+import orjson
+import pytest
+
+from spark_logs.loaders.event_log import EventLogReplay, read_app_id, read_events
+from spark_logs.types import JobStages
+
+
+def task_end(task_id, stage_id, executor_id, failed=False):
+    return {
+        "Event": "SparkListenerTaskEnd",
+        "Stage ID": stage_id,
+        "Stage Attempt ID": 0,
+        "Task Info": {
+            "Task ID": task_id,
+            "Index": task_id % 2,
+            "Attempt": 0,
+            "Launch Time": 1620000001000,
+            "Executor ID": executor_id,
+            "Host": "host.com",
+            "Locality": "PROCESS_LOCAL",
+            "Speculative": False,
+            "Finish Time": 1620000003000,
+            "Failed": failed,
+            "Killed": False,
+        },
+        "Task Metrics": {
+            "Executor Run Time": 2000,
+            "Executor CPU Time": 1500000000,
+            "JVM GC Time": 10,
+            "Shuffle Read Metrics": {"Remote Bytes Read": 100, "Local Bytes Read": 20},
+            "Shuffle Write Metrics": {"Shuffle Bytes Written": 50},
+        },
+    }
+
+
+def stage_info(stage_id):
+    return {
+        "Stage ID": stage_id,
+        "Stage Attempt ID": 0,
+        "Stage Name": f"stage {stage_id}",
+        "Number of Tasks": 2,
+    }
+
+
+EVENTS = [
+    {"Event": "SparkListenerLogStart", "Spark Version": "3.0.1"},
+    {
+        "Event": "SparkListenerBlockManagerAdded",
+        "Block Manager ID": {"Executor ID": "1", "Host": "host.com", "Port": 40001},
+        "Maximum Memory": 1024,
+    },
+    {
+        "Event": "SparkListenerEnvironmentUpdate",
+        "Spark Properties": {"spark.executor.cores": "4"},
+    },
+    {
+        "Event": "SparkListenerApplicationStart",
+        "App ID": "app-1",
+        "Timestamp": 1620000000000,
+        "User": "user",
+    },
+    {
+        "Event": "SparkListenerExecutorAdded",
+        "Timestamp": 1620000000500,
+        "Executor ID": "1",
+        "Executor Info": {"Host": "host.com", "Total Cores": 4},
+    },
+    {
+        "Event": "SparkListenerJobStart",
+        "Job ID": 0,
+        "Submission Time": 1620000001000,
+        "Stage Infos": [stage_info(0), stage_info(1)],
+        "Stage IDs": [0, 1],
+    },
+    {"Event": "SparkListenerStageSubmitted", "Stage Info": stage_info(0)},
+    task_end(0, 0, "1"),
+    task_end(1, 0, "1", failed=True),
+    {"Event": "SparkListenerBlockUpdated", "Block Updated Info": {}},
+    {"Event": "SparkListenerStageCompleted", "Stage Info": stage_info(0)},
+    {
+        "Event": "SparkListenerJobEnd",
+        "Job ID": 0,
+        "Completion Time": 1620000004000,
+        "Job Result": {"Result": "JobSucceeded"},
+    },
+]
+
+
+@pytest.fixture
+def event_log(tmp_path):
+    path = tmp_path / "app-1"
+    path.write_bytes(b"\n".join(orjson.dumps(event) for event in EVENTS) + b"\n")
+    return path
+
+
+def test_replay_rebuilds_jobs_and_executors(event_log):
+    replay = EventLogReplay()
+    for event in read_events(event_log):
+        replay.feed(event)
+    assert read_app_id(event_log) == "app-1"
+    assert replay.spark_properties == [("spark.executor.cores", "4")]
+
+    jobs = replay.take_completed_jobs()
+    job_stages = JobStages.from_json(jobs["0"].dump())
+    assert job_stages.job.status == "SUCCEEDED"
+    # Skipped stage 1 is not stored, as with the REST API
+    stage = job_stages.stages["0"]
+    assert (stage.stage.numCompleteTasks, stage.stage.numFailedTasks) == (1, 1)
+    assert stage.stage.shuffleReadBytes == 240
+    assert stage.tasks["0"].duration == 2000
+    assert stage.tasks["0"].taskMetrics["jvmGcTime"] == 10
+    assert not replay.stages and not replay.stage_jobs and not replay.jobs
+
+    (executor,) = replay.executor_metrics()
+    assert executor.hostPort == "host.com:40001"
+    assert (executor.totalCores, executor.totalGCTime) == (4, 20)
+
+
+def test_reads_lz4_block_stream(event_log, tmp_path):
+    lz4_block = pytest.importorskip("lz4.block")
+    data = event_log.read_bytes()
+    compressed_path = tmp_path / "app-1.lz4"
+    with open(compressed_path, "wb") as f:
+        for start in range(0, len(data), 500):
+            chunk = data[start : start + 500]
+            block = lz4_block.compress(chunk, store_size=False)
+            f.write(struct.pack("<8sBiii", b"LZ4Block", 0x20, len(block), len(chunk), 0))
+            f.write(block)
+        f.write(struct.pack("<8sBiii", b"LZ4Block", 0x10, 0, 0, 0))
+    assert list(read_events(compressed_path)) == list(read_events(event_log))
@@ -0,0 +1,81 @@
+import random
+
+from spark_logs.loaders.application_loader import JobSelector
+from spark_logs.loaders.job_index import JobIdRanges
+from spark_logs.types import Job
+
+
+def bitmap(job_ids):
+    """Bitmap as built by redis SETBIT"""
+    data = bytearray(max(job_ids) // 8 + 1)
+    for job_id in job_ids:
+        data[job_id // 8] |= 0x80 >> (job_id % 8)
+    return bytes(data)
+
+
+def test_ranges_merge_added_ids():
+    ranges = JobIdRanges()
+    for job_id in (5, 7, 6, 1, 3, 2, 3):
+        ranges.add(job_id)
+    assert ranges.ranges() == [(1, 4), (5, 8)]
+    assert 6 in ranges and 4 not in ranges and 0 not in ranges
+    assert len(ranges) == 6
+
+
+def test_ranges_from_bitmap():
+    job_ids = set(range(3, 1000)) | set(random.Random(1).sample(range(1000, 5000), 300))
+    ranges = JobIdRanges.from_bitmap(bitmap(job_ids))
+    assert ranges.ranges() == JobIdRanges(sorted(job_ids)).ranges()
+    assert ranges.ranges()[0] == (3, 1000)
+    assert JobIdRanges.from_bitmap(None).ranges() == []
+
+
+def job(job_id, completed=True, stage_ids=()):
+    return Job.create_from_dict(
+        dict(
+            jobId=job_id,
+            name="job",
+            submissionTime="2021-01-01T00:00:00.000GMT",
+            completionTime="2021-01-01T00:01:00.000GMT" if completed else None,
+            stageIds=list(stage_ids),
+            status="SUCCEEDED" if completed else "RUNNING",
+        )
+    )
+
+
+def test_selector_prefers_completed_jobs():
+    selector = JobSelector(2)
+    jobs = [job(1), job(2), job(3), job(4, completed=False), job(5)]
+    selected = selector.select(jobs, JobIdRanges([1]))
+    assert [j.jobId for j in selected] == ["5", "3"]
+    assert selector.remaining == 1
+
+    selected = selector.select(jobs, JobIdRanges([1, 2, 3, 5]))
+    assert [j.jobId for j in selected] == ["4"]
+    assert selector.remaining == 0
+
+
+def test_backfill_lane_walks_older_jobs():
+    selector = JobSelector(1, backfill_requests=2)
+    jobs = [job(i, stage_ids=[i]) for i in range(1, 6)]
+    # Jobs before the newest one are history to backfill
+    selected = selector.select(jobs, JobIdRanges([3]))
+    assert [j.jobId for j in selected] == ["5", "4", "2"]
+    assert selector.progress() == {"cursor": 5, "remaining": 1}
+    assert selector.next_cursor == 2
+
+    selector.cursor = selector.next_cursor
+    # A backlog of new jobs pauses the backfill lane
+    jobs += [job(6), job(7)]
+    selected = selector.select(jobs, JobIdRanges([2, 3, 4, 5]))
+    assert [j.jobId for j in selected] == ["7"]
+    assert selector.remaining == 1 and selector.next_cursor == 2
+
+
+def test_selector_skips_pending_jobs():
+    selector = JobSelector(2)
+    jobs = [job(1), job(2), job(3), job(4, completed=False)]
+    # Jobs of a round still waiting to be written are not fetched twice
+    selected = selector.select(jobs, JobIdRanges(), pending={3, 2})
+    assert [j.jobId for j in selected] == ["1", "4"]
+    assert selector.remaining == 0
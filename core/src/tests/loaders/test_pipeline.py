@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from spark_logs.loaders.application_loader import merge_series
+from spark_logs.loaders.pipeline import Stage, run_stages
+
+
+@pytest.mark.asyncio
+async def test_full_stage_holds_back_producer():
+    release = asyncio.Event()
+    handled = []
+
+    async def handle(item):
+        await release.wait()
+        handled.append(item)
+
+    stage = Stage("slow", handle, size=1)
+    produced = []
+
+    async def produce():
+        for item in range(4):
+            await stage.put(item)
+            produced.append(item)
+
+    task = asyncio.ensure_future(run_stages(produce(), [stage]))
+    await asyncio.sleep(0.01)
+    # One item is handled, one is queued and the producer waits with the third
+    assert produced == [0, 1]
+    release.set()
+    await asyncio.sleep(0.01)
+    assert handled == [0, 1, 2, 3]
+    await stage.join()
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_full_stage_merges_oldest_items_into_next():
+    stage = Stage("emit", None, size=2, merge=lambda older, newer: older + newer)
+    for item in range(5):
+        await stage.put([item])
+    assert stage.merged == 3
+    assert [stage.queue.get_nowait() for _ in range(2)] == [[3], [4]]
+    assert stage._carry == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_merged_items_are_handled_with_next_one():
+    release = asyncio.Event()
+    handled = []
+
+    async def handle(item):
+        await release.wait()
+        handled.append(item)
+
+    stage = Stage("emit", handle, size=1, merge=merge_series)
+
+    async def produce():
+        for timestamp, series in enumerate([{"a": 1, "b": 1}, {"a": 2}, {"c": 3}, {"b": 4}]):
+            await stage.put((series, timestamp))
+            await asyncio.sleep(0)
+        release.set()
+
+    await asyncio.wait_for(run_stages(produce(), [stage]), 1)
+    # The first batch is handled, the second and third ones are merged into the last
+    assert handled == [({"a": 1, "b": 1}, 0), ({"a": 2, "c": 3, "b": 4}, 3)]
+
+
+def test_closed_stage_removes_its_gauge():
+    labels = {"stage": "emit", "app_id": "application_1_0001"}
+    stage = Stage("emit", None, app_id="application_1_0001")
+    assert REGISTRY.get_sample_value("luxmeter_loader_queue_items", labels) == 0
+    stage.close()
+    assert REGISTRY.get_sample_value("luxmeter_loader_queue_items", labels) is None
+    stage.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_stage_stops_producer():
+    async def fail(item):
+        raise ValueError(item)
+
+    stage = Stage("persist", fail, size=1)
+
+    async def produce():
+        while True:
+            await stage.put(1)
+
+    with pytest.raises(ValueError):
+        await asyncio.wait_for(run_stages(produce(), [stage]), 1)
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+from spark_logs.loaders.scheduler import (
+    ApiHealth,
+    PollingScheduler,
+    PollResult,
+    TokenBucket,
+)
+
+
+def test_token_bucket_delay():
+    bucket = TokenBucket(rate=10, capacity=5)
+    assert bucket.delay(5) == 0
+    bucket.take(5)
+    assert bucket.delay(1) == pytest.approx(0.1, abs=0.01)
+    # Rounds costlier than the bucket wait only for a full bucket
+    assert bucket.delay(100) == pytest.approx(0.5, abs=0.01)
+
+
+def test_interval_follows_job_completion_rate():
+    scheduler = PollingScheduler(ApiHealth(), min_interval=1, max_interval=100)
+    for app_id in ("busy", "idle"):
+        scheduler.register(app_id)
+        scheduler.apps[app_id].reported = time.monotonic() - 10
+    scheduler.report("busy", PollResult(completed_jobs=5, requests=12))
+    scheduler.report("idle", PollResult(completed_jobs=0, requests=2))
+    assert scheduler.interval("busy") == pytest.approx(2, rel=0.01)
+    # Idle app backs off from the default interval
+    assert scheduler.interval("idle") == 2 * scheduler.default_interval
+
+    scheduler.report("idle", PollResult(completed_jobs=2, requests=7, backlog=True))
+    assert scheduler.interval("idle") == 1
+
+    scheduler.report("busy", PollResult(completed_jobs=0, requests=2, backfill=True))
+    assert scheduler.interval("busy") <= scheduler.backfill_interval
+
+
+def test_idle_apps_back_off_geometrically():
+    scheduler = PollingScheduler(ApiHealth(), max_interval=100, default_interval=10)
+    scheduler.register("idle")
+    intervals = []
+    for _ in range(5):
+        scheduler.report("idle", PollResult(completed_jobs=0, requests=1))
+        intervals.append(scheduler.interval("idle"))
+    assert intervals == [20, 40, 80, 100, 100]
+
+    scheduler.register("fixed", interval=30)
+    scheduler.report("fixed", PollResult(completed_jobs=0, requests=1))
+    assert scheduler.interval("fixed") == 30
+
+
+def test_intervals_stretch_when_api_is_slow():
+    health = ApiHealth()
+    scheduler = PollingScheduler(health, slow_latency=1.0)
+    scheduler.register("app")
+    health.observe(0.1)
+    assert scheduler.interval("app") == 10
+    health.observe(4.0, error=True)
+    health.observe(4.0, error=True)
+    assert scheduler.interval("app") > 30
+
+
+@pytest.mark.asyncio
+async def test_turns_are_granted_by_due_time():
+    scheduler = PollingScheduler(ApiHealth(), requests_per_second=100, burst=1)
+    order = []
+
+    async def poll(app_id, due):
+        scheduler.register(app_id)
+        scheduler.apps[app_id].due = due
+        await scheduler.wait_turn(app_id)
+        order.append(app_id)
+
+    # Bucket admits one round per 10 ms, the overdue app goes first
+    scheduler.bucket.take(1)
+    now = time.monotonic()
+    await asyncio.gather(poll("late", now), poll("overdue", now - 1), poll("later", now + 0.01))
+    assert order == ["overdue", "late", "later"]
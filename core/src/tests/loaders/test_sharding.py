@@ -0,0 +1,177 @@
+import pytest
+
+from spark_logs import kvstore
+from spark_logs.loaders import sharding
+from spark_logs.loaders.sharding import LoaderCoordinator, assign, rendezvous_owner
+from tests.fake_redis import FakeRedis
+
+
+APP_IDS = [f"application_1620000000000_{i:04d}" for i in range(300)]
+
+
+def test_assignment_is_balanced():
+    instances = ["a", "b", "c"]
+    assignment = assign(APP_IDS, instances)
+    counts = {i: list(assignment.values()).count(i) for i in instances}
+    assert set(assignment.values()) == set(instances)
+    assert min(counts.values()) > len(APP_IDS) / len(instances) * 0.7
+
+
+def test_assignment_does_not_depend_on_order():
+    assert assign(APP_IDS, ["a", "b", "c"]) == assign(APP_IDS, ["c", "a", "b"])
+
+
+def test_only_apps_of_changed_instance_move():
+    before = assign(APP_IDS, ["a", "b", "c"])
+
+    after_death = assign(APP_IDS, ["a", "b"])
+    moved = {app_id for app_id in APP_IDS if before[app_id] != after_death[app_id]}
+    assert moved == {app_id for app_id in APP_IDS if before[app_id] == "c"}
+
+    after_join = assign(APP_IDS, ["a", "b", "c", "d"])
+    moved = {app_id for app_id in APP_IDS if before[app_id] != after_join[app_id]}
+    assert moved and all(after_join[app_id] == "d" for app_id in moved)
+
+
+def test_no_instances():
+    assert rendezvous_owner("application_1", []) is None
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Heartbeats and lease expiry follow the same clock
+    monkeypatch.setattr(sharding, "time", clock)
+    return clock
+
+
+@pytest.fixture
+async def redis(clock):
+    redis = FakeRedis(clock=clock)
+    await redis.sadd(kvstore.loader_apps_key(), *APP_IDS[:20])
+    return redis
+
+
+def coordinator(redis, instance_id):
+    loading = set()
+
+    async def on_claim(app_id):
+        loading.add(app_id)
+
+    async def on_release(app_id):
+        loading.discard(app_id)
+
+    coordinator = LoaderCoordinator(
+        redis, on_claim=on_claim, on_release=on_release, instance_id=instance_id
+    )
+    coordinator.loading = loading
+    return coordinator
+
+
+@pytest.mark.asyncio
+async def test_instance_claims_leases_of_its_apps(redis):
+    a = coordinator(redis, "a")
+    await a.coordinate()
+    assert a.owned == a.loading == set(APP_IDS[:20])
+    assert set((await a.owners()).values()) == {"a"}
+    assert await redis.zrange(kvstore.loader_instances_key()) == [b"a"]
+
+
+@pytest.mark.asyncio
+async def test_leases_are_renewed_by_heartbeats(redis, clock):
+    a = coordinator(redis, "a")
+    await a.coordinate()
+    for _ in range(5):
+        clock.now += a.heartbeat_interval
+        await a.coordinate()
+    assert set((await a.owners()).values()) == {"a"}
+    assert a.loading == set(APP_IDS[:20])
+
+    # Without heartbeats the leases expire
+    clock.now += a.ttl
+    assert set((await a.owners()).values()) == {None}
+
+
+@pytest.mark.asyncio
+async def test_apps_are_handed_over_to_joining_instance(redis):
+    a, b = coordinator(redis, "a"), coordinator(redis, "b")
+    await a.coordinate()
+    await b.coordinate()
+    # Leases of "a" are not taken over
+    assert b.owned == set()
+
+    await a.coordinate()
+    await b.coordinate()
+    expected = assign(APP_IDS[:20], ["a", "b"])
+    assert await a.owners() == expected
+    assert a.loading == {x for x, owner in expected.items() if owner == "a"}
+    assert b.loading == {x for x, owner in expected.items() if owner == "b"}
+    assert a.loading and b.loading
+
+
+@pytest.mark.asyncio
+async def test_apps_of_dead_instance_move_after_lease_expiry(redis, clock):
+    a, b = coordinator(redis, "a"), coordinator(redis, "b")
+    for _ in range(2):
+        await a.coordinate()
+        await b.coordinate()
+    assert b.owned
+
+    # "b" stops heartbeating
+    clock.now += b.ttl
+    await a.coordinate()
+    assert await redis.zrange(kvstore.loader_instances_key()) == [b"a"]
+    assert a.owned == a.loading == set(APP_IDS[:20])
+
+
+@pytest.mark.asyncio
+async def test_lost_lease_stops_loading(redis):
+    a = coordinator(redis, "a")
+    await a.coordinate()
+    lost = APP_IDS[0]
+    await redis.set(kvstore.loader_lease_key(app_id=lost), "other")
+
+    await a.coordinate()
+    assert lost not in a.loading
+    # Claimed again once the other lease is gone
+    await redis.delete(kvstore.loader_lease_key(app_id=lost))
+    await a.coordinate()
+    assert lost in a.loading
+
+
+@pytest.mark.asyncio
+async def test_shutdown_hands_over_right_away(redis):
+    a, b = coordinator(redis, "a"), coordinator(redis, "b")
+    await a.coordinate()
+    await b.coordinate()
+    await a.shutdown()
+    assert a.loading == set()
+    assert set((await a.owners()).values()) == {None}
+
+    await b.coordinate()
+    assert b.owned == set(APP_IDS[:20])
+
+
+@pytest.mark.asyncio
+async def test_lowest_live_instance_leads(redis, clock):
+    a, b = coordinator(redis, "a"), coordinator(redis, "b")
+    assert not a.is_leader()
+    await b.heartbeat()
+    await a.heartbeat()
+    await b.heartbeat()
+    assert a.is_leader() and not b.is_leader()
+
+    clock.now += a.ttl
+    await b.heartbeat()
+    assert b.is_leader()
@@ -0,0 +1,40 @@
+from spark_logs.loaders.snapshots import ExecutorsSnapshot
+from spark_logs.types import Executor
+
+
+def executor(executor_id, **fields):
+    data = dict(
+        id=executor_id,
+        hostPort="host:1",
+        isActive=True,
+        memoryUsed=0,
+        diskUsed=0,
+        totalCores=4,
+        maxTasks=4,
+        maxMemory=1024,
+        totalShuffleRead=0,
+        totalShuffleWrite=0,
+    )
+    data.update(fields)
+    return Executor.create_from_dict(data)
+
+
+def test_executor_fields_roundtrip():
+    original = executor("1", totalGCTime=12)
+    fields = {k.encode(): v for k, v in original.dump_fields().items()}
+    assert Executor.create_from_fields(fields) == original
+    assert executor("2").totalGCTime == 0
+
+
+def test_diff_reports_changed_fields_only():
+    snapshot = ExecutorsSnapshot("app")
+    first = [executor("1"), executor("2")]
+    changed, removed = snapshot.diff(first)
+    assert set(changed) == {"1", "2"}
+    assert not removed
+    snapshot.executors = {x.id: x.dump_fields() for x in first}
+
+    changed, removed = snapshot.diff([executor("1", memoryUsed=10), executor("3")])
+    assert changed["1"] == {"memoryUsed": b"10"}
+    assert set(changed["3"]) == set(executor("3").dump_fields())
+    assert removed == {"2"}
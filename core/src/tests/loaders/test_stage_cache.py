@@ -0,0 +1,97 @@
+from spark_logs.loaders.stage_cache import StageCache
+from spark_logs.types import RawStageTasks
+
+STAGE_COUNTERS = (
+    "numTasks",
+    "numActiveTasks",
+    "numCompleteTasks",
+    "numFailedTasks",
+    "numKilledTasks",
+    "numCompletedIndices",
+    "executorRunTime",
+    "executorCpuTime",
+    "inputBytes",
+    "inputRecords",
+    "outputBytes",
+    "outputRecords",
+    "shuffleReadBytes",
+    "shuffleReadRecords",
+    "shuffleWriteBytes",
+    "shuffleWriteRecords",
+    "memoryBytesSpilled",
+    "diskBytesSpilled",
+)
+
+
+def stage(stage_id, status, attempt_id=0):
+    data = {counter: 1 for counter in STAGE_COUNTERS}
+    data.update(stageId=stage_id, attemptId=attempt_id, status=status, name="stage")
+    return RawStageTasks.from_spark(dict(data, tasks={}))
+
+
+def test_caches_final_stages_of_running_job():
+    cache = StageCache()
+    cache.put("1", [stage(10, "COMPLETE"), stage(11, "ACTIVE"), stage(12, "SKIPPED")])
+
+    assert cache.get(10).dump() == stage(10, "COMPLETE").dump()
+    assert cache.get("12").stage.status == "SKIPPED"
+    assert cache.get(11) is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    cache.evict_job("1")
+    assert cache.get(10) is None
+    assert not cache.stages and not cache.attempts
+    assert not cache.job_stages and not cache.stage_jobs and not cache.job_failures
+
+
+def test_evicts_least_recently_used_attempts():
+    cache = StageCache(max_stages=2)
+    cache.put("1", [stage(1, "COMPLETE"), stage(2, "COMPLETE")])
+    cache.get(1)
+    cache.put("2", [stage(3, "COMPLETE")])
+    assert set(cache.stages) == {("1", 0), ("3", 0)}
+    assert cache.get(2) is None
+
+
+def test_resubmitted_stages_are_fetched_again():
+    cache = StageCache()
+    cache.put("1", [stage(1, "COMPLETE"), stage(2, "COMPLETE")], failed_stages=0)
+    cache.check_job("1", 0)
+    assert cache.get(1).stage.attemptId == 0
+
+    # Stage 2 failed, Spark resubmits stage 1 as a new attempt
+    cache.check_job("1", 1)
+    assert cache.get(1) is None
+    cache.put("1", [stage(1, "COMPLETE", attempt_id=1), stage(2, "ACTIVE", attempt_id=1)], 1)
+    cache.check_job("1", 1)
+    assert cache.get(1).stage.attemptId == 1
+
+
+def test_new_attempt_replaces_cached_one():
+    cache = StageCache()
+    cache.put("1", [stage(1, "COMPLETE")])
+    cache.put("1", [stage(1, "COMPLETE", attempt_id=1)])
+    assert set(cache.stages) == {("1", 1)}
+    assert cache.get(1).stage.attemptId == 1
+
+
+def test_jobs_that_never_complete_are_forgotten():
+    cache = StageCache(max_stages=3)
+    for job_id in range(10):
+        cache.put(str(job_id), [stage(job_id, "COMPLETE")], failed_stages=1)
+    cache.put("10", [stage(10, "ACTIVE")])
+
+    assert len(cache.stages) == 3
+    assert set(cache.job_stages) == set(cache.job_failures) == {"7", "8", "9"}
+    assert set(cache.stage_jobs) == {"7", "8", "9"}
+
+
+def test_stage_listed_by_several_jobs():
+    cache = StageCache(max_stages=1)
+    cache.put("1", [stage(1, "COMPLETE")])
+    cache.put("2", [stage(1, "SKIPPED")])
+    assert cache.stage_jobs == {"1": {"1", "2"}}
+
+    cache.evict_job("1")
+    assert cache.get(1) is None
+    assert not cache.job_stages and not cache.stage_jobs and not cache.job_failures
@@ -0,0 +1,39 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from spark_logs import db
+from tests.fake_redis import FakeRedis
+
+
+def gaps(reader):
+    return REGISTRY.get_sample_value("luxmeter_stream_gaps_total", {"processor": reader}) or 0
+
+
+async def fill(redis, job_ids, max_len=None):
+    return [await redis.xadd("stream", {"job_id": x}, max_len=max_len) for x in job_ids]
+
+
+@pytest.mark.asyncio
+async def test_stream_is_read_after_watermark():
+    redis = FakeRedis()
+    entry_ids = await fill(redis, range(5))
+
+    entries = await db.read_stream_after(redis, "stream", None, 2, reader="test")
+    assert [x for x, _ in entries] == entry_ids[:2]
+    entries = await db.read_stream_after(redis, "stream", entry_ids[1], 2, reader="test")
+    assert [x for x, _ in entries] == entry_ids[2:4]
+    entries = await db.read_stream_after(redis, "stream", entry_ids[4].decode(), 2, reader="test")
+    assert entries == []
+    assert gaps("test") == 0
+
+
+@pytest.mark.asyncio
+async def test_trimmed_watermark_is_reported():
+    redis = FakeRedis()
+    entry_ids = await fill(redis, range(5), max_len=3)
+    before = gaps("slow")
+
+    # Entries 0 and 1 are trimmed, reading after 0 skips 1
+    entries = await db.read_stream_after(redis, "stream", entry_ids[0], 2, reader="slow")
+    assert [x for x, _ in entries] == entry_ids[2:4]
+    assert gaps("slow") == before + 1
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from spark_logs.instrumentation import (
+    InstrumentedRedis,
+    InstrumentedGraphite,
+    count_round_trips,
+    report_lag,
+)
+
+
+class FakeTransaction:
+    def __init__(self):
+        self.commands = []
+
+    def set(self, *args):
+        self.commands.append(("set", args))
+
+    async def execute(self):
+        return [True] * len(self.commands)
+
+
+class FakeRedis:
+    address = ("localhost", 6379)
+
+    async def get(self, key):
+        await asyncio.sleep(0)
+        return b"value"
+
+    def multi_exec(self):
+        return FakeTransaction()
+
+    def close(self):
+        return "closed"
+
+
+class FakeGraphite:
+    def __init__(self):
+        self.sent = []
+
+    def send_dict(self, data, timestamp=None):
+        self.sent.append(data)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.asyncio
+async def test_instrumented_redis_times_commands():
+    redis = InstrumentedRedis(FakeRedis())
+    before = sample("luxmeter_redis_seconds_count", command="get")
+
+    assert await redis.get("key") == b"value"
+    assert redis.address == ("localhost", 6379)
+    assert redis.close() == "closed"
+    assert sample("luxmeter_redis_seconds_count", command="get") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_instrumented_redis_times_transaction_once():
+    redis = InstrumentedRedis(FakeRedis())
+    before = sample("luxmeter_redis_seconds_count", command="multi_exec")
+
+    transaction = redis.multi_exec()
+    transaction.set("a", 1)
+    transaction.set("b", 2)
+    assert await transaction.execute() == [True, True]
+    assert sample("luxmeter_redis_seconds_count", command="multi_exec") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_count_round_trips_of_child_tasks():
+    redis = InstrumentedRedis(FakeRedis())
+    before = sample("luxmeter_redis_round_trips_count", processor="test_round")
+
+    with count_round_trips("test_round") as round_trips:
+        await asyncio.gather(redis.get("a"), redis.get("b"))
+        transaction = redis.multi_exec()
+        transaction.set("a", 1)
+        transaction.set("b", 2)
+        await transaction.execute()
+    await redis.get("c")
+
+    assert round_trips == [3]
+    assert sample("luxmeter_redis_round_trips_count", processor="test_round") == before + 1
+
+
+def test_instrumented_graphite_counts_datapoints():
+    graphite = FakeGraphite()
+    before = sample("luxmeter_graphite_datapoints_total")
+
+    InstrumentedGraphite(graphite).send_dict({"a": 1, "b": 2})
+    assert graphite.sent == [{"a": 1, "b": 2}]
+    assert sample("luxmeter_graphite_datapoints_total") == before + 2
+    assert sample("luxmeter_graphite_pending_datapoints") == 0
+
+
+def test_report_lag():
+    report_lag("test_processor", "app_1", {10.0, 11.0, 15.0}, {10, 11})
+    assert sample("luxmeter_processor_lag_jobs", processor="test_processor", app_id="app_1") == 4
+
+    report_lag("test_processor", "app_2", {3.0, 4.0}, set())
+    assert sample("luxmeter_processor_lag_jobs", processor="test_processor", app_id="app_2") == 2
+
+    # Backfilled jobs are stored after newer processed ones
+    report_lag("test_processor", "app_3", {3.0, 4.0}, {9})
+    assert sample("luxmeter_processor_lag_jobs", processor="test_processor", app_id="app_3") == 0
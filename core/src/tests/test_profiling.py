@@ -0,0 +1,51 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from spark_logs.profiling import StackSampler, LoopLagMonitor
+
+
+def busy_function(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampler_collects_thread_stacks():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_function, args=(stop,))
+    thread.start()
+    try:
+        sampler = StackSampler(thread.ident, interval=0.001)
+        sampler.run(0.1)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert sampler.samples
+    assert all("busy_function" in stack for stack in sampler.samples)
+    assert sampler.collapsed().splitlines()[0].startswith("_bootstrap")
+
+    profile = sampler.speedscope()
+    [sampled] = profile["profiles"]
+    names = [frame["name"] for frame in profile["shared"]["frames"]]
+    assert len(sampled["samples"]) == len(sampled["weights"]) == len(sampler.samples)
+    assert any(name.startswith("busy_function") for name in names)
+
+
+@pytest.mark.asyncio
+async def test_loop_monitor_reports_blocking_call(capsys):
+    monitor = LoopLagMonitor(threshold=0.05, interval=0.01)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.05)
+        time.sleep(0.3)
+        await asyncio.sleep(0.05)
+    finally:
+        monitor.stop()
+
+    output = capsys.readouterr().out
+    assert "Event loop blocked for" in output
+    assert "test_loop_monitor_reports_blocking_call" in output
+    assert "Event loop was blocked for" in output
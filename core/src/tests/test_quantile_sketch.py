@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from spark_logs.quantile_sketch import DDSketch
+
+
+@pytest.fixture
+def durations():
+    rnd = random.Random(42)
+    return [rnd.lognormvariate(3, 1.5) for _ in range(5000)]
+
+
+@pytest.mark.parametrize("q", [0.05, 0.5, 0.75, 0.95, 0.99])
+def test_quantile_relative_accuracy(durations, q):
+    sketch = DDSketch(relative_accuracy=0.01)
+    for d in durations:
+        sketch.add(d)
+
+    expected = sorted(durations)[int(q * (len(durations) - 1))]
+    assert abs(sketch.quantile(q) - expected) / expected <= 0.01
+
+
+def test_merge_and_restore(durations):
+    left, right, whole = DDSketch(), DDSketch(), DDSketch()
+    for idx, d in enumerate(durations + [0]):
+        (left if idx % 2 else right).add(d)
+        whole.add(d)
+    left.merge(right)
+
+    restored = DDSketch.from_fields(
+        {k.encode(): str(v).encode() for k, v in left.to_fields().items()}
+    )
+    assert restored.count == whole.count == len(durations) + 1
+    assert restored.quantiles([0, 0.5, 0.95]) == whole.quantiles([0, 0.5, 0.95])
+
+
+def test_empty_sketch():
+    assert DDSketch().quantile(0.5) is None
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from spark_logs.tracing import span, traced, RingBufferExporter, current_span
+from spark_logs import tracing
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = RingBufferExporter(maxlen=3)
+    monkeypatch.setattr(tracing, "EXPORTER", exporter)
+    return exporter
+
+
+def test_span_outside_of_trace_is_noop(exporter):
+    with span("redis", command="get") as s:
+        assert s is None
+        assert current_span() is None
+    assert not exporter.traces
+
+
+@pytest.mark.asyncio
+async def test_gather_children_share_trace(exporter):
+    @traced("fetch")
+    async def fetch(delay):
+        await asyncio.sleep(delay)
+        return current_span()
+
+    with span("round", root=True, app_id="app") as root:
+        spans = await asyncio.gather(fetch(0.01), fetch(0.02))
+
+    [trace] = exporter.traces
+    assert trace.root is root
+    assert {s.parent_id for s in spans} == {root.span_id}
+    assert {s.trace.trace_id for s in spans} == {trace.trace_id}
+
+    timeline = trace.timeline()
+    assert timeline["attributes"] == {"app_id": "app"}
+    assert [c["name"] for c in timeline["children"]] == ["fetch", "fetch"]
+
+    breakdown = {x["name"]: x for x in trace.breakdown()}
+    assert breakdown["fetch"]["count"] == 2
+    assert breakdown["round"]["self"] >= 0
+
+
+def test_error_status_and_ring_buffer(exporter):
+    for i in range(5):
+        with pytest.raises(ValueError):
+            with span("round", root=True, i=i):
+                with span("parse"):
+                    raise ValueError()
+
+    assert len(exporter.traces) == 3
+    trace = exporter.traces[-1]
+    assert [s.status for s in trace.spans] == ["ERROR", "ERROR"]
+    assert trace.spans[1].attributes == {"exception": "ValueError"}
+    assert trace.root.attributes["i"] == 4
+    assert len(exporter.slowest(2)) == 2
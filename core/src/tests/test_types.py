@@ -9,6 +9,8 @@ from spark_logs.types import (
     StageTasks,
     ApplicationMetrics,
     Executor,
+    RawStageTasks,
+    RawJobStages,
 )
 
 
@@ -158,3 +160,19 @@ def test_restore(data_from_redis):
     app_metrics = ApplicationMetrics.from_json(data_from_redis)
     assert all(isinstance(x, Executor) for x in app_metrics.executor_metrics)
     assert all(isinstance(x, JobStages) for x in app_metrics.jobs_stages.values())
+
+
+def test_raw_stages_dump_as_nodes(sample_job, sample_stage, sample_task):
+    job = Job.from_json(sample_job)
+    stage_data = dict(orjson.loads(sample_stage), status="COMPLETE")
+    stage_data["tasks"] = {"422945": orjson.loads(sample_task)}
+
+    raw = RawStageTasks.from_spark(stage_data)
+    tasks = {k: Task.create_from_dict(v) for k, v in stage_data.pop("tasks").items()}
+    stage_tasks = StageTasks(stage=Stage.create_from_dict(stage_data), tasks=tasks)
+    assert raw.dump() == stage_tasks.dump()
+    assert RawStageTasks.from_json(raw.dump()).tasks == raw.tasks
+
+    job_stages = JobStages(job=job, stages={"9569": stage_tasks})
+    assert RawJobStages(job, {"9569": raw}).dump() == job_stages.dump()
+    assert JobStages.from_json(job_stages.dump()) == job_stages
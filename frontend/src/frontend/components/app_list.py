@@ -59,7 +59,11 @@ class TaskList(Component):
                 return [], "", False
             apps = dict()
             try:
-                apps = orjson.loads(kvstore.client.get(kv_keys.applications_key()))
+                clusters = {c.decode() for c in kvstore.client.smembers(kv_keys.clusters_key())}
+                for cluster in clusters | {kv_keys.DEFAULT_CLUSTER}:
+                    cluster_apps = kvstore.client.get(kv_keys.applications_key(cluster=cluster))
+                    if cluster_apps:
+                        apps.update(orjson.loads(cluster_apps))
             except Exception as exc:
                 # Alert
                 alert_mode = True
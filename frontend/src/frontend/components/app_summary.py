@@ -4,16 +4,16 @@ import dash_bootstrap_components as dbc
 import dash_html_components as html
 from dash.dependencies import Input, Output
 from dash.exceptions import PreventUpdate
-from datetime import datetime
+from datetime import timedelta
 import dash_core_components as dcc
-import numpy as np
+import orjson
 from plotly.graph_objs import Figure
 
 from frontend import kvstore, graphitestore
 from dateutil import tz
 from spark_logs import kvstore as kvinfo
 from frontend.components.abc import Component
-from spark_logs.types import ApplicationMetrics, JobStages
+from spark_logs.quantile_sketch import DDSketch
 
 metric_mapping = ()
 
@@ -52,25 +52,28 @@ class AppSummary(Component):
         results = {k: next((x for x in reversed(vs) if x is not None), None) for k, vs in results}
         return results
 
-    def render_app_info(self, app_id, environ, seq_job_data):
+    def render_app_info(self, app_id, environ, duration_sketch: DDSketch):
         if environ is None:
             raise PreventUpdate
 
-        app_data = kvstore.client.get(app_id)
-        if not app_data:
+        executor_ids = kvstore.client.smembers(kvinfo.executors_key(app_id=app_id))
+        if not executor_ids:
             raise PreventUpdate
-        app_info = ApplicationMetrics.from_json(kvstore.client.get(app_id))
-        active_executors_count = len([e for e in app_info.executor_metrics if e.isActive])
-
-        containers = f"{active_executors_count} / {len(app_info.executor_metrics)}"
-        jobs_running = f"{len([x for x in app_info.jobs_stages.values() if x.job.status == 'RUNNING'])}"
+        pipeline = kvstore.client.pipeline()
+        for executor_id in executor_ids:
+            pipeline.hget(
+                kvinfo.executor_key(app_id=app_id, executor_id=executor_id.decode()), "isActive"
+            )
+        active_executors_count = len([x for x in pipeline.execute() if x and orjson.loads(x)])
 
-        job_start_times = np.array([x.job.submissionTime for x in seq_job_data])
-        job_endtimes = np.array([x.job.completionTime for x in seq_job_data])
-        job_durations = job_endtimes - job_start_times
+        containers = f"{active_executors_count} / {len(executor_ids)}"
+        jobs_running = f"{kvstore.client.hlen(kvinfo.running_jobs_key(app_id=app_id))}"
 
         levels = (5, 75, 95)
-        perc_values = [np.percentile(job_durations, level) for level in levels]
+        perc_values = [
+            "-" if v is None else str(timedelta(seconds=round(v)))
+            for v in duration_sketch.quantiles([level / 100 for level in levels])
+        ]
         perc_table = html.Table(
             [
                 html.Tr(
@@ -82,10 +85,11 @@ class AppSummary(Component):
             ]
         )
 
+        curve_levels = list(range(0, 101))
         fig = Figure(
             data={
-                "x": list(range(len(job_durations))),
-                "y": [x.seconds for x in sorted(job_durations)],
+                "x": curve_levels,
+                "y": duration_sketch.quantiles([level / 100 for level in curve_levels]),
             }
         )
         perc_graph = dcc.Graph(figure=fig)
@@ -96,7 +100,6 @@ class AppSummary(Component):
         wide_style = common_style.copy()
         wide_style["width"] = "500px"
 
-        job_id = seq_job_data[-1].job.jobId
         scores = graphitestore.client.load(
             [f"aliasByNode(hybrid_metrics.app.{app_id}.job_group.*.test.skewness_score, 4)"],
             since="now-1h",
@@ -144,9 +147,8 @@ class AppSummary(Component):
                 raise PreventUpdate
             if not selected_app_info:
                 raise PreventUpdate
-            app_id: Optional[ApplicationMetrics] = selected_app_info["app_id"]
-            seq_job_data_raw = kvstore.client.zrevrangebyscore(
-                kvinfo.sequential_jobs_key(app_id=app_id), min=0, max=500000, num=30, start=0
+            app_id: Optional[str] = selected_app_info["app_id"]
+            duration_sketch = DDSketch.from_fields(
+                kvstore.client.hgetall(kvinfo.job_durations_key(app_id=app_id))
             )
-            seq_job_data = [JobStages.from_json(x) for x in seq_job_data_raw]
-            return self.render_app_info(app_id, selected_app_info.get("environment"), seq_job_data)
+            return self.render_app_info(app_id, selected_app_info.get("environment"), duration_sketch)